@@ -0,0 +1 @@
+default_app_config = 'apiv1.apps.Apiv1Config'
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class Apiv1Config(AppConfig):
     name = 'apiv1'
+
+    def ready(self):
+        from . import signals
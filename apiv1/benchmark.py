@@ -0,0 +1,177 @@
+"""
+A small locust-style load generator for the API.
+
+Every simulated student logs in through `/api-token-auth/` and then walks
+the screens a student opens during registration week, as fast as the
+server answers (plus an optional think time).
+"""
+import http.client
+import json
+import random
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+from users.models import *
+
+TOKEN_ROUTE = 'api-token-auth/'
+
+SCENARIO = (
+    'carrier/mini_profile/',
+    'carrier/records_summary/',
+    'carrier/terms/',
+    'carrier/terms/<term_id>/',
+    'carrier/terms/gradessummary/<term_id>/',
+    'carrier/terms/preregistration/<term_id>/',
+    'courses/<course_id>/',
+    'courses_schedule/<term_id>/<department_id>/',
+    'terms/',
+    'departments/',
+)
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not samples:
+        return None
+    index = max(0, int(round(p / 100.0 * len(samples) + 0.5)) - 1)
+    return samples[min(index, len(samples) - 1)]
+
+
+def students(count, seed=0):
+    """Usernames and route arguments of `count` carriers that attend at least one course."""
+    attends = Attend.objects.order_by('carrier', '-course__term__start_date').values_list(
+        'carrier__login_profile__user__username', 'course', 'course__term',
+        'carrier__subfield__field__head_department')
+    chosen = {}
+    for username, course_id, term_id, department_id in attends.iterator():
+        if username not in chosen:
+            chosen[username] = {'term_id': term_id, 'course_id': course_id, 'department_id': department_id}
+    usernames = sorted(chosen)
+    random.Random(seed).shuffle(usernames)
+    return [(x, chosen[x]) for x in usernames[:count]]
+
+
+class Student(threading.Thread):
+
+    def __init__(self, base_url, host, username, password, kwargs, deadline, think_time, results):
+        super(Student, self).__init__(daemon=True)
+        self.url = urlsplit(base_url)
+        self.host = host or self.url.netloc
+        self.prefix = self.url.path.rstrip('/') + '/'
+        self.username = username
+        self.password = password
+        self.kwargs = kwargs
+        self.deadline = deadline
+        self.think_time = think_time
+        self.results = results
+        self.connection = None
+        self.token = None
+
+    def request(self, method, route, path, body=None):
+        headers = {'Host': self.host}
+        if self.token:
+            headers['Authorization'] = 'Token ' + self.token
+        if body is not None:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.url.hostname, self.url.port or 80, timeout=60)
+            self.connection.request(method, self.prefix + path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            payload = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.connection = None
+            payload, status = b'', 0
+        self.results.record(route, time.perf_counter() - started, 200 <= status < 300)
+        return status, payload
+
+    def run(self):
+        status, payload = self.request('POST', TOKEN_ROUTE, TOKEN_ROUTE,
+                                       urlencode({'username': self.username, 'password': self.password}))
+        if status != 200:
+            return
+        self.token = json.loads(payload.decode())['token']
+        while time.time() < self.deadline:
+            for route in SCENARIO:
+                path = 'api/v1/' + route
+                for name, value in self.kwargs.items():
+                    path = path.replace('<%s>' % name, str(value))
+                self.request('GET', route, path)
+                if self.think_time:
+                    time.sleep(self.think_time)
+                if time.time() >= self.deadline:
+                    break
+
+
+class Results(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, route, seconds, ok):
+        with self.lock:
+            if ok:
+                self.samples.setdefault(route, []).append(seconds)
+            else:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, elapsed):
+        report = {}
+        for route in sorted(set(self.samples) | set(self.errors)):
+            samples = sorted(self.samples.get(route, []))
+            report[route] = {
+                'requests': len(samples),
+                'errors': self.errors.get(route, 0),
+                'rps': round(len(samples) / elapsed, 2),
+                'p50_ms': _ms(percentile(samples, 50)),
+                'p95_ms': _ms(percentile(samples, 95)),
+                'p99_ms': _ms(percentile(samples, 99)),
+            }
+        return report
+
+
+def _ms(seconds):
+    if seconds is None:
+        return None
+    return round(seconds * 1000, 2)
+
+
+def run(base_url, users, duration, password, host=None, think_time=0.0, seed=0):
+    """Drive `users` concurrent students for `duration` seconds and return the per-route report."""
+    population = students(users, seed)
+    if not population:
+        raise ValueError('No carrier with attends found, run `manage.py seed_university` first.')
+    results = Results()
+    started = time.time()
+    threads = [Student(base_url, host, username, password, kwargs, started + duration, think_time, results)
+               for username, kwargs in population]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    return {
+        'base_url': base_url,
+        'users': len(threads),
+        'duration': round(elapsed, 2),
+        'routes': results.report(elapsed),
+    }
+
+
+def compare(report, baseline):
+    """Relative change of every route's figures against a previous report, in percent."""
+    changes = {}
+    for route, figures in report['routes'].items():
+        before = baseline['routes'].get(route)
+        if not before:
+            continue
+        changes[route] = {}
+        for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            if figures[key] is not None and before[key]:
+                changes[route][key] = round((figures[key] - before[key]) * 100.0 / before[key], 1)
+    return changes
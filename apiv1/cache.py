@@ -0,0 +1,122 @@
+"""
+Response cache for the read-mostly catalogue endpoints.
+
+Every cached response depends on a few tags (e.g. "department"). Each tag
+has a version in the cache, the timestamp of its last change; the versions
+are part of the response keys, so bumping a tag from a model signal makes
+every response that depends on it unreachable at once. The same timestamps
+provide the Last-Modified header, and a hash of the payload the ETag.
+
+The versions only reach the other processes through a shared cache; with
+locmem they expire after `API_RESPONSE_TAG_TIMEOUT` instead, which starts
+them over from the current time.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+from users.models import Carrier
+
+VERSION_KEY = 'apiv1:tag:%s'
+SNAPSHOT_KEY = 'apiv1:carrier:%s:%s'
+SNAPSHOTS = ('mini_profile', 'records_summary')
+
+
+def get_cache():
+    return caches[settings.API_RESPONSE_CACHE]
+
+
+def tag_versions(tags):
+    cache = get_cache()
+    keys = {VERSION_KEY % tag: tag for tag in tags}
+    versions = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+    missing = {VERSION_KEY % tag: time.time() for tag in tags if tag not in versions}
+    if missing:
+        cache.set_many(missing, settings.API_RESPONSE_TAG_TIMEOUT)
+        versions.update({keys[key]: value for key, value in missing.items()})
+    return versions
+
+
+def _bump(tags):
+    get_cache().set_many({VERSION_KEY % tag: time.time() for tag in tags}, settings.API_RESPONSE_TAG_TIMEOUT)
+
+
+def invalidate(*tags):
+    """
+    Bump the versions of the given tags now, and once more when the current
+    transaction commits: a request served in between still reads the old
+    rows, and would otherwise cache them under the new versions.
+    """
+    _bump(tags)
+    transaction.on_commit(lambda: _bump(tags))
+
+
+class CachedResponseMixin(object):
+    """
+    Cache the data of a `ListAPIView`. Subclasses name the `cache_tags` their
+    response depends on and can add more key parts with `cache_key_parts()`.
+    """
+    cache_tags = ()
+
+    def cache_key_parts(self):
+        return []
+
+    def cache_key(self, versions):
+        # absolute, as the pagination links built from it are
+        parts = [self.request.build_absolute_uri()]
+        parts += [str(x) for x in self.cache_key_parts()]
+        parts += ['%s=%r' % (tag, versions[tag]) for tag in sorted(versions)]
+        return 'apiv1:response:' + hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+    def list(self, request, *args, **kwargs):
+        cache = get_cache()
+        versions = tag_versions(self.cache_tags)
+        key = self.cache_key(versions)
+        cached = cache.get(key)
+        if cached is None:
+            data = super(CachedResponseMixin, self).list(request, *args, **kwargs).data
+            content = json.dumps(data, sort_keys=True, default=str).encode()
+            cached = {'data': data, 'etag': '"%s"' % hashlib.md5(content).hexdigest()}
+            cache.set(key, cached, settings.API_RESPONSE_CACHE_TIMEOUT)
+
+        last_modified = int(max(versions.values()))
+        response = Response(cached['data'])
+        response['ETag'] = cached['etag']
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, max_age=0)
+        return get_conditional_response(request, etag=cached['etag'], last_modified=last_modified,
+                                        response=response)
+
+
+def carrier_snapshot(request, name, compute):
+    """
+    The cached `name` payload of the requesting carrier, keyed on the user so
+    that a warm hit needs no query at all. The invalidations only reach the
+    other processes through a shared cache; with locmem the snapshots expire
+    after `LOCAL_CACHE_TIMEOUT` instead.
+    """
+    cache = get_cache()
+    key = SNAPSHOT_KEY % (request.user.pk, name)
+    data = cache.get(key)
+    if data is None:
+        data = compute()
+        cache.set(key, data, settings.CARRIER_SNAPSHOT_TIMEOUT)
+    return data
+
+
+def invalidate_carrier_snapshots(carrier_ids):
+    """
+    Drop the snapshots of the given carriers now, and once more when the
+    current transaction commits so a request racing it cannot keep stale data.
+    """
+    user_ids = list(Carrier.objects.filter(pk__in=carrier_ids).values_list('login_profile__user', flat=True))
+    keys = [SNAPSHOT_KEY % (user_id, name) for user_id in user_ids for name in SNAPSHOTS]
+    if keys:
+        get_cache().delete_many(keys)
+        transaction.on_commit(lambda: get_cache().delete_many(keys))
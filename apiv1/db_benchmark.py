@@ -0,0 +1,114 @@
+"""
+Concurrent read/write load against the configured database.
+
+Every thread plays requests the way Django serves them: connections are
+checked with `close_old_connections()` before and after each request, so
+`CONN_MAX_AGE` and pooling weigh in as they do behind a server. Readers
+load term summaries; writers enter grades, which goes through the same
+signals as grade entry in the admin (final grade, statistics and ranking
+caches, rollup states).
+"""
+import random
+import threading
+import time
+
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from users.aggregates import term_summary
+from users.models import *
+from .benchmark import _ms, percentile
+
+SAMPLE_SIZE = 500
+
+
+class Results(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {'read': [], 'write': []}
+        self.errors = {}
+
+    def record(self, kind, seconds, error=None):
+        with self.lock:
+            if error is None:
+                self.samples[kind].append(seconds)
+            else:
+                key = '%s: %s' % (kind, error)
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def report(self, elapsed):
+        report = {}
+        for kind, samples in self.samples.items():
+            samples = sorted(samples)
+            report[kind] = {
+                'operations': len(samples),
+                'ops': round(len(samples) / elapsed, 2),
+                'p50_ms': _ms(percentile(samples, 50)),
+                'p95_ms': _ms(percentile(samples, 95)),
+                'p99_ms': _ms(percentile(samples, 99)),
+            }
+        return report
+
+
+def _read(rnd, carriers, terms):
+    term_summary(rnd.choice(carriers), rnd.choice(terms))
+
+
+def _write(rnd, grade_ids):
+    with transaction.atomic():
+        grade = Grade.objects.select_for_update().get(pk=rnd.choice(grade_ids))
+        grade.value = round(rnd.uniform(0, grade.base_value), 2)
+        grade.save()
+
+
+def run(threads, duration, write_ratio, seed=0):
+    """Run `threads` concurrent clients for `duration` seconds; returns the per-operation report."""
+    rnd = random.Random(seed)
+    carriers = list(Carrier.objects.filter(pk__in=Attend.objects.values('carrier')).order_by('pk')[:SAMPLE_SIZE])
+    terms = list(Term.objects.values_list('pk', flat=True))
+    grade_ids = list(Grade.objects.filter(
+        attend__course__grades_status_num=CourseGradesStatus.APPROVED).values_list('pk', flat=True)[:SAMPLE_SIZE])
+    if not carriers or not grade_ids:
+        raise ValueError('No graded attends found, run `manage.py seed_university` first.')
+    close_old_connections()
+    connection.close()
+
+    results = Results()
+    deadline = time.time() + duration
+
+    def client(seed):
+        rnd = random.Random(seed)
+        while time.time() < deadline:
+            kind = 'write' if rnd.random() < write_ratio else 'read'
+            started = time.perf_counter()
+            # request_started and request_finished close expired connections
+            close_old_connections()
+            try:
+                if kind == 'write':
+                    _write(rnd, grade_ids)
+                else:
+                    _read(rnd, carriers, terms)
+            except DatabaseError as e:
+                results.record(kind, time.perf_counter() - started, str(e))
+            else:
+                results.record(kind, time.perf_counter() - started)
+            finally:
+                close_old_connections()
+        connection.close()
+
+    started = time.time()
+    workers = [threading.Thread(target=client, args=(rnd.random(),), daemon=True) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - started
+    settings_dict = connection.settings_dict
+    return {
+        'vendor': connection.vendor,
+        'conn_max_age': settings_dict['CONN_MAX_AGE'],
+        'threads': threads,
+        'write_ratio': write_ratio,
+        'duration': round(elapsed, 2),
+        'operations': results.report(elapsed),
+        'errors': results.errors,
+    }
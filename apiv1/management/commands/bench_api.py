@@ -0,0 +1,52 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apiv1 import benchmark
+from users.synthetic import PASSWORD
+
+
+class Command(BaseCommand):
+    help = ('Load test a running server (e.g. `gunicorn uni.wsgi -w 4`) with concurrent students '
+            'and report latency percentiles and throughput per route.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000/')
+        parser.add_argument('--host', help='Host header to send, defaults to the first ALLOWED_HOSTS entry.')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run.')
+        parser.add_argument('--think-time', type=float, default=0.0, help='Seconds between two requests.')
+        parser.add_argument('--password', default=PASSWORD)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Save the report as JSON to this file.')
+        parser.add_argument('--baseline', help='A previously saved report to compare against.')
+
+    def handle(self, *args, **options):
+        host = options['host'] or (settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else None)
+        try:
+            report = benchmark.run(options['base_url'], options['users'], options['duration'],
+                                   options['password'], host=host, think_time=options['think_time'],
+                                   seed=options['seed'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        changes = {}
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                changes = benchmark.compare(report, json.load(f))
+
+        self.stdout.write('%d users for %ss against %s' % (report['users'], report['duration'], report['base_url']))
+        self.stdout.write('%-45s %8s %7s %9s %9s %9s %9s' % (
+            'route', 'requests', 'errors', 'rps', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for route, figures in report['routes'].items():
+            self.stdout.write('%-45s %8d %7d %9s %9s %9s %9s' % (
+                route, figures['requests'], figures['errors'], figures['rps'],
+                figures['p50_ms'], figures['p95_ms'], figures['p99_ms']))
+            if route in changes:
+                self.stdout.write('%-45s %s' % ('', ', '.join(
+                    '%s %+.1f%%' % (key, value) for key, value in sorted(changes[route].items()))))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write('Saved report to %s' % options['output'])
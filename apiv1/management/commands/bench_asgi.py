@@ -0,0 +1,89 @@
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apiv1 import benchmark
+from users.synthetic import PASSWORD
+
+# both servers are run from the scripts installed next to this interpreter
+SERVERS = (
+    ('wsgi', '{bin}/gunicorn uni.wsgi -b 127.0.0.1:{port} -w {workers} --threads {threads}'),
+    ('asgi', '{bin}/uvicorn uni.asgi:application --host 127.0.0.1 --port {port} --workers {workers} '
+             '--no-access-log'),
+)
+
+
+def wait_for_port(port, process, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            return False
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+class Command(BaseCommand):
+    help = ('Start the project under gunicorn (uni.wsgi) and under uvicorn (uni.asgi) in turn, '
+            'run the same load test against both and compare throughput and latency per route.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--workers', type=int, default=1, help='Processes of either server.')
+        parser.add_argument('--threads', type=int, default=settings.ASGI_THREADS,
+                            help='Threads of a gunicorn worker, the same as ASGI_THREADS by default.')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run against each server.')
+        parser.add_argument('--think-time', type=float, default=0.5, help='Seconds between two requests.')
+        parser.add_argument('--password', default=PASSWORD)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        for module in ('gunicorn', 'uvicorn'):
+            try:
+                __import__(module)
+            except ImportError:
+                raise CommandError('%s is not installed, `pip install %s` first.' % (module, module))
+        host = settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else None
+        base_url = 'http://127.0.0.1:%d/' % options['port']
+
+        reports = {}
+        for name, command in SERVERS:
+            command = command.format(bin=os.path.dirname(sys.executable), port=options['port'],
+                                     workers=options['workers'], threads=options['threads'])
+            self.stdout.write('Starting %s' % command)
+            process = subprocess.Popen(shlex.split(command), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                if not wait_for_port(options['port'], process, 30):
+                    raise CommandError('%s did not start listening on port %d.' % (name, options['port']))
+                reports[name] = benchmark.run(base_url, options['users'], options['duration'], options['password'],
+                                              host=host, think_time=options['think_time'], seed=options['seed'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            finally:
+                process.terminate()
+                process.wait()
+
+        changes = benchmark.compare(reports['asgi'], reports['wsgi'])
+        self.stdout.write('%d users for %ss against each server, asgi relative to wsgi' % (
+            reports['wsgi']['users'], options['duration']))
+        self.stdout.write('%-45s %6s %8s %7s %9s %9s %9s %9s' % (
+            'route', 'server', 'requests', 'errors', 'rps', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for route in sorted(set(reports['wsgi']['routes']) | set(reports['asgi']['routes'])):
+            for name, _ in SERVERS:
+                figures = reports[name]['routes'].get(route)
+                if figures:
+                    self.stdout.write('%-45s %6s %8d %7d %9s %9s %9s %9s' % (
+                        route, name, figures['requests'], figures['errors'], figures['rps'],
+                        figures['p50_ms'], figures['p95_ms'], figures['p99_ms']))
+            if changes.get(route):
+                self.stdout.write('%-45s %s' % ('', ', '.join(
+                    '%s %+.1f%%' % (key, value) for key, value in sorted(changes[route].items()))))
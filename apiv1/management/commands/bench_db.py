@@ -0,0 +1,82 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apiv1 import db_benchmark
+
+# environment of each named database configuration, on top of the current one
+CONFIGURATIONS = {
+    # SQLite as configured before UNI_DB_ENGINE existed
+    'sqlite-rollback': {'UNI_DB_ENGINE': 'sqlite', 'UNI_SQLITE_JOURNAL_MODE': 'delete',
+                        'UNI_SQLITE_BUSY_TIMEOUT': '5', 'UNI_SQLITE_TRANSACTION_MODE': 'DEFERRED',
+                        'UNI_DB_CONN_MAX_AGE': '0'},
+    'sqlite-wal': {'UNI_DB_ENGINE': 'sqlite', 'UNI_SQLITE_JOURNAL_MODE': 'wal',
+                   'UNI_SQLITE_BUSY_TIMEOUT': '20', 'UNI_SQLITE_TRANSACTION_MODE': 'IMMEDIATE',
+                   'UNI_DB_CONN_MAX_AGE': '60'},
+    'postgres': {'UNI_DB_ENGINE': 'postgres', 'UNI_DB_POOLING': 'persistent', 'UNI_DB_CONN_MAX_AGE': '0'},
+    'postgres-persistent': {'UNI_DB_ENGINE': 'postgres', 'UNI_DB_POOLING': 'persistent',
+                            'UNI_DB_CONN_MAX_AGE': '60'},
+    'postgres-pgbouncer': {'UNI_DB_ENGINE': 'postgres', 'UNI_DB_POOLING': 'pgbouncer',
+                           'UNI_DB_CONN_MAX_AGE': '60'},
+}
+
+
+class Command(BaseCommand):
+    help = ('Run concurrent term summary reads and grade writes against the database and report '
+            'throughput, latency and errors such as "database is locked", for the current settings '
+            'or for each --configuration in turn.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--configuration', action='append', dest='configurations',
+                            choices=sorted(CONFIGURATIONS),
+                            help='Benchmark this configuration in a separate process (repeatable).')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--duration', type=float, default=20.0, help='Seconds to run each configuration.')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Share of the operations that write.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Save the report(s) as JSON to this file.')
+
+    def handle(self, *args, **options):
+        if options['configurations']:
+            reports = {name: self.run_configuration(name, options) for name in options['configurations']}
+        else:
+            try:
+                reports = {'current': db_benchmark.run(options['threads'], options['duration'],
+                                                       options['write_ratio'], options['seed'])}
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        self.stdout.write('%d threads for %ss each, %d%% writes' % (
+            options['threads'], options['duration'], options['write_ratio'] * 100))
+        self.stdout.write('%-20s %-6s %10s %9s %9s %9s %9s' % (
+            'configuration', 'op', 'operations', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+        for name, report in reports.items():
+            for kind, figures in sorted(report['operations'].items()):
+                self.stdout.write('%-20s %-6s %10d %9s %9s %9s %9s' % (
+                    name, kind, figures['operations'], figures['ops'],
+                    figures['p50_ms'], figures['p95_ms'], figures['p99_ms']))
+            for error, count in sorted(report['errors'].items()):
+                self.stdout.write('%-20s %d x %s' % ('', count, error))
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(reports, f, indent=2, sort_keys=True)
+            self.stdout.write('Saved report to %s' % options['output'])
+
+    def run_configuration(self, name, options):
+        env = dict(os.environ, **CONFIGURATIONS[name])
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            command = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'bench_db',
+                       '--threads', str(options['threads']), '--duration', str(options['duration']),
+                       '--write-ratio', str(options['write_ratio']), '--seed', str(options['seed']),
+                       '--output', output.name]
+            self.stdout.write('Running %s' % name)
+            finished = subprocess.run(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            if finished.returncode:
+                raise CommandError('%s failed:\n%s' % (name, finished.stderr.decode(errors='replace')))
+            with open(output.name) as f:
+                return json.load(f)['current']
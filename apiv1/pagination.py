@@ -0,0 +1,55 @@
+"""
+Keyset pagination for the long list endpoints, and a full export of the same
+lists that is streamed in primary key ordered chunks, so neither the database
+nor the server ever holds more than one chunk of the list at a time.
+
+Pagination is opt-in: without `?page_size=` or `?cursor=` the endpoints still
+answer the bare list existing clients expect.
+"""
+from django.http import StreamingHttpResponse
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class PrimaryKeyCursorPagination(CursorPagination):
+    ordering = 'pk'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_size_query_param not in request.query_params and \
+                self.cursor_query_param not in request.query_params:
+            return None
+        return super(PrimaryKeyCursorPagination, self).paginate_queryset(queryset, request, view)
+
+
+class StreamingExportMixin(object):
+    """
+    Let a `ListAPIView` answer `?export=1` with every row of its queryset as
+    one JSON array, written `export_chunk_size` rows at a time.
+    """
+    export_query_param = 'export'
+    export_chunk_size = 500
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get(self.export_query_param, '') not in ('', '0', 'false'):
+            queryset = self.filter_queryset(self.get_queryset()).order_by('pk')
+            return StreamingHttpResponse(self.export_chunks(queryset), content_type='application/json')
+        return super(StreamingExportMixin, self).list(request, *args, **kwargs)
+
+    def export_chunks(self, queryset):
+        encoder = JSONEncoder()
+        separator = '['
+        last_pk = None
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            chunk = list(chunk[:self.export_chunk_size])
+            if chunk:
+                rows = [encoder.encode(x) for x in self.get_serializer(chunk, many=True).data]
+                yield separator + ','.join(rows)
+                separator = ','
+                last_pk = chunk[-1].pk
+            if len(chunk) < self.export_chunk_size:
+                break
+        yield ']' if separator == ',' else '[]'
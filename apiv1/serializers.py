@@ -1,3 +1,4 @@
+from django.db import models
 from rest_framework import serializers
 from users.models import *
 
@@ -28,6 +29,18 @@ class SubfieldDetailSerializer(serializers.ModelSerializer):
 class CarrierDetailSerializer(serializers.ModelSerializer):
     student = StudentDetailSerializer(required=True)
     subfield = SubfieldDetailSerializer(required=True)
+    total_credits_taken = serializers.SerializerMethodField()
+    total_credits_passed = serializers.SerializerMethodField()
+    average = serializers.SerializerMethodField()
+
+    def get_total_credits_taken(self, obj):
+        return annotation_or_property(obj, 'academic_credits_taken', 'total_credits_taken')
+
+    def get_total_credits_passed(self, obj):
+        return annotation_or_property(obj, 'academic_credits_passed', 'total_credits_passed')
+
+    def get_average(self, obj):
+        return annotation_or_property(obj, 'academic_average', 'average')
 
     class Meta:
         model = Carrier
@@ -69,6 +82,26 @@ class FieldCourseSubfieldRelationSerializer(serializers.ModelSerializer):
 
 class CourseSummarySerializer(serializers.ModelSerializer):
     field_course = FieldCourseSerializer(required=True)
+    grades_average = serializers.SerializerMethodField()
+    min_grade = serializers.SerializerMethodField()
+    max_grade = serializers.SerializerMethodField()
+
+    def get_grades_average(self, obj):
+        if not hasattr(obj, 'grades_average_value'):
+            return obj.grades_average
+        if not obj.are_grades_approved or obj.grades_average_value is None:
+            return None
+        return round(obj.grades_average_value, 2)
+
+    def get_min_grade(self, obj):
+        if not obj.are_grades_approved:
+            return None
+        return annotation_or_property(obj, 'min_grade_value', 'min_grade')
+
+    def get_max_grade(self, obj):
+        if not obj.are_grades_approved:
+            return None
+        return annotation_or_property(obj, 'max_grade_value', 'max_grade')
 
     class Meta:
         model = Course
@@ -76,11 +109,34 @@ class CourseSummarySerializer(serializers.ModelSerializer):
                   'grades_average', 'min_grade', 'max_grade', 'field_course']
 
 
+class AttendListSerializer(serializers.ListSerializer):
+    """Look the course type labels of all the attends up at once, as `course_type_label_for_carrier`."""
+
+    def to_representation(self, data):
+        attends = list(data.all() if isinstance(data, models.Manager) else data)
+        annotated = [x for x in attends if hasattr(x, 'course_type_num_for_carrier')]
+        labels = get_labels(FieldCourseType, [x.course_type_num_for_carrier for x in annotated])
+        for attend, label in zip(annotated, labels):
+            attend.course_type_label_for_carrier = label
+        return super(AttendListSerializer, self).to_representation(attends)
+
+
 class AttendSerializer(serializers.ModelSerializer):
     course = CourseSummarySerializer(required=True)
+    course_type_for_carrier = serializers.SerializerMethodField()
+
+    def get_course_type_for_carrier(self, obj):
+        if hasattr(obj, 'course_type_label_for_carrier'):
+            return obj.course_type_label_for_carrier
+        if not hasattr(obj, 'course_type_num_for_carrier'):
+            return obj.course_type_for_carrier
+        if obj.course_type_num_for_carrier is None:
+            return None
+        return get_key(FieldCourseType, obj.course_type_num_for_carrier)
 
     class Meta:
         model = Attend
+        list_serializer_class = AttendListSerializer
         fields = ['course_type_for_carrier', 'grade', 'grade_status',
                   'carrier_course_removal_status', 'carrier_course_status', 'course']
 
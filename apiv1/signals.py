@@ -0,0 +1,54 @@
+from django.db.models.signals import post_delete, post_save
+from users.models import *
+from users.signals import grades_imported
+from .cache import invalidate, invalidate_carrier_snapshots
+
+# model: the response cache tags it invalidates
+CACHE_TAGS = {
+    College: ('department',),
+    Department: ('department',),
+    Term: ('term',),
+    Course: ('course',),
+    DayTimeCourseRelation: ('course',),
+    Credit: ('field_course',),
+    FieldCourse: ('field_course',),
+    FieldCourseSubfieldRelation: ('field_course',),
+}
+
+
+def invalidate_response_cache(sender, **kwargs):
+    invalidate(*CACHE_TAGS[sender])
+
+
+for model in CACHE_TAGS:
+    post_save.connect(invalidate_response_cache, sender=model, dispatch_uid='apiv1_cache_save_%s' % model.__name__)
+    post_delete.connect(invalidate_response_cache, sender=model,
+                        dispatch_uid='apiv1_cache_delete_%s' % model.__name__)
+
+
+# model: the carriers whose snapshots (mini_profile, records_summary) depend on an instance
+SNAPSHOT_CARRIERS = {
+    Carrier: lambda instance: [instance.pk],
+    Student: lambda instance: instance.carriers.values('pk'),
+    Attend: lambda instance: [instance.carrier_id],
+    Grade: lambda instance: Attend.objects.filter(pk=instance.attend_id).values('carrier'),
+    Course: lambda instance: instance.attend_instances.values('carrier'),
+    PreliminaryRegistration: lambda instance: [instance.carrier_id],
+}
+
+
+def invalidate_snapshots(sender, instance, **kwargs):
+    invalidate_carrier_snapshots(SNAPSHOT_CARRIERS[sender](instance))
+
+
+for model in SNAPSHOT_CARRIERS:
+    post_save.connect(invalidate_snapshots, sender=model, dispatch_uid='apiv1_snapshot_save_%s' % model.__name__)
+    post_delete.connect(invalidate_snapshots, sender=model,
+                        dispatch_uid='apiv1_snapshot_delete_%s' % model.__name__)
+
+
+def invalidate_imported_snapshots(sender, course, **kwargs):
+    invalidate_carrier_snapshots(course.attend_instances.values('carrier'))
+
+
+grades_imported.connect(invalidate_imported_snapshots, dispatch_uid='apiv1_snapshot_grades_imported')
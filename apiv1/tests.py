@@ -1,3 +1,1273 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+import jdatetime
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from users.catalogue import invalidate_term_catalogue
+from users.course_stats import HISTOGRAM_BUCKETS
+from users.prerequisites import CourseGraph, invalidate_course_graph
+from users.rankings import LOCK_KEY, RANKING_KEY, TermRanking, carrier_gpas, term_ranking, update_term_ranking
+from users.rollups import stale_terms
+from users.timetable import invalidate_timetables, term_timetable
+from users.models import *
+from users.synthetic import build_university
+from uni.admission import Gate
+from uni.asgi import WsgiApplication
+from . import urls
+from .cache import tag_versions
+from .views import CarrierEnrollmentView, CourseStudentsListView
+
+
+@contextmanager
+def run_commit_hooks():
+    """Run the on_commit callbacks registered in the block, which TestCase would drop."""
+    start = len(connection.run_on_commit)
+    yield
+    callbacks = connection.run_on_commit[start:]
+    del connection.run_on_commit[start:]
+    for _, callback in callbacks:
+        callback()
+
+
+def seed_university(seed=0):
+    """
+    A small but irregular university: two colleges, mixed approval states,
+    deleted attends and attends without any grade rows.
+    """
+    rnd = random.Random(seed)
+    terms = [
+        Term.objects.create(start_date=jdatetime.date(1397, 7, 1), end_date=jdatetime.date(1397, 10, 30)),
+        Term.objects.create(start_date=jdatetime.date(1397, 11, 1), end_date=jdatetime.date(1398, 3, 30)),
+    ]
+    day_range = DayRange.objects.create(start=datetime.time(8, 0), end=datetime.time(10, 0))
+    day_times = [DayTime.objects.create(day_range=day_range, day=day) for day in range(3)]
+    room = Room.objects.create(title='101', place='A')
+    credits = [Credit.objects.create(practical_units=p, theoritical_units=t)
+               for p, t in ((0, 2), (0, 3), (1, 2))]
+    professor = Professor.objects.create(first_name='Ali', last_name='Ahmadi')
+
+    subfields = []
+    for c in range(2):
+        college = College.objects.create(title='College %d' % c)
+        for d in range(2):
+            department = Department.objects.create(title='Department %d' % d, college=college)
+            for f in range(2):
+                field = Field.objects.create(head_department=department, title='Field %d' % f,
+                                             degree=DegreeType.KARSHENASI)
+                subfields.append(Subfield.objects.create(field=field, title='Subfield'))
+
+    courses = []
+    for serial in range(12):
+        field_course = FieldCourse.objects.create(
+            serial_number=1000 + serial, title='Course %d' % serial, credit_detail=rnd.choice(credits))
+        subfield = rnd.choice(subfields)
+        FieldCourseSubfieldRelation.objects.create(
+            field_course=field_course, subfield=subfield, course_type_num=FieldCourseType.ASLI)
+        for term in terms:
+            course = Course.objects.create(
+                field_course=field_course, department=subfield.field.head_department, term=term,
+                grades_status_num=rnd.choice([CourseGradesStatus.APPROVED, CourseGradesStatus.APPROVED,
+                                              CourseGradesStatus.SENT]),
+                section_number=1, capacity=40, students_gender=GenderTypeAllowed.BOTH, room=room)
+            course.subfields.add(subfield)
+            Teach.objects.create(course=course, professor=professor, percentage=100)
+            DayTimeCourseRelation.objects.create(day_time=rnd.choice(day_times), course=course)
+            courses.append(course)
+
+    carriers = []
+    for i in range(16):
+        user = User.objects.create_user(username='student%d' % i, password='pass')
+        carrier = Carrier.objects.create(
+            id=9000 + i, login_profile=UserLoginProfile.objects.create(user=user),
+            student=Student.objects.create(first_name='First %d' % i, last_name='Last %d' % i),
+            subfield=subfields[i % len(subfields)], status=CarrierStatusType.STUDYING,
+            admission_type_num=AdmissionType.ROOZANEH)
+        carriers.append(carrier)
+        for course in rnd.sample(courses, 8):
+            attend = Attend.objects.create(course=course, carrier=carrier, status=CourseApprovalState.APPROVED,
+                                           deleted_by_carrier=rnd.random() < 0.1)
+            for title in rnd.sample(['midterm', 'final', 'project'], rnd.randint(0, 3)):
+                Grade.objects.create(attend=attend, title=title, value=rnd.randint(0, 40) / 4.0,
+                                     base_value=10.0, out_of_twenty=rnd.choice([5.0, 7.5, 10.0]))
+        PreliminaryRegistration.objects.create(
+            term=terms[1], field_course=rnd.choice(courses).field_course, carrier=carrier)
+    return carriers, terms
+
+
+def python_grade(attend):
+    """The original, non-materialized `Attend.grade`."""
+    if attend.deleted_by_carrier or not attend.course.are_grades_approved:
+        return None
+    return round(sum((x.value / x.base_value) * x.out_of_twenty for x in attend.grades.all()), 2)
+
+
+def python_weighted_average(attends):
+    total_credits = sum(x.course.field_course.credit for x in attends)
+    if total_credits == 0:
+        return None
+    return round(sum(x.course.field_course.credit * python_grade(x) for x in attends) / total_credits, 2)
+
+
+def python_term_summary(car, term_id):
+    """The original in-Python implementation of `TermSummaryView`, kept as a reference."""
+    term_attends = Attend.objects.filter(course__term__pk=term_id).select_related(
+        'course__field_course__credit_detail', 'carrier__subfield__field__head_department').prefetch_related('grades')
+    carrier_attends = [x for x in term_attends if x.carrier == car and not x.deleted_by_carrier]
+    graded = [x for x in term_attends if python_grade(x) is not None]
+    field = car.subfield.field
+    return {
+        'total_credits_taken': sum(x.course.field_course.credit for x in carrier_attends),
+        'total_credits_passed': sum(x.course.field_course.credit for x in carrier_attends
+                                    if (python_grade(x) or 0) >= 10),
+        'carrier_average': python_weighted_average(
+            [x for x in carrier_attends if x.course.are_grades_approved]),
+        'field_average': python_weighted_average(
+            [x for x in graded if x.carrier.subfield.field == field]),
+        'department_average': python_weighted_average(
+            [x for x in graded if x.carrier.subfield.field.head_department == field.head_department]),
+        'college_average': python_weighted_average(
+            [x for x in graded if x.carrier.subfield.field.head_department.college ==
+             field.head_department.college]),
+    }
+
+
+class ApiTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.carriers, cls.terms = seed_university()
+
+    def setUp(self):
+        invalidate_term_catalogue()
+        invalidate_timetables()
+        invalidate_course_graph()
+        cache.clear()
+
+    def client_for(self, carrier):
+        client = APIClient()
+        client.force_authenticate(user=carrier.login_profile.user)
+        return client
+
+    def assertSummaryEqual(self, actual, expected):
+        self.assertEqual(set(actual), set(expected))
+        for key, value in expected.items():
+            if value is None:
+                self.assertIsNone(actual[key], key)
+            else:
+                self.assertAlmostEqual(actual[key], value, delta=0.0101, msg=key)
+
+
+class TermSummaryViewTests(ApiTestCase):
+
+    def test_matches_python_implementation(self):
+        for carrier in self.carriers:
+            for term in self.terms:
+                response = self.client_for(carrier).get(
+                    '/api/v1/carrier/terms/gradessummary/%d/' % term.pk)
+                self.assertEqual(response.status_code, 200)
+                self.assertSummaryEqual(response.data, python_term_summary(carrier, term.pk))
+
+    def test_query_count_does_not_depend_on_university_size(self):
+        carrier = self.carriers[0]
+        client = self.client_for(carrier)
+        # college scope and the aggregation itself
+        with self.assertNumQueries(2):
+            client.get('/api/v1/carrier/terms/gradessummary/%d/' % self.terms[0].pk)
+
+
+class CarrierRecordsSummaryViewTests(ApiTestCase):
+
+    def test_terms_add_up_to_cumulative_figures(self):
+        for carrier in self.carriers:
+            response = self.client_for(carrier).get('/api/v1/carrier/records_summary/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([x['term_title'] for x in response.data], [x.title for x in carrier.terms])
+            taken = passed = 0
+            for record, term in zip(response.data, carrier.terms):
+                expected = python_term_summary(carrier, term.pk)
+                self.assertEqual(record['total_credits_taken'], expected['total_credits_taken'])
+                self.assertEqual(record['total_credits_passed'], expected['total_credits_passed'])
+                if expected['carrier_average'] is None:
+                    self.assertIsNone(record['average'])
+                else:
+                    self.assertAlmostEqual(record['average'], expected['carrier_average'], delta=0.0101)
+                taken += record['total_credits_taken']
+                passed += record['total_credits_passed']
+                self.assertEqual(record['total_credits_taken_till_now'], taken)
+                self.assertEqual(record['total_credits_passed_till_now'], passed)
+
+    def test_query_count_does_not_depend_on_number_of_terms(self):
+        client = self.client_for(self.carriers[0])
+        # terms and attends
+        with self.assertNumQueries(2):
+            client.get('/api/v1/carrier/records_summary/')
+
+
+class RollupTests(ApiTestCase):
+
+    def summaries(self, carrier):
+        client = self.client_for(carrier)
+        return ([client.get('/api/v1/carrier/terms/gradessummary/%d/' % x.pk).data for x in self.terms],
+                client.get('/api/v1/carrier/records_summary/').data)
+
+    def rebuild(self, **options):
+        output = io.StringIO()
+        call_command('rebuild_rollups', stdout=output, **options)
+        return output.getvalue()
+
+    def test_summaries_read_the_same_figures_from_rollups(self):
+        live = {x.pk: self.summaries(x) for x in self.carriers}
+        self.assertIn('Rebuilt the rollups of %d terms' % len(self.terms), self.rebuild())
+        self.assertEqual(stale_terms(), [])
+        # records_summary is served from the carrier snapshots otherwise
+        cache.clear()
+        for carrier in self.carriers:
+            term_summaries, records = self.summaries(carrier)
+            for actual, expected in zip(term_summaries, live[carrier.pk][0]):
+                self.assertSummaryEqual(actual, expected)
+            self.assertEqual(len(records), len(live[carrier.pk][1]))
+            for actual, expected in zip(records, live[carrier.pk][1]):
+                self.assertSummaryEqual({k: v for k, v in actual.items() if k != 'term_title'},
+                                        {k: v for k, v in expected.items() if k != 'term_title'})
+
+        attend = Attend.objects.filter(carrier=self.carriers[0])[0]
+        client = self.client_for(self.carriers[0])
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            client.get('/api/v1/carrier/terms/gradessummary/%d/' % attend.course.term_id)
+            client.get('/api/v1/carrier/records_summary/')
+        self.assertEqual(len([x for x in queries if 'users_termcarrierrollup' in x['sql']]), 2)
+        self.assertFalse([x for x in queries if '"users_attend"."final_grade"' in x['sql']])
+
+    def test_changes_mark_terms_dirty_until_the_incremental_rebuild(self):
+        self.rebuild()
+        attend = Attend.objects.filter(course__grades_status_num=CourseGradesStatus.APPROVED,
+                                       deleted_by_carrier=False).select_related('course', 'carrier')[0]
+        Grade.objects.create(attend=attend, title='bonus', value=20, base_value=20, out_of_twenty=2)
+        self.assertEqual(stale_terms(), [attend.course.term_id])
+        response = self.client_for(attend.carrier).get(
+            '/api/v1/carrier/terms/gradessummary/%d/' % attend.course.term_id)
+        self.assertSummaryEqual(response.data, python_term_summary(attend.carrier, attend.course.term_id))
+
+        self.assertIn('Rebuilt the rollups of 1 terms', self.rebuild(incremental=True))
+        self.assertEqual(stale_terms(), [])
+        response = self.client_for(attend.carrier).get(
+            '/api/v1/carrier/terms/gradessummary/%d/' % attend.course.term_id)
+        self.assertSummaryEqual(response.data, python_term_summary(attend.carrier, attend.course.term_id))
+
+    def test_carrier_and_credit_changes_mark_terms_dirty(self):
+        self.rebuild()
+        carrier = self.carriers[0]
+        carrier_terms = set(Attend.objects.filter(carrier=carrier).values_list('course__term', flat=True))
+        carrier.subfield = Subfield.objects.exclude(pk=carrier.subfield_id)[0]
+        carrier.save()
+        self.assertEqual(set(stale_terms()), carrier_terms)
+
+        self.rebuild()
+        course = Course.objects.select_related('field_course__credit_detail')[0]
+        credit = course.field_course.credit_detail
+        credit.practical_units += 1
+        credit.save()
+        credit_terms = set(Course.objects.filter(field_course__credit_detail=credit).values_list('term', flat=True))
+        self.assertEqual(set(stale_terms()), credit_terms)
+
+        self.rebuild()
+        course.field_course.credit_detail = Credit.objects.exclude(pk=credit.pk)[0]
+        course.field_course.save()
+        self.assertIn(course.term_id, stale_terms())
+
+    def test_subfield_field_and_department_changes_mark_terms_dirty(self):
+        carrier = Carrier.objects.select_related('subfield').get(pk=self.carriers[0].pk)
+        carrier_terms = set(Attend.objects.filter(carrier=carrier).values_list('course__term', flat=True))
+
+        self.rebuild()
+        subfield = carrier.subfield
+        subfield.field = Field.objects.exclude(pk=subfield.field_id)[0]
+        subfield.title += ' (moved)'
+        subfield.save()
+        self.assertTrue(carrier_terms <= set(stale_terms()))
+
+        self.rebuild()
+        field = subfield.field
+        field.head_department = Department.objects.exclude(pk=field.head_department_id)[0]
+        field.title += ' (moved)'
+        field.save()
+        self.assertTrue(carrier_terms <= set(stale_terms()))
+
+        self.rebuild()
+        department = field.head_department
+        department.college = College.objects.exclude(pk=department.college_id)[0]
+        department.title += ' (moved)'
+        department.save()
+        self.assertTrue(carrier_terms <= set(stale_terms()))
+        self.rebuild()
+        rollup = TermCarrierRollup.objects.get(carrier=carrier, term=min(carrier_terms))
+        self.assertEqual((rollup.field_id, rollup.department_id, rollup.college_id),
+                         (field.pk, department.pk, department.college_id))
+
+    def test_new_terms_start_dirty(self):
+        term = Term.objects.create(start_date=jdatetime.date(1399, 7, 1), end_date=jdatetime.date(1399, 10, 30))
+        self.assertTrue(TermRollupState.objects.get(term=term).dirty)
+
+
+class CarrierMiniProfileViewTests(ApiTestCase):
+
+    def test_annotations_match_properties(self):
+        for carrier in self.carriers:
+            response = self.client_for(carrier).get('/api/v1/carrier/mini_profile/')
+            self.assertEqual(response.status_code, 200)
+            profile = response.data[0]
+            self.assertEqual(profile['total_credits_taken'], carrier.total_credits_taken)
+            self.assertEqual(profile['total_credits_passed'], carrier.total_credits_passed)
+            if carrier.average is None:
+                self.assertIsNone(profile['average'])
+            else:
+                self.assertAlmostEqual(profile['average'], carrier.average)
+
+    def test_query_count(self):
+        client = self.client_for(self.carriers[0])
+        # annotated carrier and its terms
+        with self.assertNumQueries(2):
+            client.get('/api/v1/carrier/mini_profile/')
+
+
+class CourseViewsTests(ApiTestCase):
+
+    def test_course_information_query_count(self):
+        client = self.client_for(self.carriers[0])
+        for course in Course.objects.all()[:5]:
+            # course, professors, class times, subfields, departments
+            with self.assertNumQueries(5):
+                response = client.get('/api/v1/courses/%d/' % course.pk)
+            self.assertEqual(response.data[0]['professors_list'], course.professors_list)
+            self.assertEqual(response.data[0]['number_of_students_registered'],
+                             course.number_of_students_registered)
+
+    def test_courses_schedule_query_count(self):
+        client = self.client_for(self.carriers[0])
+        for department in Department.objects.all():
+            with self.assertNumQueries(1):
+                client.get('/api/v1/courses_schedule/%d/%d/' % (self.terms[0].pk, department.pk))
+
+    def test_term_details_course_types(self):
+        carrier = self.carriers[0]
+        response = self.client_for(carrier).get('/api/v1/carrier/terms/%d/' % self.terms[0].pk)
+        attends = Attend.objects.filter(carrier=carrier, course__term=self.terms[0])
+        self.assertEqual(len(response.data), attends.count())
+        self.assertEqual(sorted(str(x['course_type_for_carrier']) for x in response.data),
+                         sorted(str(x.course_type_for_carrier) for x in attends))
+
+
+class EndpointBudgetTests(TestCase):
+    """
+    Every route of the API against a university of a few thousand carriers,
+    authenticated by token. A route whose query count exceeds its budget is
+    most likely an N+1 regression. Wall times depend on the machine: they are
+    only reported, unless UNI_TIME_BUDGET_FACTOR is set, which scales the
+    time budgets and makes them fail the test.
+    """
+
+    TIME_BUDGET_FACTOR = os.environ.get('UNI_TIME_BUDGET_FACTOR')
+
+    # route: (maximum number of queries, maximum seconds)
+    BUDGETS = {
+        'carrier/mini_profile/': (5, 0.5),
+        'carrier/terms/': (4, 0.5),
+        'carrier/terms/<term_id>/': (5, 0.5),
+        'carrier/terms/gradessummary/<term_id>/': (5, 1.0),
+        'carrier/terms/preregistration/<term_id>/': (4, 0.5),
+        'carrier/terms/clashes/<term_id>/': (4, 0.5),
+        'carrier/terms/ranking/<term_id>/': (4, 0.5),
+        'courses/<course_id>/': (6, 0.5),
+        'courses/<course_id>/stats/': (3, 0.5),
+        'carrier/records_summary/': (5, 0.5),
+        'carrier/subfield_courses/': (5, 0.5),
+        'carrier/eligible_courses/': (4, 0.5),
+        'departments/': (2, 0.5),
+        'terms/': (2, 0.5),
+        'courses_schedule/<term_id>/<department_id>/': (2, 0.5),
+        'course/<course_id>/student_list/': (2, 1.0),
+        'course/<course_id>/grades/': (5, 0.5),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        carrier_ids = build_university(colleges=3, departments_per_college=3, fields_per_department=2,
+                                       field_courses_per_field=10, terms=3, carriers=2000,
+                                       courses_per_term=4, grades_per_attend=2)
+        cls.carrier = Carrier.objects.select_related('subfield__field').get(pk=carrier_ids[0])
+        cls.token = Token.objects.create(user=cls.carrier.login_profile.user)
+        attend = Attend.objects.filter(carrier=cls.carrier).select_related('course').order_by('pk')[0]
+        cls.kwargs = {
+            'term_id': attend.course.term_id,
+            'course_id': attend.course_id,
+            'department_id': cls.carrier.subfield.field.head_department_id,
+        }
+
+    def setUp(self):
+        invalidate_term_catalogue()
+        invalidate_timetables()
+        invalidate_course_graph()
+        cache.clear()
+
+    def url(self, route):
+        path = route
+        for name, value in self.kwargs.items():
+            path = path.replace('<%s>' % name, str(value))
+        return '/api/v1/' + path
+
+    # staff or write-only routes, covered by their own tests
+    UNBUDGETED_ROUTES = {
+        'course/<course_id>/grades/import/',
+        'analytics/utilization/<term_id>/',
+        'carrier/enrollment/<course_id>/',
+    }
+
+    def test_every_route_has_a_budget(self):
+        self.assertEqual({str(x.pattern) for x in urls.urlpatterns}, set(self.BUDGETS) | self.UNBUDGETED_ROUTES)
+
+    def test_routes_stay_within_budget(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        overruns = []
+        for route, (max_queries, max_seconds) in sorted(self.BUDGETS.items()):
+            with self.subTest(route=route):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = client.get(self.url(route))
+                    elapsed = time.perf_counter() - started
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(queries), max_queries, '\n'.join(x['sql'] for x in queries))
+                if self.TIME_BUDGET_FACTOR:
+                    self.assertLessEqual(elapsed, max_seconds * float(self.TIME_BUDGET_FACTOR))
+                elif elapsed > max_seconds:
+                    overruns.append('%s took %.2fs of %.2fs' % (route, elapsed, max_seconds))
+        if overruns:
+            sys.stderr.write('\nTime budgets exceeded:\n  %s\n' % '\n  '.join(overruns))
+
+
+class HotPathIndexTests(ApiTestCase):
+    """The filters the API issues most are answered from an index, never by scanning a table."""
+
+    def test_hot_queries_use_index_scans(self):
+        attend = Attend.objects.select_related('course')[0]
+        # name: (queryset, part of the SQLite plan naming one of the composite indexes it has to pick)
+        queries = {
+            'attends of a carrier in a term': (Attend.objects.filter(
+                carrier=attend.carrier_id, course__term__pk=attend.course.term_id), None),
+            'kept attends of a carrier': (Attend.objects.filter(
+                carrier=attend.carrier_id, deleted_by_carrier=False), 'attend_carrier_deleted_idx'),
+            'grades of an attend': (Grade.objects.filter(attend=attend.pk), None),
+            'courses of a department in a term': (Course.objects.filter(
+                department=attend.course.department_id, term=attend.course.term_id), 'course_term_department_idx'),
+            'preregistrations of a carrier in a term': (PreliminaryRegistration.objects.filter(
+                term=attend.course.term_id, carrier=attend.carrier_id), 'prereg_carrier_term_idx'),
+            'grades of a course': (Attend.objects.filter(
+                course=attend.course_id, final_grade__isnull=False).values('final_grade'),
+                'COVERING INDEX attend_course_grade_idx'),
+        }
+        if connection.vendor == 'postgresql':
+            # tiny test tables are cheaper to scan; ask whether an index can answer at all
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        elif connection.vendor != 'sqlite':
+            self.skipTest('no plan expectations for %s' % connection.vendor)
+        for name, (queryset, index) in queries.items():
+            with self.subTest(query=name):
+                plan = queryset.explain()
+                if connection.vendor == 'sqlite':
+                    self.assertNotRegex(plan, r'\bSCAN\b', plan)
+                    self.assertRegex(plan, r'SEARCH (TABLE )?users_\w+ USING', plan)
+                    if index:
+                        self.assertIn(index, plan)
+                else:
+                    self.assertNotIn('Seq Scan', plan)
+                    self.assertRegex(plan, r'Index (Only )?Scan', plan)
+
+
+class CatalogueCacheTests(ApiTestCase):
+
+    def test_revalidation_with_etag_and_last_modified(self):
+        client = self.client_for(self.carriers[0])
+        response = client.get('/api/v1/departments/')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            cached = client.get('/api/v1/departments/')
+        self.assertEqual(cached.data, response.data)
+        self.assertEqual(client.get('/api/v1/departments/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(client.get('/api/v1/departments/',
+                                    HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_saving_a_model_invalidates_dependent_responses(self):
+        client = self.client_for(self.carriers[0])
+        response = client.get('/api/v1/departments/')
+        department = Department.objects.get(pk=response.data[0]['pk'])
+        department.title = 'Renamed'
+        department.save()
+        response = client.get('/api/v1/departments/')
+        self.assertEqual(response.data[0]['title'], 'Renamed')
+        self.assertEqual(client.get('/api/v1/terms/').status_code, 200)
+
+    def test_pagination_links_follow_the_host(self):
+        course = Course.objects.values('term', 'department').annotate(n=Count('pk')).filter(n__gt=1)[0]
+        route = '/api/v1/courses_schedule/%d/%d/?page_size=1' % (course['term'], course['department'])
+        client = self.client_for(self.carriers[0])
+        for host in ('freshstart.ir', 'www.freshstart.ir'):
+            self.assertTrue(client.get(route, HTTP_HOST=host).data['next'].startswith('http://%s/' % host))
+
+
+class CarrierSnapshotTests(ApiTestCase):
+
+    def test_warm_hits_run_no_query(self):
+        client = self.client_for(self.carriers[0])
+        for route in ('/api/v1/carrier/mini_profile/', '/api/v1/carrier/records_summary/'):
+            response = client.get(route)
+            with self.assertNumQueries(0):
+                self.assertEqual(client.get(route).data, response.data)
+
+    def test_grade_changes_invalidate_the_carrier_snapshots(self):
+        attend = Attend.objects.filter(carrier=self.carriers[0], final_grade__isnull=False)[0]
+        other = self.client_for(self.carriers[1])
+        client = self.client_for(self.carriers[0])
+        before = client.get('/api/v1/carrier/records_summary/').data
+        other.get('/api/v1/carrier/records_summary/')
+        Grade.objects.create(attend=attend, title='bonus', value=20, base_value=20, out_of_twenty=5)
+        self.assertNotEqual(client.get('/api/v1/carrier/records_summary/').data, before)
+        with self.assertNumQueries(0):
+            other.get('/api/v1/carrier/records_summary/')
+
+    def test_course_approval_invalidates_its_carriers(self):
+        course = Attend.objects.filter(carrier=self.carriers[0], deleted_by_carrier=False, grades__isnull=False,
+                                       course__grades_status_num=CourseGradesStatus.SENT)[0].course
+        client = self.client_for(self.carriers[0])
+        before = client.get('/api/v1/carrier/mini_profile/').data
+        course.grades_status_num = CourseGradesStatus.APPROVED
+        course.save()
+        self.assertNotEqual(client.get('/api/v1/carrier/mini_profile/').data, before)
+
+    def test_writes_in_another_process_invalidate_the_snapshots(self):
+        attend = Attend.objects.filter(carrier=self.carriers[0], final_grade__isnull=False)[0]
+        client = self.client_for(self.carriers[0])
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}):
+            client.get('/api/v1/carrier/records_summary/')
+            pid = os.fork()
+            if pid == 0:
+                # another worker saves a grade of the carrier
+                status = 1
+                try:
+                    Grade.objects.create(attend=attend, title='bonus', value=20, base_value=20, out_of_twenty=5)
+                    status = 0
+                finally:
+                    os._exit(status)
+            self.assertEqual(os.waitpid(pid, 0)[1], 0)
+            with CaptureQueriesContext(connection) as queries:
+                client.get('/api/v1/carrier/records_summary/')
+            self.assertTrue(queries)
+
+
+class PaginationAndExportTests(ApiTestCase):
+
+    def setUp(self):
+        super(PaginationAndExportTests, self).setUp()
+        self.course = Course.objects.annotate(attends=Count('attend_instances')).order_by('-attends')[0]
+        self.route = '/api/v1/course/%d/student_list/' % self.course.pk
+
+    def test_cursor_pages_walk_the_whole_roster(self):
+        client = self.client_for(self.carriers[0])
+        ids, url = [], self.route + '?page_size=2'
+        while url:
+            page = client.get(url).data
+            self.assertLessEqual(len(page['results']), 2)
+            ids += [x['carrier']['id'] for x in page['results']]
+            url = page['next']
+        expected = list(self.course.attend_instances.order_by('pk').values_list('carrier', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_pagination_is_opt_in(self):
+        client = self.client_for(self.carriers[0])
+        rows = client.get(self.route).data
+        self.assertIsInstance(rows, list)
+        self.assertEqual(sorted(x['carrier']['id'] for x in rows),
+                         sorted(self.course.attend_instances.values_list('carrier', flat=True)))
+        schedule = client.get('/api/v1/courses_schedule/%d/%d/' % (self.course.term_id, self.course.department_id))
+        self.assertIn(self.course.pk, [x['pk'] for x in schedule.data])
+
+    def test_export_streams_every_row_in_chunks(self):
+        client = self.client_for(self.carriers[0])
+        expected = client.get(self.route + '?page_size=1000').data['results']
+        original = CourseStudentsListView.export_chunk_size
+        CourseStudentsListView.export_chunk_size = 2
+        try:
+            with self.assertNumQueries(len(expected) // 2 + 1):
+                response = client.get(self.route + '?export=1')
+                content = b''.join(response.streaming_content)
+        finally:
+            CourseStudentsListView.export_chunk_size = original
+        self.assertEqual(json.loads(content.decode()), json.loads(json.dumps(expected)))
+
+    def test_export_of_an_empty_list(self):
+        client = self.client_for(self.carriers[0])
+        response = client.get('/api/v1/courses_schedule/%d/0/?export=1' % self.terms[0].pk)
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+
+class GradeImportTests(ApiTestCase):
+
+    def setUp(self):
+        super(GradeImportTests, self).setUp()
+        self.course = Course.objects.filter(grades_status_num=CourseGradesStatus.APPROVED).annotate(
+            attends=Count('attend_instances')).order_by('-attends')[0]
+        self.attends = list(self.course.attend_instances.filter(deleted_by_carrier=False).order_by('pk'))
+        self.admin = User.objects.create_user(username='registrar', password='pass', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.route = '/api/v1/course/%d/grades/import/' % self.course.pk
+
+    def upload(self, lines, **data):
+        content = '\n'.join(lines).encode()
+        data['sheet'] = SimpleUploadedFile('grades.csv', content, content_type='text/csv')
+        return self.client.post(self.route, data, format='multipart')
+
+    def test_sheet_creates_and_replaces_grades(self):
+        first, second = self.attends[:2]
+        Grade.objects.create(attend=first, title='exam', value=1, base_value=20, out_of_twenty=20)
+        response = self.upload(['carrier,title,value,base_value,out_of_twenty',
+                                '%d,exam,18,20,20' % first.carrier_id,
+                                '%d,exam,9,10,20' % second.carrier_id])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+        self.assertEqual(Grade.objects.get(attend=first, title='exam').value, 18)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.final_grade, python_grade(first))
+        self.assertEqual(second.final_grade, python_grade(second))
+
+    def test_import_invalidates_the_carrier_snapshots(self):
+        attend = self.attends[0]
+        carrier = self.client_for(attend.carrier)
+        before = carrier.get('/api/v1/carrier/records_summary/').data
+        self.upload(['carrier,title,value', '%d,bonus,20' % attend.carrier_id])
+        self.assertNotEqual(carrier.get('/api/v1/carrier/records_summary/').data, before)
+
+    def test_row_errors_reject_the_whole_sheet(self):
+        attend = self.attends[0]
+        outsider = Carrier.objects.exclude(pk__in=self.course.attend_instances.values('carrier'))[0]
+        count = Grade.objects.count()
+        response = self.upload(['carrier,title,value,base_value',
+                                '%d,final,18,20' % attend.carrier_id,
+                                '%d,final,12,20' % outsider.pk,
+                                '%d,final,12,20' % attend.carrier_id,
+                                '%d,midterm,25,20' % attend.carrier_id,
+                                'x,,abc,20'])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([x['row'] for x in response.data['errors']], [3, 4, 5, 6])
+        self.assertEqual(len(response.data['errors'][3]['errors']), 3)
+        self.assertEqual(Grade.objects.count(), count)
+
+    def test_carrier_ids_must_be_integers(self):
+        carrier_id = self.attends[0].carrier_id
+        response = self.upload(['carrier,title,value', '%d.0,a,18' % carrier_id, '%d.5,b,18' % carrier_id,
+                                'inf,c,18', '-inf,d,18', 'nan,e,18', '1e400,f,18', '%s,g,18' % ('9' * 400)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([x['row'] for x in response.data['errors']], [3, 4, 5, 6, 7, 8])
+        self.assertEqual(response.data['errors'][0]['errors'], ['carrier is not a carrier id.'])
+        self.assertEqual(response.data['errors'][-1]['errors'],
+                         ['carrier %s does not attend this course.' % ('9' * 400)])
+
+    def test_dry_run_and_bad_sheets(self):
+        count = Grade.objects.count()
+        response = self.upload(['carrier,title,value', '%d,exam,18' % self.attends[0].carrier_id], dry_run='1')
+        self.assertEqual((response.status_code, response.data['created']), (200, 1))
+        self.assertEqual(Grade.objects.count(), count)
+        self.assertEqual(self.upload(['carrier,value', '1,2']).status_code, 400)
+        response = self.upload(['carrier,title,value', '%d,exam\x00,18' % self.attends[0].carrier_id])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('line 2', response.data['detail'])
+        self.assertEqual(self.client_for(self.carriers[0]).post(self.route, {}, format='multipart').status_code, 403)
+
+    def test_xlsx_sheets(self):
+        import openpyxl
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['carrier', 'title', 'value'])
+        workbook.active.append([self.attends[0].carrier_id, 'exam', 18])
+        content = io.BytesIO()
+        workbook.save(content)
+        sheet = SimpleUploadedFile('grades.xlsx', content.getvalue())
+        response = self.client.post(self.route, {'sheet': sheet, 'dry_run': '1'}, format='multipart')
+        self.assertEqual((response.status_code, response.data['created']), (200, 1))
+
+        sheet.seek(0)
+        with mock.patch.dict('sys.modules', {'openpyxl': None}):
+            response = self.client.post(self.route, {'sheet': sheet}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['detail'], 'Reading .xlsx sheets requires openpyxl.')
+
+    def test_query_count_does_not_grow_with_the_sheet(self):
+        def queries_for(items):
+            lines = ['carrier,title,value'] + ['%d,item %d-%d,10' % (x.carrier_id, items, i)
+                                               for x in self.attends for i in range(items)]
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.upload(lines).status_code, 200)
+            # SQLite caps the rows of a single INSERT, only those are batched
+            return [x['sql'] for x in queries if not x['sql'].startswith('INSERT')]
+
+        self.assertEqual(len(queries_for(1)), len(queries_for(30)))
+
+
+class TimetableClashesTests(ApiTestCase):
+
+    def brute_force_pairs(self, courses):
+        pairs = set()
+        for first, second in itertools.combinations(sorted(courses, key=lambda x: x.pk), 2):
+            slots = [(x.day, x.day_range.start, x.day_range.end) for x in first.weekly_schedule.all()]
+            for other in second.weekly_schedule.all():
+                if any(day == other.day and start < other.day_range.end and other.day_range.start < end
+                       for day, start, end in slots):
+                    pairs.add((first.pk, second.pk))
+        return pairs
+
+    def test_weekly_clashes_of_attended_courses(self):
+        for carrier in self.carriers[:4]:
+            for term in self.terms:
+                courses = Course.objects.filter(attend_instances__carrier=carrier,
+                                                attend_instances__deleted_by_carrier=False, term=term)
+                response = self.client_for(carrier).get('/api/v1/carrier/terms/clashes/%d/' % term.pk)
+                self.assertEqual({tuple(x['courses']) for x in response.data}, self.brute_force_pairs(courses))
+
+    def test_exam_clashes_and_index_invalidation(self):
+        carrier = self.carriers[0]
+        route = '/api/v1/carrier/terms/clashes/%d/' % self.terms[0].pk
+        client = self.client_for(carrier)
+        self.assertFalse([x for x in client.get(route).data if x['clashes'][0]['type'] == 'exam'])
+        first, second = Course.objects.filter(attend_instances__carrier=carrier, term=self.terms[0],
+                                              attend_instances__deleted_by_carrier=False).order_by('pk')[:2]
+        morning = DayRange.objects.create(start=datetime.time(9, 0), end=datetime.time(11, 0))
+        noon = DayRange.objects.create(start=datetime.time(10, 30), end=datetime.time(12, 30))
+        first.final_exam_date = ExamDate.objects.create(day=jdatetime.date(1397, 11, 3), day_range=morning)
+        first.save()
+        second.midterm_exam_date = ExamDate.objects.create(day=jdatetime.date(1397, 11, 3), day_range=noon)
+        second.save()
+        clash = [x for x in client.get(route).data if x['courses'] == [first.pk, second.pk]][0]
+        self.assertIn({'type': 'exam', 'exams': ['final', 'midterm'], 'day': '1397-11-03',
+                       'start': '10:30', 'end': '11:00'}, clash['clashes'])
+
+    def test_preregistration_clashes_need_every_section_to_clash(self):
+        timetable = term_timetable(self.terms[1].pk)
+        courses = {x.field_course_id: x for x in Course.objects.filter(term=self.terms[1])}
+        field_course_ids = sorted(courses)
+        expected = self.brute_force_pairs(courses.values())
+        self.assertEqual({tuple(x['courses']) for x in timetable.field_course_clashes(field_course_ids)}, expected)
+
+        first, second = sorted(expected)[0]
+        field_course = Course.objects.get(pk=first).field_course
+        other = Course.objects.create(
+            field_course=field_course, department=courses[field_course.pk].department, term=self.terms[1],
+            grades_status_num=CourseGradesStatus.NOT_SENT, section_number=2, capacity=40,
+            students_gender=GenderTypeAllowed.BOTH, room=Room.objects.get())
+        DayTimeCourseRelation.objects.create(course=other, day_time=DayTime.objects.create(
+            day=Day.FRIDAY, day_range=DayRange.objects.get(start=datetime.time(8, 0))))
+        clashing = {tuple(x['courses']) for x in term_timetable(self.terms[1].pk).field_course_clashes(
+            field_course_ids)}
+        self.assertNotIn((first, second), clashing)
+
+    def test_warm_index_costs_no_query(self):
+        client = self.client_for(self.carriers[0])
+        route = '/api/v1/carrier/terms/clashes/%d/' % self.terms[0].pk
+        with CaptureQueriesContext(connection) as cold:
+            client.get(route)
+        with CaptureQueriesContext(connection) as warm:
+            client.get(route)
+        self.assertEqual(len(cold) - len(warm), 2)
+
+
+class CourseGraphTests(ApiTestCase):
+
+    def test_closure_and_order_of_a_graph(self):
+        graph = CourseGraph([(0, 4, 3), (0, 3, 1), (0, 3, 2), (0, 2, 1), (1, 4, 5), (0, 7, 8), (0, 8, 7)])
+        self.assertEqual(graph.closure(4), {1, 2, 3})
+        self.assertEqual(graph.closure(1), set())
+        self.assertEqual(graph.order, [1, 2, 3, 4])
+        self.assertEqual(graph.cyclic, {7, 8})
+        self.assertEqual(graph.closure(7), {8})
+        self.assertEqual(graph.topological_order([7, 4, 6, 2]), [6, 2, 4, 7])
+        self.assertEqual(graph.corequisites, {4: {5}, 5: {4}})
+        self.assertEqual(graph.missing_prerequisites(3, {1}), [2])
+
+    def test_eligible_courses_of_a_carrier(self):
+        carrier = self.carriers[0]
+        passed = Attend.objects.filter(carrier=carrier, grade_state_num=GradeState.PASSED)[0].course.field_course
+        first, second = [FieldCourse.objects.create(serial_number=2000 + i, title='Elective %d' % i,
+                                                    credit_detail=Credit.objects.all()[0]) for i in range(2)]
+        for field_course in (first, second, passed):
+            FieldCourseSubfieldRelation.objects.get_or_create(
+                field_course=field_course, subfield=carrier.subfield,
+                defaults={'course_type_num': FieldCourseType.EKHTIARI})
+        first.prerequisites.add(passed)
+        second.prerequisites.add(first)
+        first.corequisites.add(second)
+
+        response = self.client_for(carrier).get('/api/v1/carrier/eligible_courses/')
+        entries = {x['serial_number']: x for x in response.data}
+        self.assertNotIn(passed.pk, entries)
+        order = [x['serial_number'] for x in response.data]
+        self.assertLess(order.index(first.pk), order.index(second.pk))
+        self.assertTrue(entries[first.pk]['eligible'])
+        self.assertEqual(entries[second.pk]['missing_prerequisites'], [first.pk])
+        self.assertEqual(entries[second.pk]['all_prerequisites'], [passed.pk, first.pk])
+        self.assertEqual(entries[first.pk]['corequisites'], [second.pk])
+        # prerequisites are one-way, unlike corequisites
+        self.assertEqual(list(first.prerequisites.all()), [passed])
+
+        second.prerequisites.remove(first)
+        response = self.client_for(carrier).get('/api/v1/carrier/eligible_courses/')
+        self.assertTrue({x['serial_number']: x for x in response.data}[second.pk]['eligible'])
+
+    def test_migration_drops_mirrored_legacy_prerequisites(self):
+        first, second, third = [FieldCourse.objects.create(serial_number=2000 + i, title='Elective %d' % i,
+                                                           credit_detail=Credit.objects.all()[0]) for i in range(3)]
+        # what the symmetrical relation stored for second.prerequisites.add(first), third.prerequisites.add(first)
+        Prerequisite = FieldCourse.prerequisites.through
+        Prerequisite.objects.bulk_create([
+            Prerequisite(from_fieldcourse=second, to_fieldcourse=first),
+            Prerequisite(from_fieldcourse=third, to_fieldcourse=first),
+            Prerequisite(from_fieldcourse=first, to_fieldcourse=second),
+            Prerequisite(from_fieldcourse=first, to_fieldcourse=third),
+        ])
+        invalidate_course_graph()
+        self.assertEqual(CourseGraph.load().cyclic, {first.pk, second.pk, third.pk})
+
+        import_module('users.migrations.0011_one_way_prerequisites').remove_mirrored_prerequisites(apps, None)
+        invalidate_course_graph()
+        self.assertEqual(list(first.prerequisites.all()), [])
+        self.assertEqual(list(second.prerequisites.all()), [first])
+        self.assertEqual(list(third.prerequisites.all()), [first])
+        self.assertEqual(CourseGraph.load().cyclic, set())
+
+
+class UtilizationTests(ApiTestCase):
+
+    def setUp(self):
+        super(UtilizationTests, self).setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='registrar', password='pass',
+                                                                is_staff=True))
+
+    def test_figures_match_the_model_properties(self):
+        term = self.terms[0]
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/v1/analytics/utilization/%d/' % term.pk)
+        courses = list(Course.objects.filter(term=term))
+
+        def hours(course):
+            return sum((x['end'].hour * 60 + x['end'].minute - x['start'].hour * 60 - x['start'].minute) / 60.0
+                       for x in course.class_times)
+
+        room = response.data['rooms'][0]
+        self.assertAlmostEqual(room['weekly_hours'], sum(hours(x) for x in courses if x.room_id == room['room']))
+        for professor in response.data['professors']:
+            teaching = Teach.objects.filter(course__term=term, professor=professor['professor'])
+            self.assertEqual(professor['courses'], len(teaching))
+            self.assertAlmostEqual(professor['weighted_credits'],
+                                   sum(x.course.field_course.credit * x.percentage / 100.0 for x in teaching))
+            self.assertAlmostEqual(professor['weighted_weekly_hours'],
+                                   sum(hours(x.course) * x.percentage / 100.0 for x in teaching))
+        for department in response.data['departments']:
+            selected = [x for x in courses if x.department_id == department['department']]
+            self.assertEqual(department['capacity'], sum(x.capacity for x in selected))
+            self.assertEqual(department['registered'], sum(x.number_of_students_registered for x in selected))
+
+    def test_department_filter_and_permissions(self):
+        department = Course.objects.filter(term=self.terms[0])[0].department
+        response = self.client.get('/api/v1/analytics/utilization/%d/?department=%d' % (
+            self.terms[0].pk, department.pk))
+        self.assertEqual([x['department'] for x in response.data['departments']], [department.pk])
+        self.assertEqual(self.client.get('/api/v1/analytics/utilization/1/?department=x').status_code, 400)
+        self.assertEqual(self.client_for(self.carriers[0]).get(
+            '/api/v1/analytics/utilization/%d/' % self.terms[0].pk).status_code, 403)
+
+
+class CourseStatsTests(ApiTestCase):
+
+    def test_matches_the_attend_grades(self):
+        course = Course.objects.filter(grades_status_num=CourseGradesStatus.APPROVED).annotate(
+            graded=Count('attend_instances__final_grade')).filter(graded__gt=1)[0]
+        grades = [x.final_grade for x in course.attend_instances.all() if x.final_grade is not None]
+        client = self.client_for(self.carriers[0])
+        with self.assertNumQueries(2):
+            stats = client.get('/api/v1/courses/%d/stats/' % course.pk).data
+        with self.assertNumQueries(1):
+            self.assertEqual(client.get('/api/v1/courses/%d/stats/' % course.pk).data, stats)
+
+        mean = sum(grades) / len(grades)
+        self.assertEqual((stats['count'], stats['min'], stats['max']), (len(grades), min(grades), max(grades)))
+        self.assertAlmostEqual(stats['mean'], mean, delta=0.0051)
+        self.assertAlmostEqual(stats['std'], (sum((x - mean) ** 2 for x in grades) / len(grades)) ** 0.5,
+                               delta=0.0051)
+        self.assertAlmostEqual(stats['pass_rate'], len([x for x in grades if x >= 10]) * 100.0 / len(grades),
+                               delta=0.0051)
+        self.assertEqual(len(stats['histogram']), HISTOGRAM_BUCKETS)
+        self.assertEqual(sum(x['count'] for x in stats['histogram']), len(grades))
+        for grade in grades:
+            bucket = stats['histogram'][min(HISTOGRAM_BUCKETS - 1, max(0, int(grade)))]
+            self.assertTrue(bucket['count'])
+
+    def test_grade_changes_invalidate_the_cache(self):
+        attend = Attend.objects.filter(course__grades_status_num=CourseGradesStatus.APPROVED,
+                                       final_grade__isnull=False, deleted_by_carrier=False)[0]
+        client = self.client_for(self.carriers[0])
+        before = client.get('/api/v1/courses/%d/stats/' % attend.course_id).data
+        Grade.objects.create(attend=attend, title='bonus', value=20, base_value=20, out_of_twenty=1)
+        after = client.get('/api/v1/courses/%d/stats/' % attend.course_id).data
+        self.assertAlmostEqual(after['max'], max(before['max'], attend.final_grade + 1))
+        self.assertNotEqual(after['mean'], before['mean'])
+
+    def test_course_without_approved_grades(self):
+        course = Course.objects.exclude(grades_status_num=CourseGradesStatus.APPROVED)[0]
+        stats = self.client_for(self.carriers[0]).get('/api/v1/courses/%d/stats/' % course.pk).data
+        self.assertEqual((stats['count'], stats['mean'], stats['std'], stats['pass_rate']), (0, None, None, None))
+        self.assertEqual(self.client_for(self.carriers[0]).get('/api/v1/courses/0/stats/').status_code, 404)
+
+
+class TermRankingTests(ApiTestCase):
+
+    def gpas(self, term):
+        totals = {}
+        for attend in Attend.objects.filter(course__term=term, final_grade__isnull=False).select_related(
+                'course__field_course__credit_detail', 'carrier__subfield__field__head_department'):
+            credit = attend.course.field_course.credit
+            department = attend.carrier.subfield.field.head_department
+            total = totals.setdefault(attend.carrier_id, {
+                'credits': 0, 'weighted': 0.0, 'field': attend.carrier.subfield.field_id,
+                'department': department.pk, 'college': department.college_id})
+            total['credits'] += credit
+            total['weighted'] += credit * attend.final_grade
+        return {carrier_id: dict(x, gpa=x['weighted'] / x['credits']) for carrier_id, x in totals.items()}
+
+    def test_ranks_match_a_full_scan(self):
+        term = Term.objects.annotate(graded=Count('courses__attend_instances__final_grade')).filter(
+            graded__gt=0)[0]
+        gpas = self.gpas(term)
+        self.assertTrue(gpas)
+        with self.assertNumQueries(1):
+            ranking = term_ranking(term.pk)
+        with self.assertNumQueries(0):
+            term_ranking(term.pk)
+        for carrier_id, own in gpas.items():
+            ranked = ranking.rank(carrier_id)
+            self.assertAlmostEqual(ranked['gpa'], own['gpa'], delta=0.0051)
+            for scope in ('field', 'department', 'college'):
+                group = [x['gpa'] for x in gpas.values() if x[scope] == own[scope]]
+                self.assertEqual(ranked[scope]['id'], own[scope])
+                self.assertEqual(ranked[scope]['size'], len(group))
+                self.assertEqual(ranked[scope]['rank'], len([x for x in group if x > own['gpa'] + 1e-9]) + 1)
+                self.assertAlmostEqual(ranked[scope]['percentile'],
+                                       len([x for x in group if x <= own['gpa'] + 1e-9]) * 100.0 / len(group),
+                                       delta=0.0051)
+
+    def test_grade_changes_update_the_cached_ranking(self):
+        attend = Attend.objects.filter(final_grade__isnull=False).select_related('course')[0]
+        term_id = attend.course.term_id
+        term_ranking(term_id)
+        with run_commit_hooks():
+            Grade.objects.create(attend=attend, title='bonus', value=20, base_value=20, out_of_twenty=3)
+        cached, fresh = cache.get(RANKING_KEY % term_id), TermRanking(term_id, carrier_gpas(term_id))
+        self.assertEqual(cached.carriers, fresh.carriers)
+        self.assertEqual(cached.groups, fresh.groups)
+
+        with mock.patch('users.rankings.carrier_gpas', wraps=carrier_gpas) as gpas:
+            with run_commit_hooks():
+                attend.course.save()
+            self.assertEqual(gpas.call_count, 0)
+            attend.course.grades_status_num = CourseGradesStatus.SENT
+            with run_commit_hooks():
+                attend.course.save()
+            self.assertEqual(gpas.call_count, 1)
+        self.assertEqual(cache.get(RANKING_KEY % term_id).groups, TermRanking(term_id, carrier_gpas(term_id)).groups)
+
+        with run_commit_hooks():
+            Attend.objects.filter(course__term__pk=term_id, carrier=attend.carrier).delete()
+        self.assertIsNone(cache.get(RANKING_KEY % term_id).rank(attend.carrier_id))
+        self.assertEqual(cache.get(RANKING_KEY % term_id).groups,
+                         TermRanking(term_id, carrier_gpas(term_id)).groups)
+
+    def test_concurrent_updates_drop_the_cached_ranking(self):
+        attend = Attend.objects.filter(final_grade__isnull=False).select_related('course')[0]
+        term_id = attend.course.term_id
+        term_ranking(term_id)
+        # another process is in the middle of updating the ranking
+        cache.add(LOCK_KEY % term_id, True)
+        with run_commit_hooks():
+            Grade.objects.create(attend=attend, title='bonus', value=20, base_value=20, out_of_twenty=3)
+        self.assertIsNone(cache.get(RANKING_KEY % term_id))
+        cache.delete(LOCK_KEY % term_id)
+
+        # an update contending while this one holds the lock
+        term_ranking(term_id)
+        gpas = carrier_gpas
+
+        def contended(*args):
+            with run_commit_hooks():
+                update_term_ranking(term_id, [attend.carrier_id])
+            return gpas(*args)
+
+        with mock.patch('users.rankings.carrier_gpas', contended), run_commit_hooks():
+            update_term_ranking(term_id, [attend.carrier_id])
+        self.assertIsNone(cache.get(RANKING_KEY % term_id))
+        self.assertIsNone(cache.get(LOCK_KEY % term_id))
+
+    def test_endpoint(self):
+        attend = Attend.objects.filter(final_grade__isnull=False).select_related('course', 'carrier')[0]
+        client = self.client_for(attend.carrier)
+        response = client.get('/api/v1/carrier/terms/ranking/%d/' % attend.course.term_id)
+        self.assertEqual(response.data, term_ranking(attend.course.term_id).rank(attend.carrier_id))
+        self.assertEqual(client.get('/api/v1/carrier/terms/ranking/0/').status_code, 404)
+
+
+class EnrollmentTests(ApiTestCase):
+
+    def setUp(self):
+        super(EnrollmentTests, self).setUp()
+        self.course = Course.objects.filter(term=self.terms[1])[0]
+        self.carrier = Carrier.objects.exclude(pk__in=self.course.attend_instances.values('carrier'))[0]
+        self.route = '/api/v1/carrier/enrollment/%d/' % self.course.pk
+
+    def test_enroll_and_drop(self):
+        client = self.client_for(self.carrier)
+        registered = self.course.number_of_students_registered
+        self.assertEqual(registered, self.course.attend_instances.filter(deleted_by_carrier=False).count())
+        self.assertEqual(client.post(self.route).status_code, 201)
+        self.assertEqual(client.post(self.route).status_code, 409)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.number_of_students_registered, registered + 1)
+        self.assertEqual(client.delete(self.route).status_code, 204)
+        self.assertEqual(client.delete(self.route).status_code, 404)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.number_of_students_registered, registered)
+        self.assertEqual(client.post('/api/v1/carrier/enrollment/0/').status_code, 404)
+
+    def test_enrollment_does_not_recount_the_course(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client_for(self.carrier).post(self.route).status_code, 201)
+        self.assertEqual(len([x for x in queries if x['sql'].startswith('UPDATE "users_course"')]), 1)
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.enrolled_count,
+                         self.course.attend_instances.filter(deleted_by_carrier=False).count())
+
+    def test_full_course_and_approved_registration(self):
+        Course.objects.filter(pk=self.course.pk).update(capacity=self.course.enrolled_count)
+        self.assertEqual(self.client_for(self.carrier).post(self.route).status_code, 409)
+        attend = self.course.attend_instances.filter(status=CourseApprovalState.APPROVED)[0]
+        self.assertEqual(self.client_for(attend.carrier).delete(self.route).status_code, 409)
+
+
+class ResponseCacheCommitTests(TransactionTestCase):
+
+    def test_tags_are_bumped_again_on_commit(self):
+        with transaction.atomic():
+            College.objects.create(title='Science')
+            # what a request served before the commit would cache its response under
+            during = tag_versions(['department'])
+        self.assertNotEqual(tag_versions(['department']), during)
+
+
+class EnrollmentStressTests(TransactionTestCase):
+    """Many students race for the seats of a section from concurrent threads."""
+
+    USERS = 60
+    CAPACITY = 25
+
+    def setUp(self):
+        invalidate_term_catalogue()
+        cache.clear()
+        self.carriers, terms = seed_university()
+        self.course = Course.objects.filter(term=terms[1])[0]
+        Course.objects.filter(pk=self.course.pk).update(capacity=self.course.enrolled_count + self.CAPACITY)
+        self.contenders = []
+        for i in range(self.USERS):
+            user = User.objects.create_user(username='contender%d' % i, password='pass')
+            self.contenders.append(Carrier.objects.create(
+                id=9500 + i, login_profile=UserLoginProfile.objects.create(user=user),
+                student=Student.objects.create(first_name='Contender', last_name=str(i)),
+                subfield=self.carriers[0].subfield, status=CarrierStatusType.STUDYING,
+                admission_type_num=AdmissionType.ROOZANEH))
+
+    def test_concurrent_enrollments_never_overbook(self):
+        # the view is called directly: the test client re-raises exceptions of other threads' requests
+        view = CarrierEnrollmentView.as_view()
+        factory = APIRequestFactory()
+        statuses = []
+        start = threading.Barrier(self.USERS)
+
+        def register(carrier):
+            rnd = random.Random(carrier.pk)
+            start.wait()
+            deadline = time.monotonic() + 60
+            try:
+                while time.monotonic() < deadline:
+                    request = factory.post('/api/v1/carrier/enrollment/%d/' % self.course.pk)
+                    force_authenticate(request, user=carrier.login_profile.user)
+                    try:
+                        statuses.append(view(request, course_id=str(self.course.pk)).status_code)
+                        return
+                    except OperationalError:
+                        # the shared in-memory SQLite test database reports a locked table instead of waiting
+                        time.sleep(rnd.uniform(0.001, 0.02))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=register, args=(x,)) for x in self.contenders]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.course.refresh_from_db()
+        self.assertEqual(len(statuses), self.USERS)
+        self.assertEqual(statuses.count(201), self.CAPACITY)
+        self.assertEqual(statuses.count(409), self.USERS - self.CAPACITY)
+        self.assertEqual(self.course.enrolled_count, self.course.capacity)
+        self.assertEqual(self.course.attend_instances.filter(deleted_by_carrier=False).count(),
+                         self.course.capacity)
+        rate = len(statuses) / elapsed
+        self.assertGreater(rate, 1, '%.1f enrollment requests per second' % rate)
+
+
+class AdmissionControlTests(TestCase):
+
+    def test_slots_are_handed_to_clients_in_turn(self):
+        gate = Gate('route', limit=1, queue_size=10)
+        self.assertTrue(gate.enter('first', 1))
+        admitted = []
+
+        def request(client):
+            if gate.enter(client, 5):
+                admitted.append(client)
+                gate.leave()
+
+        threads = []
+        for client in ('greedy', 'greedy', 'greedy', 'polite'):
+            queued = gate.queued
+            threads.append(threading.Thread(target=request, args=(client,)))
+            threads[-1].start()
+            while gate.queued == queued:
+                time.sleep(0.001)
+        gate.leave()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(admitted, ['greedy', 'polite', 'greedy', 'greedy'])
+        metrics = gate.metrics()
+        self.assertEqual((metrics['active'], metrics['queue_depth'], metrics['admitted']), (0, 0, 5))
+
+    def test_full_queue_and_timeouts_shed_requests(self):
+        gate = Gate('route', limit=1, queue_size=0)
+        self.assertTrue(gate.enter('first', 1))
+        self.assertFalse(gate.enter('second', 1))
+        gate.queue_size = 1
+        self.assertFalse(gate.enter('second', 0.01))
+        self.assertEqual((gate.rejected, gate.timed_out, gate.queued, gate.waiting), (1, 1, 0, {}))
+
+    def test_middleware_answers_429_with_retry_after(self):
+        config = {'ENABLED': True, 'ROUTES': {r'^/api/v1/departments/': 0}, 'QUEUE_SIZE': 0,
+                  'QUEUE_TIMEOUT': 1, 'RETRY_AFTER': 7}
+        staff = User.objects.create_user(username='registrar', password='pass', is_staff=True)
+        with override_settings(ADMISSION_CONTROL=config):
+            client = APIClient()
+            client.force_authenticate(staff)
+            response = client.get('/api/v1/departments/')
+            self.assertEqual((response.status_code, response['Retry-After']), (429, '7'))
+            self.assertEqual(client.get('/api/v1/terms/').status_code, 200)
+            metrics = client.get('/admission/metrics/').data[r'^/api/v1/departments/']
+        self.assertEqual((metrics['rejected'], metrics['admitted']), (1, 0))
+
+
+class AsgiBridgeTests(TestCase):
+
+    def call(self, wsgi_application, method='GET', chunks=(b'',)):
+        messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                    for i, chunk in enumerate(chunks)]
+        sent = self.sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'http_version': '1.1', 'method': method, 'path': '/api/v1/terms/',
+                 'query_string': b'page=2', 'server': ('freshstart.ir', 80), 'client': ('127.0.0.1', 5000),
+                 'headers': [(b'host', b'freshstart.ir'), (b'content-type', b'text/plain')]}
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(WsgiApplication(wsgi_application, 2)(scope, receive, send))
+        finally:
+            loop.close()
+        return sent
+
+    def test_streams_the_wsgi_response_from_the_pool(self):
+        class Response(object):
+            closed = False
+
+            def __iter__(self):
+                yield threading.current_thread().name.encode()
+                yield environ['REQUEST_METHOD'].encode() + b' ' + environ['QUERY_STRING'].encode()
+                yield environ['CONTENT_TYPE'].encode() + b' ' + environ['HTTP_HOST'].encode()
+                yield environ['wsgi.input'].read()
+
+            def close(self):
+                self.closed = True
+
+        response, environ = Response(), {}
+
+        def echo(wsgi_environ, start_response):
+            environ.update(wsgi_environ)
+            start_response('201 Created', [('Content-Type', 'text/plain')])
+            return response
+
+        sent = self.call(echo, 'POST', (b'first,', b'second'))
+        self.assertEqual(sent[0], {'type': 'http.response.start', 'status': 201,
+                                   'headers': [(b'content-type', b'text/plain')]})
+        self.assertTrue(sent[1]['body'].startswith(b'django'))
+        self.assertEqual([x.get('body', b'') for x in sent[2:]],
+                         [b'POST page=2', b'text/plain freshstart.ir', b'first,second', b''])
+        self.assertEqual([x.get('more_body', False) for x in sent[1:]], [True, True, True, True, False])
+        self.assertTrue(response.closed)
+
+    def test_failure_while_streaming_is_not_a_complete_response(self):
+        def failing(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            yield b'partial'
+            raise RuntimeError('boom')
+
+        with self.assertRaises(RuntimeError):
+            self.call(failing)
+        # the server drops the connection instead of ending the body
+        self.assertEqual([x.get('body') for x in self.sent], [None, b'partial'])
+        self.assertTrue(self.sent[-1]['more_body'])
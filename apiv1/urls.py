@@ -7,12 +7,19 @@ urlpatterns = [
     path("carrier/terms/<term_id>/", CarrierTermDetailsListView.as_view()),
     path("carrier/terms/gradessummary/<term_id>/", TermSummaryView.as_view()),
     path("carrier/terms/preregistration/<term_id>/", CarrierPreRegistrationView.as_view()),
+    path("carrier/terms/clashes/<term_id>/", CarrierTimetableClashesView.as_view()),
+    path("carrier/terms/ranking/<term_id>/", CarrierTermRankingView.as_view()),
     path("courses/<course_id>/", CourseInformationView.as_view()),
+    path("courses/<course_id>/stats/", CourseStatsView.as_view()),
     path("carrier/records_summary/", CarrierRecordsSummaryView.as_view()),
     path("carrier/subfield_courses/", FieldCourseSubfieldRelationView.as_view()),
+    path("carrier/eligible_courses/", CarrierEligibleCoursesView.as_view()),
+    path("carrier/enrollment/<course_id>/", CarrierEnrollmentView.as_view()),
     path("departments/", DepartmentsView.as_view()),
     path("terms/", AllTermsView.as_view()),
     path("courses_schedule/<term_id>/<department_id>/", CoursesScheduleView.as_view()),
+    path("analytics/utilization/<term_id>/", UtilizationView.as_view()),
     path("course/<course_id>/student_list/", CourseStudentsListView.as_view()),
     path("course/<course_id>/grades/", StudentCourseGradesListView.as_view()),
+    path("course/<course_id>/grades/import/", CourseGradesImportView.as_view()),
 ]
@@ -1,10 +1,25 @@
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
+from rest_framework import status
 from rest_framework.generics import ListAPIView
+from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from .cache import CachedResponseMixin, carrier_snapshot
+from .pagination import PrimaryKeyCursorPagination, StreamingExportMixin
 from .serializers import *
 from users.models import *
 from users.utils import *
-from rest_framework.permissions import IsAuthenticated
+from users.aggregates import records_summary, term_summary
+from users.analytics import utilization
+from users.enrollment import AlreadyEnrolled, CourseFull, EnrollmentError, NotEnrolled, drop, enroll
+from users.catalogue import term_catalogue
+from users.course_stats import course_stats
+from users.grade_import import GradeSheetError, import_grades, read_sheet
+from users.prerequisites import course_graph
+from users.rankings import term_ranking
+from users.timetable import term_timetable
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 
 
 class CarrierMiniProfileListView(ListAPIView):
@@ -12,7 +27,13 @@ class CarrierMiniProfileListView(ListAPIView):
     serializer_class = CarrierDetailSerializer
 
     def get_queryset(self):
-        return Carrier.objects.filter(pk=self.request.user.user_login_profile.carrier.pk)
+        return Carrier.objects.filter(pk=self.request.user.user_login_profile.carrier.pk).select_related(
+            'student', 'subfield__field').with_academic_stats()
+
+    def list(self, request, *args, **kwargs):
+        parent = super(CarrierMiniProfileListView, self)
+        return Response(carrier_snapshot(request, 'mini_profile',
+                                         lambda: parent.list(request, *args, **kwargs).data))
 
 
 class CarrierTermsListView(ListAPIView):
@@ -29,16 +50,21 @@ class CarrierTermDetailsListView(ListAPIView):
 
     def get_queryset(self):
         term_id = self.kwargs['term_id']
-        return Attend.objects.filter(course__term__pk=term_id, carrier=self.request.user.user_login_profile.carrier)
+        courses = Course.objects.select_related('field_course__credit_detail').with_grade_stats()
+        return Attend.objects.filter(
+            course__term__pk=term_id, carrier=self.request.user.user_login_profile.carrier
+        ).with_course_type().prefetch_related(Prefetch('course', queryset=courses))
 
 
-class CourseStudentsListView(ListAPIView):
+class CourseStudentsListView(StreamingExportMixin, ListAPIView):
     permission_classes = [IsAuthenticated, ]
     serializer_class = AttendSerializerNoPic
+    pagination_class = PrimaryKeyCursorPagination
 
     def get_queryset(self):
         course_id = self.kwargs['course_id']
-        return Attend.objects.filter(course__pk=course_id)
+        return Attend.objects.filter(course__pk=course_id).select_related(
+            'carrier__student', 'carrier__subfield__field')
 
 
 class TermSummaryView(APIView):
@@ -50,82 +76,31 @@ class TermSummaryView(APIView):
         car = self.request.user.user_login_profile.carrier
         term_id = int(self.kwargs['term_id'])
 
-        carrier_attends = list(filter(lambda attend: attend.course.term.pk == term_id
-                                      and attend.carrier == car and not attend.deleted_by_carrier, Attend.objects.all()))
-
-        field_attends = list(filter(lambda attend: attend.course.term.pk == term_id
-                                    and attend.carrier.subfield.field == car.subfield.field
-                                    and not attend.grade == None, Attend.objects.all()))
-        department_attends = list(filter(lambda attend: attend.course.term.pk == term_id
-                                         and attend.carrier.subfield.field.head_department == car.subfield.field.head_department
-                                         and not attend.grade == None, Attend.objects.all()))
-        college_attends = list(filter(lambda attend: attend.course.term.pk == term_id
-                                      and attend.carrier.subfield.field.head_department.college == car.subfield.field.head_department.college
-                                      and not attend.grade == None, Attend.objects.all()))
-
-        mydata = {
-            'total_credits_taken': 0,
-            'total_credits_passed': 0,
-            'carrier_average': 0.0,
-            'field_average': 0.0,
-            'department_average': 0.0,
-            'college_average': 0.0
-        }
-
-        mydata["total_credits_taken"] = sum(
-            list(map(lambda x: x.course.field_course.credit, carrier_attends)))
-
-        carrier_attends = list(
-            filter(lambda attend: attend.course.are_grades_approved, carrier_attends))
-        temp = list(map(lambda x: (x.course.field_course.credit,
-                                   x.course.field_course.credit * x.grade), carrier_attends))
-
-        total_credits = sum(list(map(lambda x: x[0], temp)))
-        if total_credits == 0:
-            mydata["carrier_average"] = None
-        else:
-            mydata["carrier_average"] = round(sum(list(map(lambda x: x[1], temp))) / total_credits, 2)
-
-        carrier_attends = list(filter(lambda attend: attend.grade_status == get_key(
-            GradeState, GradeState.PASSED), carrier_attends))
-        mydata["total_credits_passed"] = sum(
-            list(map(lambda x: x.course.field_course.credit, carrier_attends)))
-
-        temp = list(map(lambda x: (x.course.field_course.credit,
-                                   x.course.field_course.credit * x.grade), field_attends))
-        total_credits = sum(list(map(lambda x: x[0], temp)))
-        if total_credits == 0:
-            mydata["field_average"] = None
-        else:
-            mydata["field_average"] = round(sum(list(map(lambda x: x[1], temp))) / total_credits, 2)
-
-        temp = list(map(lambda x: (x.course.field_course.credit,
-                                   x.course.field_course.credit * x.grade), department_attends))
-        total_credits = sum(list(map(lambda x: x[0], temp)))
-        if total_credits == 0:
-            mydata["department_average"] = None
-        else:
-            mydata["department_average"] = round(sum(list(map(lambda x: x[1], temp))) / total_credits, 2)
-
-        temp = list(map(lambda x: (x.course.field_course.credit,
-                                   x.course.field_course.credit * x.grade), college_attends))
-        total_credits = sum(list(map(lambda x: x[0], temp)))
-        if total_credits == 0:
-            mydata["college_average"] = None
-        else:
-            mydata["college_average"] = round(sum(list(map(lambda x: x[1], temp))) / total_credits, 2)
-
-        results = TermSummarySerializer(mydata, many=False).data
+        results = TermSummarySerializer(term_summary(car, term_id), many=False).data
         return Response(results)
 
 
+class CarrierTermRankingView(APIView):
+    """The carrier's term GPA with its rank and percentile in its field, department and college."""
+    permission_classes = [IsAuthenticated, ]
+
+    def get(self, request, *args, **kwargs):
+        car = self.request.user.user_login_profile.carrier
+        ranking = term_ranking(int(self.kwargs['term_id'])).rank(car.pk)
+        if ranking is None:
+            return Response({'detail': 'No graded course in this term.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ranking)
+
+
 class CarrierPreRegistrationView(ListAPIView):
     permission_classes = [IsAuthenticated, ]
     serializer_class = PreRegistrationSerializer
 
     def get_queryset(self):
         term_id = self.kwargs['term_id']
-        return PreliminaryRegistration.objects.filter(term__pk=term_id, carrier=self.request.user.user_login_profile.carrier)
+        return PreliminaryRegistration.objects.filter(
+            term__pk=term_id, carrier=self.request.user.user_login_profile.carrier
+        ).select_related('field_course__credit_detail')
 
 
 class CourseInformationView(ListAPIView):
@@ -134,115 +109,169 @@ class CourseInformationView(ListAPIView):
 
     def get_queryset(self):
         course_id = self.kwargs['course_id']
-        return Course.objects.filter(pk=course_id)
-
-
-class CarrierRecordsSummaryView(APIView):
+        return Course.objects.filter(pk=course_id).select_related(
+            'field_course__credit_detail', 'term', 'room',
+            'midterm_exam_date__day_range', 'final_exam_date__day_range'
+        ).prefetch_related(
+            Prefetch('teach_set', queryset=Teach.objects.select_related('professor')),
+            Prefetch('weekly_schedule', queryset=DayTime.objects.select_related('day_range')),
+            Prefetch('subfields', queryset=Subfield.objects.select_related('field')),
+            'departments')
+
+
+class CourseStatsView(APIView):
+    """Mean, min, max, standard deviation, pass rate and grade histogram of a course section."""
     permission_classes = [IsAuthenticated, ]
 
     def get(self, request, *args, **kwargs):
-        car = self.request.user.user_login_profile.carrier
-        temp_list = []
-
-        mydata = {
-            'term_title': " ",
-            'total_credits_taken': 0,
-            'total_credits_passed': 0,
-            'average': 0.0,
-            'credits_considered_in_average': 0,
-            'total_credits_taken_till_now': 0,
-            'total_credits_passed_till_now': 0,
-            'average_till_now': 0.0,
-            'credits_considered_in_average_till_now': 0
-        }
-
-        i = -1
-        for t in car.terms:
-            i += 1
+        course = get_object_or_404(Course.objects.only('pk', 'grades_status_num'), pk=self.kwargs['course_id'])
+        return Response(course_stats(course))
 
-            carrier_attends = list(filter(lambda attend: attend.course.term.pk == t.pk
-                                          and attend.carrier == car and not attend.deleted_by_carrier, Attend.objects.all()))
 
-            mydata["term_title"] = t.title
+class CarrierRecordsSummaryView(APIView):
+    permission_classes = [IsAuthenticated, ]
 
-            mydata["total_credits_taken"] = sum(
-                list(map(lambda x: x.course.field_course.credit, carrier_attends)))
+    def get(self, request, *args, **kwargs):
+        def compute():
+            car = self.request.user.user_login_profile.carrier
+            return CarrierRecordsSummarySerializer(records_summary(car), many=True).data
+        return Response(carrier_snapshot(request, 'records_summary', compute))
 
-            carrier_attends = list(
-                filter(lambda attend: attend.course.are_grades_approved, carrier_attends))
-            temp = list(map(lambda x: (x.course.field_course.credit,
-                                       x.course.field_course.credit * x.grade), carrier_attends))
 
-            total_credits = sum(list(map(lambda x: x[0], temp)))
-            mydata["credits_considered_in_average"] = total_credits
-            if total_credits == 0:
-                mydata["average"] = None
-            else:
-                mydata["average"] = round(sum(list(map(lambda x: x[1], temp))) / total_credits, 2)
+class FieldCourseSubfieldRelationView(CachedResponseMixin, ListAPIView):
+    permission_classes = [IsAuthenticated, ]
+    serializer_class = FieldCourseSubfieldRelationSerializer
+    cache_tags = ('field_course',)
 
-            carrier_attends = list(filter(lambda attend: attend.grade_status == get_key(
-                GradeState, GradeState.PASSED), carrier_attends))
-            mydata["total_credits_passed"] = sum(
-                list(map(lambda x: x.course.field_course.credit, carrier_attends)))
+    def cache_key_parts(self):
+        return [self.request.user.user_login_profile.carrier.subfield_id]
 
-            if i == 0:
-                mydata["total_credits_taken_till_now"] = mydata["total_credits_taken"]
-                mydata["total_credits_passed_till_now"] = mydata["total_credits_passed"]
-                mydata["average_till_now"] = mydata["average"]
-                mydata["credits_considered_in_average_till_now"] = mydata["credits_considered_in_average"]
-            else:
-                mydata["total_credits_taken_till_now"] = mydata["total_credits_taken"] + \
-                    temp_list[i-1]["total_credits_taken_till_now"]
-                mydata["total_credits_passed_till_now"] = mydata["total_credits_passed"] + \
-                    temp_list[i-1]["total_credits_passed_till_now"]
-                mydata["credits_considered_in_average_till_now"] = mydata["credits_considered_in_average"] + \
-                    temp_list[i-1]["credits_considered_in_average_till_now"]
+    def get_queryset(self):
+        carrier_subfield = self.request.user.user_login_profile.carrier.subfield
+        return FieldCourseSubfieldRelation.objects.filter(subfield=carrier_subfield).select_related(
+            'field_course__credit_detail')
 
-                mydata["average_till_now"] = round((mydata["average"] * mydata["credits_considered_in_average"] + temp_list[i-1]["average_till_now"] * temp_list[i-1]["credits_considered_in_average_till_now"]) / (mydata["credits_considered_in_average"] + temp_list[i-1]["credits_considered_in_average_till_now"]),2)
 
-            temp_list += [mydata.copy()]
+class CarrierEligibleCoursesView(APIView):
+    """
+    The courses of the carrier's subfield not passed yet, prerequisites
+    first, with whether every direct prerequisite is already passed.
+    """
+    permission_classes = [IsAuthenticated, ]
 
-        return Response(CarrierRecordsSummarySerializer(temp_list, many=True).data)
+    def get(self, request, *args, **kwargs):
+        user = self.request.user
+        courses = dict(FieldCourse.objects.filter(
+            subfields__carriers__login_profile__user=user).values_list('serial_number', 'title'))
+        passed = set(Attend.objects.filter(
+            carrier__login_profile__user=user, grade_state_num=GradeState.PASSED
+        ).values_list('course__field_course', flat=True))
+        graph = course_graph()
+        results = []
+        for course_id in graph.topological_order(set(courses) - passed):
+            missing = graph.missing_prerequisites(course_id, passed)
+            results.append({
+                'serial_number': course_id,
+                'title': courses[course_id],
+                'eligible': not missing,
+                'missing_prerequisites': missing,
+                'all_prerequisites': graph.topological_order(graph.closure(course_id)),
+                'corequisites': sorted(graph.corequisites.get(course_id, ())),
+            })
+        return Response(results)
 
 
-class FieldCourseSubfieldRelationView(ListAPIView):
+class CarrierEnrollmentView(APIView):
+    """POST takes a seat of the course for the carrier, DELETE gives an unapproved one back."""
     permission_classes = [IsAuthenticated, ]
-    serializer_class = FieldCourseSubfieldRelationSerializer
 
-    def get_queryset(self):
-        carrier_subfield = self.request.user.user_login_profile.carrier.subfield
-        return FieldCourseSubfieldRelation.objects.filter(subfield=carrier_subfield)
+    def post(self, request, *args, **kwargs):
+        car = self.request.user.user_login_profile.carrier
+        try:
+            attend = enroll(car, int(self.kwargs['course_id']))
+        except Course.DoesNotExist:
+            return Response({'detail': 'Course not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except (CourseFull, AlreadyEnrolled) as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({'course': attend.course_id, 'status': attend.carrier_course_status},
+                        status=status.HTTP_201_CREATED)
+
+    def delete(self, request, *args, **kwargs):
+        car = self.request.user.user_login_profile.carrier
+        try:
+            drop(car, int(self.kwargs['course_id']))
+        except NotEnrolled as e:
+            return Response({'detail': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except EnrollmentError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class DepartmentsView(ListAPIView):
+class DepartmentsView(CachedResponseMixin, ListAPIView):
     permission_classes = [IsAuthenticated, ]
     serializer_class = DepartmentSerializer
+    cache_tags = ('department',)
 
     def get_queryset(self):
-        return Department.objects.all()
+        return Department.objects.select_related('college')
 
 
-class AllTermsView(ListAPIView):
+class AllTermsView(CachedResponseMixin, ListAPIView):
     permission_classes = [IsAuthenticated, ]
     serializer_class = TermDetailSerializer
+    cache_tags = ('term',)
 
     def get_queryset(self):
-        temp_list = list(Term.objects.all())
-        temp_list.sort(key=lambda x: x.title)
-        return temp_list
+        return list(term_catalogue())
 
 
-class CoursesScheduleView(ListAPIView):
+class CarrierTimetableClashesView(APIView):
+    """
+    The weekly class and exam clashes of the carrier's courses in a term;
+    `?source=preregistration` checks the preliminary registration instead.
+    """
+    permission_classes = [IsAuthenticated, ]
+
+    def get(self, request, *args, **kwargs):
+        user = self.request.user
+        term_id = int(self.kwargs['term_id'])
+        timetable = term_timetable(term_id)
+        if request.query_params.get('source') == 'preregistration':
+            field_course_ids = PreliminaryRegistration.objects.filter(
+                carrier__login_profile__user=user, term__pk=term_id).values_list('field_course', flat=True)
+            return Response(timetable.field_course_clashes(field_course_ids))
+        course_ids = Attend.objects.filter(
+            carrier__login_profile__user=user, course__term__pk=term_id, deleted_by_carrier=False
+        ).values_list('course', flat=True)
+        return Response(timetable.clashes(course_ids))
+
+
+class CoursesScheduleView(StreamingExportMixin, CachedResponseMixin, ListAPIView):
     permission_classes = [IsAuthenticated, ]
     serializer_class = CourseInformationSummarySerializer
+    pagination_class = PrimaryKeyCursorPagination
+    cache_tags = ('course', 'field_course')
 
     def get_queryset(self):
         term_id = self.kwargs['term_id']
         department_id = self.kwargs['department_id']
 
-        return Course.objects.filter(department__pk=department_id, term__pk=term_id)
+        return Course.objects.filter(department__pk=department_id, term__pk=term_id).select_related(
+            'field_course__credit_detail')
+
 
 
+class UtilizationView(APIView):
+    """Room occupancy, professor load and capacity fill of a term, optionally of one `?department=`."""
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request, *args, **kwargs):
+        department_id = request.query_params.get('department')
+        if department_id is not None and not department_id.isdigit():
+            return Response({'detail': 'department must be a department id.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(utilization(int(self.kwargs['term_id']),
+                                    int(department_id) if department_id is not None else None))
+
 
 class StudentCourseGradesListView(ListAPIView):
 
@@ -268,3 +297,24 @@ class StudentCourseGradesListView(ListAPIView):
         response_list = serializer.data 
         response_list.append(custom_dict)
         return Response(response_list)
+
+
+class CourseGradesImportView(APIView):
+    """
+    Import a grade sheet (.csv or .xlsx) uploaded as `sheet`; `dry_run=1`
+    only validates it. Any row error rejects the whole sheet.
+    """
+    permission_classes = [IsAdminUser, ]
+    parser_classes = [MultiPartParser, ]
+
+    def post(self, request, *args, **kwargs):
+        course = get_object_or_404(Course, pk=self.kwargs['course_id'])
+        sheet = request.FILES.get('sheet')
+        if sheet is None:
+            return Response({'detail': 'Upload the grade sheet as "sheet".'}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = request.data.get('dry_run', '') not in ('', '0', 'false')
+        try:
+            report = import_grades(course, read_sheet(sheet.read(), sheet.name), dry_run=dry_run)
+        except GradeSheetError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_400_BAD_REQUEST if report['errors'] else status.HTTP_200_OK)
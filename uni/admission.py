@@ -0,0 +1,155 @@
+"""
+Admission control for the registration rush.
+
+Requests whose path matches one of `ADMISSION_CONTROL['ROUTES']` share that
+route's limited number of slots. The excess waits in a queue that hands a
+freed slot to the waiting clients in turn (round-robin per token, session or
+address), so a client firing many requests cannot starve the others. A
+request is shed with `429 Too Many Requests` and `Retry-After` when the queue
+is full or it waited longer than `QUEUE_TIMEOUT`.
+
+Slots are counted per process, so this only helps servers that handle
+requests in threads (gunicorn --threads, Passenger's threaded mode).
+"""
+import collections
+import hashlib
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+# the latest gate of every route pattern, for the metrics view
+_gates = collections.OrderedDict()
+
+RECENT_WAITS = 1000
+
+
+class Gate(object):
+
+    def __init__(self, pattern, limit, queue_size):
+        self.pattern = pattern
+        self.limit = limit
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.active = 0
+        self.queued = 0
+        self.waiting = collections.OrderedDict()
+        self.admitted = self.rejected = self.timed_out = 0
+        self.waits = collections.deque(maxlen=RECENT_WAITS)
+
+    def enter(self, client, timeout):
+        """Wait for a slot; False when the request has to be shed."""
+        with self.lock:
+            if self.active < self.limit and not self.queued:
+                self.active += 1
+                self.admitted += 1
+                self.waits.append(0.0)
+                return True
+            if self.queued >= self.queue_size:
+                self.rejected += 1
+                return False
+            ticket = threading.Event()
+            self.waiting.setdefault(client, collections.deque()).append(ticket)
+            self.queued += 1
+        started = time.monotonic()
+        ticket.wait(timeout)
+        with self.lock:
+            # a slot may have been handed over between the timeout and the lock
+            if not ticket.is_set():
+                tickets = self.waiting[client]
+                tickets.remove(ticket)
+                if not tickets:
+                    del self.waiting[client]
+                self.queued -= 1
+                self.timed_out += 1
+                return False
+            self.admitted += 1
+            self.waits.append(time.monotonic() - started)
+        return True
+
+    def leave(self):
+        """Free the slot, or hand it to the next client in turn."""
+        with self.lock:
+            if not self.waiting:
+                self.active -= 1
+                return
+            client, tickets = next(iter(self.waiting.items()))
+            ticket = tickets.popleft()
+            if tickets:
+                self.waiting.move_to_end(client)
+            else:
+                del self.waiting[client]
+            self.queued -= 1
+            ticket.set()
+
+    def metrics(self):
+        with self.lock:
+            waits = sorted(self.waits)
+            return {
+                'limit': self.limit,
+                'active': self.active,
+                'queue_depth': self.queued,
+                'queued_clients': len(self.waiting),
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'wait_p50_ms': _wait_ms(waits, 0.50),
+                'wait_p95_ms': _wait_ms(waits, 0.95),
+                'wait_max_ms': _wait_ms(waits, 1.0),
+            }
+
+
+def _wait_ms(waits, fraction):
+    if not waits:
+        return None
+    return round(waits[min(len(waits) - 1, int(fraction * len(waits)))] * 1000, 2)
+
+
+def client_key(request):
+    """Who a request counts for: its token, else its session, else its address."""
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if credentials:
+        return hashlib.md5(credentials.encode()).hexdigest()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class AdmissionControlMiddleware(object):
+
+    def __init__(self, get_response):
+        config = settings.ADMISSION_CONTROL
+        if not config.get('ENABLED'):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.timeout = config['QUEUE_TIMEOUT']
+        self.retry_after = config['RETRY_AFTER']
+        self.gates = []
+        for pattern, limit in config['ROUTES'].items():
+            gate = _gates[pattern] = Gate(pattern, limit, config['QUEUE_SIZE'])
+            self.gates.append((re.compile(pattern), gate))
+
+    def __call__(self, request):
+        gate = next((gate for regex, gate in self.gates if regex.match(request.path_info)), None)
+        if gate is None:
+            return self.get_response(request)
+        if not gate.enter(client_key(request), self.timeout):
+            response = JsonResponse({'detail': 'Too many requests, please retry later.'}, status=429)
+            response['Retry-After'] = str(self.retry_after)
+            return response
+        try:
+            return self.get_response(request)
+        finally:
+            gate.leave()
+
+
+class AdmissionMetricsView(APIView):
+    """Slots, queue depth and wait times of every admission-controlled route of this process."""
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request, *args, **kwargs):
+        return Response({pattern: gate.metrics() for pattern, gate in _gates.items()})
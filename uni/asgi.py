@@ -0,0 +1,65 @@
+"""
+ASGI config for uni project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+e.g. for ``uvicorn uni.asgi:application``.
+
+Django only ships an ASGI handler from 3.0 on. Older versions are served
+through asgiref's ``WsgiToAsgi``: the event loop holds the connections and
+reads request bodies, and the Django work of each request runs on the
+default executor of the loop, which is set to a pool bounded by
+``settings.ASGI_THREADS``. Slow clients therefore no longer tie up a worker,
+only in-flight Django work does. asgiref is pinned below 3.3, where
+``WsgiToAsgi`` started running every request on a single thread.
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.wsgi import WsgiToAsgi
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'uni.settings')
+
+
+def closing(wsgi_application):
+    """Close the WSGI response once sent, which `WsgiToAsgi` leaves out (Django sends request_finished then)."""
+    def application(environ, start_response):
+        result = wsgi_application(environ, start_response)
+        try:
+            yield from result
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+    return application
+
+
+class WsgiApplication(WsgiToAsgi):
+    """`WsgiToAsgi` on a pool of `threads` threads, answering the lifespan protocol."""
+
+    def __init__(self, wsgi_application, threads):
+        super(WsgiApplication, self).__init__(closing(wsgi_application))
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='django')
+
+    async def __call__(self, scope, receive, send):
+        asyncio.get_event_loop().set_default_executor(self.executor)
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        await super(WsgiApplication, self).__call__(scope, receive, send)
+
+
+try:
+    from django.core.asgi import get_asgi_application
+except ImportError:
+    from django.conf import settings
+    from django.core.wsgi import get_wsgi_application
+
+    application = WsgiApplication(get_wsgi_application(), settings.ASGI_THREADS)
+else:
+    application = get_asgi_application()
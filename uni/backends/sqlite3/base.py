@@ -0,0 +1,23 @@
+"""
+The SQLite backend, setting the `PRAGMAS` of the database settings on every
+new connection and beginning transactions in the mode set by their
+`TRANSACTION_MODE` key (DEFERRED, IMMEDIATE or EXCLUSIVE).
+
+A DEFERRED transaction that reads before it writes cannot wait for the
+write lock: SQLite fails it with "database is locked" at once, whatever
+the busy timeout. IMMEDIATE takes the write lock on BEGIN, where the busy
+timeout does apply.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN %s' % self.settings_dict.get('TRANSACTION_MODE', 'DEFERRED'))
+
+    def get_new_connection(self, conn_params):
+        conn = super(DatabaseWrapper, self).get_new_connection(conn_params)
+        for name, value in self.settings_dict.get('PRAGMAS', {}).items():
+            conn.execute('PRAGMA %s = %s' % (name, value))
+        return conn
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'uni.admission.AdmissionControlMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -75,17 +76,99 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'uni.wsgi.application'
 
+# threads running the Django work of uni.asgi requests, per process
+ASGI_THREADS = int(os.environ.get('UNI_ASGI_THREADS', 16))
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
+# UNI_DB_ENGINE is sqlite or postgres (needs psycopg2). With postgres,
+# UNI_DB_POOLING is persistent (every process keeps its connections for
+# UNI_DB_CONN_MAX_AGE seconds) or pgbouncer (connect to a pgbouncer in
+# transaction pooling mode, which rules out server-side cursors).
+# `manage.py bench_db` compares these configurations under concurrent load.
+
+UNI_DB_ENGINE = os.environ.get('UNI_DB_ENGINE', 'sqlite')
+UNI_DB_POOLING = os.environ.get('UNI_DB_POOLING', 'persistent')
+
+if UNI_DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('UNI_DB_NAME', 'uni'),
+            'USER': os.environ.get('UNI_DB_USER', 'uni'),
+            'PASSWORD': os.environ.get('UNI_DB_PASSWORD', ''),
+            'HOST': os.environ.get('UNI_DB_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('UNI_DB_PORT', '6432' if UNI_DB_POOLING == 'pgbouncer' else '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('UNI_DB_CONN_MAX_AGE', 60)),
+            'DISABLE_SERVER_SIDE_CURSORS': UNI_DB_POOLING == 'pgbouncer',
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'uni.backends.sqlite3',
+            'NAME': os.environ.get('UNI_DB_NAME', os.path.join(BASE_DIR, 'db.sqlite3')),
+            'CONN_MAX_AGE': int(os.environ.get('UNI_DB_CONN_MAX_AGE', 60)),
+            # transactions take the write lock upfront, so they wait for it (see uni.backends.sqlite3)
+            'TRANSACTION_MODE': os.environ.get('UNI_SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            # applied to every new connection; WAL lets readers run alongside
+            # the single writer instead of waiting for it
+            'PRAGMAS': {
+                'journal_mode': os.environ.get('UNI_SQLITE_JOURNAL_MODE', 'wal'),
+                'synchronous': 'normal',
+            },
+            'OPTIONS': {
+                # seconds a writer waits for the lock before "database is locked"
+                'timeout': float(os.environ.get('UNI_SQLITE_BUSY_TIMEOUT', 20)),
+            },
+        }
+    }
+
 
-DATABASES = {
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# UNI_CACHE_BACKEND is one of locmem, file or redis (needs django-redis).
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django_redis.cache.RedisCache',
+}
+CACHE_LOCATIONS = {
+    'locmem': 'uni',
+    'file': os.path.join(BASE_DIR, 'cache'),
+    'redis': 'redis://127.0.0.1:6379/1',
+}
+UNI_CACHE_BACKEND = os.environ.get('UNI_CACHE_BACKEND', 'locmem')
+# locmem is private to each process, out of reach of the signals of other
+# workers: there, entries meant to live until the next change only live for
+# LOCAL_CACHE_TIMEOUT seconds. Use file or redis with several workers.
+SHARED_CACHE = UNI_CACHE_BACKEND != 'locmem'
+LOCAL_CACHE_TIMEOUT = 30
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'BACKEND': CACHE_BACKENDS[UNI_CACHE_BACKEND],
+        'LOCATION': os.environ.get('UNI_CACHE_LOCATION', CACHE_LOCATIONS[UNI_CACHE_BACKEND]),
     }
 }
 
+# cache alias and timeout of the catalogue endpoints' responses (apiv1.cache)
+API_RESPONSE_CACHE = 'default'
+API_RESPONSE_CACHE_TIMEOUT = 60 * 60 if SHARED_CACHE else LOCAL_CACHE_TIMEOUT
+# the tag versions, kept until replaced by a change when shared
+API_RESPONSE_TAG_TIMEOUT = None if SHARED_CACHE else LOCAL_CACHE_TIMEOUT
+# per-carrier mini_profile and records_summary payloads, invalidated on grade changes
+CARRIER_SNAPSHOT_TIMEOUT = 24 * 60 * 60 if SHARED_CACHE else LOCAL_CACHE_TIMEOUT
+# statistics of courses with approved grades (users.course_stats)
+COURSE_STATS_TIMEOUT = 24 * 60 * 60
+# per-term GPA rankings (users.rankings), updated in place when grades change
+TERM_RANKING_TIMEOUT = 24 * 60 * 60 if SHARED_CACHE else LOCAL_CACHE_TIMEOUT
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -151,3 +234,23 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.SessionAuthentication',
     )
 }
+
+
+# Admission control (uni.admission), enabled with UNI_ADMISSION_CONTROL=1.
+# Requests matching a route pattern share its number of concurrent slots;
+# the excess is queued fairly per client and shed with 429 when the queue is
+# full or the wait exceeds QUEUE_TIMEOUT seconds.
+
+ADMISSION_CONTROL = {
+    'ENABLED': os.environ.get('UNI_ADMISSION_CONTROL') == '1',
+    'ROUTES': {
+        r'^/api/v1/carrier/enrollment/': 8,
+        r'^/api/v1/carrier/terms/gradessummary/': 4,
+        r'^/api/v1/carrier/records_summary/': 8,
+        r'^/api/v1/course/\d+/grades/import/': 2,
+        r'^/api/v1/analytics/': 2,
+    },
+    'QUEUE_SIZE': 200,
+    'QUEUE_TIMEOUT': 10,
+    'RETRY_AFTER': 5,
+}
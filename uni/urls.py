@@ -17,6 +17,7 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.authtoken import views
 from uni import settings
+from uni.admission import AdmissionMetricsView
 from django.conf.urls.static import static
 
 
@@ -26,6 +27,7 @@ urlpatterns = [
 
 urlpatterns += [
     path('api-token-auth/', views.obtain_auth_token),
+    path('admission/metrics/', AdmissionMetricsView.as_view()),
     path('users/', include("users.urls")),
     path('api/v1/', include("apiv1.urls"))
 ]
@@ -0,0 +1,112 @@
+from django.db.models import ExpressionWrapper, F, FloatField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import *
+from .rollups import is_rolled_up, is_term_rolled_up, term_summary_from_rollups
+
+
+def weighted_average(weighted_sum, credits):
+    if not credits:
+        return None
+    return round(weighted_sum / credits, 2)
+
+
+def term_summary(carrier, term_id):
+    """
+    Everything `TermSummarySerializer` needs, read from the term's rollups
+    when they are up to date, else computed by a single aggregate query over
+    the attends of the carrier's college in the given term.
+    """
+    scope = Carrier.objects.filter(pk=carrier.pk).annotate(rolled_up=is_term_rolled_up(term_id)).values(
+        'subfield__field', 'subfield__field__head_department',
+        'subfield__field__head_department__college', 'rolled_up').get()
+    if scope['rolled_up']:
+        return term_summary_from_rollups(carrier, term_id, scope)
+
+    credit = credit_expression('course__')
+    graded = Q(final_grade__isnull=False)
+    own = Q(carrier=carrier)
+    same_field = Q(carrier__subfield__field=scope['subfield__field'])
+    same_department = Q(
+        carrier__subfield__field__head_department=scope['subfield__field__head_department'])
+
+    def credits_sum(condition):
+        return Coalesce(Sum(credit, filter=condition), Value(0))
+
+    def weighted_sum(condition):
+        return Coalesce(Sum(ExpressionWrapper(credit * F('final_grade'), output_field=FloatField()),
+                            filter=condition & graded), Value(0.0))
+
+    totals = Attend.objects.filter(
+        course__term__pk=term_id,
+        carrier__subfield__field__head_department__college=scope['subfield__field__head_department__college']
+    ).aggregate(
+        taken=credits_sum(own & Q(deleted_by_carrier=False)),
+        passed=credits_sum(own & Q(grade_state_num=GradeState.PASSED)),
+        carrier_credits=credits_sum(own & graded),
+        carrier_weighted=weighted_sum(own),
+        field_credits=credits_sum(same_field & graded),
+        field_weighted=weighted_sum(same_field),
+        department_credits=credits_sum(same_department & graded),
+        department_weighted=weighted_sum(same_department),
+        college_credits=credits_sum(graded),
+        college_weighted=weighted_sum(Q()),
+    )
+
+    return {
+        'total_credits_taken': totals['taken'],
+        'total_credits_passed': totals['passed'],
+        'carrier_average': weighted_average(totals['carrier_weighted'], totals['carrier_credits']),
+        'field_average': weighted_average(totals['field_weighted'], totals['field_credits']),
+        'department_average': weighted_average(totals['department_weighted'], totals['department_credits']),
+        'college_average': weighted_average(totals['college_weighted'], totals['college_credits']),
+    }
+
+
+def records_summary(carrier):
+    """
+    The carrier's transcript, one entry per term as `CarrierRecordsSummarySerializer`
+    expects, with the cumulative "till_now" figures of every term up to it.
+    Loads the terms and then either the carrier's rollups, when every term
+    is rolled up, or its attends, in two queries and walks them once.
+    """
+    terms = list(carrier.term_queryset.select_related('rollup_state'))
+    per_term = {term.pk: {'taken': 0, 'passed': 0, 'credits': 0, 'weighted': 0.0} for term in terms}
+    if all(is_rolled_up(term) for term in terms):
+        rollups = TermCarrierRollup.objects.filter(carrier=carrier).values_list(
+            'term', 'credits_taken', 'credits_passed', 'credits_weighted', 'grade_sum')
+        for term_id, taken, passed, credits, weighted in rollups:
+            per_term[term_id].update(taken=taken, passed=passed, credits=credits, weighted=weighted)
+    else:
+        attends = Attend.objects.filter(carrier=carrier).annotate(credit=credit_expression('course__')).values_list(
+            'course__term', 'credit', 'deleted_by_carrier', 'final_grade', 'grade_state_num')
+        for term_id, credit, deleted, final_grade, grade_state in attends:
+            totals = per_term[term_id]
+            if not deleted:
+                totals['taken'] += credit
+            if final_grade is not None:
+                totals['credits'] += credit
+                totals['weighted'] += credit * final_grade
+                if grade_state == GradeState.PASSED:
+                    totals['passed'] += credit
+
+    records = []
+    taken = passed = credits = 0
+    weighted = 0.0
+    for term in terms:
+        totals = per_term[term.pk]
+        taken += totals['taken']
+        passed += totals['passed']
+        credits += totals['credits']
+        weighted += totals['weighted']
+        records.append({
+            'term_title': term.title,
+            'total_credits_taken': totals['taken'],
+            'total_credits_passed': totals['passed'],
+            'average': weighted_average(totals['weighted'], totals['credits']),
+            'credits_considered_in_average': totals['credits'],
+            'total_credits_taken_till_now': taken,
+            'total_credits_passed_till_now': passed,
+            'average_till_now': weighted_average(weighted, credits),
+            'credits_considered_in_average_till_now': credits,
+        })
+    return records
@@ -0,0 +1,97 @@
+"""
+Room, professor and capacity utilization of a term.
+
+Everything is grouped and summed in SQL. Class lengths are the one thing
+computed in Python: the portable way to get them in Django 2.1 is to count
+the weekly slots per `DayRange` in SQL and multiply each count by that
+range's length, read from the (small) `DayRange` table.
+"""
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Q, Sum
+from .models import *
+from .utils import credit_expression
+
+
+def _hours(day_range):
+    start = day_range.start.hour * 60 + day_range.start.minute
+    end = day_range.end.hour * 60 + day_range.end.minute
+    return (end - start) / 60.0
+
+
+def _fill_rate(registered, capacity):
+    if not capacity:
+        return None
+    return round(registered * 100.0 / capacity, 2)
+
+
+def utilization(term_id, department_id=None):
+    """Weekly room occupancy, professor teaching load and capacity fill of a term."""
+    courses = Q(course__term__pk=term_id)
+    if department_id is not None:
+        courses &= Q(course__department__pk=department_id)
+    hours = {x.pk: _hours(x) for x in DayRange.objects.all()}
+
+    rooms = {}
+    slots = DayTimeCourseRelation.objects.filter(courses).values(
+        'course__room', 'course__room__title', 'course__room__place', 'day_time__day_range').annotate(
+        sessions=Count('pk')).order_by()
+    for row in slots:
+        room = rooms.setdefault(row['course__room'], {
+            'room': row['course__room'],
+            'title': '%s %s' % (row['course__room__title'], row['course__room__place']),
+            'weekly_sessions': 0,
+            'weekly_hours': 0.0,
+        })
+        room['weekly_sessions'] += row['sessions']
+        room['weekly_hours'] += row['sessions'] * hours[row['day_time__day_range']]
+
+    professors = {}
+    teaching = Teach.objects.filter(courses).values(
+        'professor', 'professor__first_name', 'professor__last_name').annotate(
+        courses=Count('course'),
+        weighted_courses=Sum(ExpressionWrapper(F('percentage') / 100.0, output_field=FloatField())),
+        weighted_credits=Sum(ExpressionWrapper(credit_expression('course__') * F('percentage') / 100.0,
+                                               output_field=FloatField()))).order_by()
+    for row in teaching:
+        professors[row['professor']] = {
+            'professor': row['professor'],
+            'name': '%s %s' % (row['professor__first_name'], row['professor__last_name']),
+            'courses': row['courses'],
+            'weighted_courses': round(row['weighted_courses'], 2),
+            'weighted_credits': round(row['weighted_credits'], 2),
+            'weighted_weekly_hours': 0.0,
+        }
+    teaching_slots = Teach.objects.filter(courses, course__weekly_schedule__isnull=False).values(
+        'professor', 'course__weekly_schedule__day_range').annotate(weight=Sum('percentage')).order_by()
+    for row in teaching_slots:
+        professors[row['professor']]['weighted_weekly_hours'] += (
+            row['weight'] / 100.0 * hours[row['course__weekly_schedule__day_range']])
+
+    departments = {}
+    capacities = Course.objects.filter(term__pk=term_id).values('department', 'department__title').annotate(
+        courses=Count('pk'), capacity=Sum('capacity')).order_by()
+    if department_id is not None:
+        capacities = capacities.filter(department__pk=department_id)
+    for row in capacities:
+        departments[row['department']] = {
+            'department': row['department'],
+            'title': row['department__title'],
+            'courses': row['courses'],
+            'capacity': row['capacity'],
+            'registered': 0,
+        }
+    registered = Attend.objects.filter(courses, deleted_by_carrier=False).values('course__department').annotate(
+        registered=Count('pk')).order_by()
+    for row in registered:
+        departments[row['course__department']]['registered'] = row['registered']
+    for department in departments.values():
+        department['fill_rate'] = _fill_rate(department['registered'], department['capacity'])
+
+    for room in rooms.values():
+        room['weekly_hours'] = round(room['weekly_hours'], 2)
+    for professor in professors.values():
+        professor['weighted_weekly_hours'] = round(professor['weighted_weekly_hours'], 2)
+    return {
+        'rooms': sorted(rooms.values(), key=lambda x: (-x['weekly_hours'], x['room'])),
+        'professors': sorted(professors.values(), key=lambda x: (-x['weighted_credits'], x['professor'])),
+        'departments': sorted(departments.values(), key=lambda x: x['department']),
+    }
@@ -0,0 +1,30 @@
+"""
+Process-level caches of catalogue data that changes a few times a year.
+
+Each process invalidates its own copy through model signals (see
+`users.signals`); the time-to-live bounds how long another worker
+process may keep serving a stale copy.
+"""
+import time
+
+from .models import Term
+
+TERMS_TTL = 60
+
+_terms = None
+_terms_loaded_at = 0.0
+
+
+def term_catalogue():
+    """Every term, in academic order."""
+    global _terms, _terms_loaded_at
+    terms = _terms
+    if terms is None or time.monotonic() - _terms_loaded_at > TERMS_TTL:
+        terms = tuple(Term.objects.all())
+        _terms, _terms_loaded_at = terms, time.monotonic()
+    return terms
+
+
+def invalidate_term_catalogue():
+    global _terms
+    _terms = None
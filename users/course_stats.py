@@ -0,0 +1,94 @@
+"""
+Grade statistics of a course section.
+
+Everything, histogram included, comes from one aggregate over the stored
+`Attend.final_grade` of the section; the variance is derived from the
+average of the squared grades. Once the grades of a course are approved the
+numbers are frozen, so they are kept in the cache until a signal reports a
+change to the course, one of its attends or one of their grades (or, for
+the other processes of a per-process cache, `COURSE_STATS_TIMEOUT`).
+"""
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, Count, ExpressionWrapper, F, FloatField, Max, Min, Q
+from .models import *
+
+STATS_KEY = 'users:course_stats:%s'
+
+PASSING_GRADE = 10
+HISTOGRAM_BUCKETS = 20
+HISTOGRAM_MAX = 20.0
+
+
+def _bucket_bounds(index):
+    width = HISTOGRAM_MAX / HISTOGRAM_BUCKETS
+    return index * width, (index + 1) * width
+
+
+def _bucket_filter(index):
+    """The first and last bucket also take the grades below 0 and from 20 on."""
+    start, end = _bucket_bounds(index)
+    bucket = Q()
+    if index > 0:
+        bucket &= Q(final_grade__gte=start)
+    if index < HISTOGRAM_BUCKETS - 1:
+        bucket &= Q(final_grade__lt=end)
+    return bucket
+
+
+def compute_course_stats(course):
+    """Mean, min, max, standard deviation, pass rate and histogram of the graded attends of a course."""
+    aggregates = {
+        'count': Count('pk'),
+        'mean': Avg('final_grade'),
+        'min': Min('final_grade'),
+        'max': Max('final_grade'),
+        'mean_square': Avg(ExpressionWrapper(F('final_grade') * F('final_grade'), output_field=FloatField())),
+        'passed': Count('pk', filter=Q(final_grade__gte=PASSING_GRADE)),
+    }
+    for index in range(HISTOGRAM_BUCKETS):
+        aggregates['bucket_%d' % index] = Count('pk', filter=_bucket_filter(index))
+    row = Attend.objects.filter(course=course, final_grade__isnull=False).aggregate(**aggregates)
+
+    stats = {
+        'course': course.pk,
+        'grades_status': course.grades_status,
+        'count': row['count'],
+        'mean': None,
+        'min': row['min'],
+        'max': row['max'],
+        'std': None,
+        'pass_rate': None,
+        'histogram': [],
+    }
+    if row['count']:
+        stats['mean'] = round(row['mean'], 2)
+        # population deviation; rounding errors may push the variance slightly below zero
+        stats['std'] = round(math.sqrt(max(0.0, row['mean_square'] - row['mean'] ** 2)), 2)
+        stats['pass_rate'] = round(row['passed'] * 100.0 / row['count'], 2)
+    for index in range(HISTOGRAM_BUCKETS):
+        start, end = _bucket_bounds(index)
+        stats['histogram'].append({'start': start, 'end': end, 'count': row['bucket_%d' % index]})
+    return stats
+
+
+def course_stats(course):
+    """The statistics of a course, from the cache once its grades are approved."""
+    if not course.are_grades_approved:
+        return compute_course_stats(course)
+    key = STATS_KEY % course.pk
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_course_stats(course)
+        cache.set(key, stats, settings.COURSE_STATS_TIMEOUT)
+    return stats
+
+
+def invalidate_course_stats(course_id):
+    """Drop the cached statistics now, and again once the current transaction commits."""
+    key = STATS_KEY % course_id
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
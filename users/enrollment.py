@@ -0,0 +1,63 @@
+"""
+Enrollment of carriers in course sections.
+
+A seat is taken by a conditional `UPDATE ... SET enrolled_count =
+enrolled_count + 1 WHERE enrolled_count < capacity`: the database decides
+atomically whether a seat is left, so concurrent requests can never overbook
+a section, and the attend is created in the same transaction as the update.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import *
+
+
+class EnrollmentError(Exception):
+    """The carrier cannot be enrolled in or dropped from the course."""
+
+
+class CourseFull(EnrollmentError):
+    pass
+
+
+class AlreadyEnrolled(EnrollmentError):
+    pass
+
+
+class NotEnrolled(EnrollmentError):
+    pass
+
+
+def enroll(carrier, course_id):
+    """
+    Take a seat of the course for the carrier and return the new attend.
+    Raises `Course.DoesNotExist` for an unknown course.
+    """
+    try:
+        with transaction.atomic():
+            # taking the seat first locks the course row before anything is read
+            seats = Course.objects.filter(pk=course_id, enrolled_count__lt=F('capacity')).update(
+                enrolled_count=F('enrolled_count') + 1)
+            if not seats:
+                Course.objects.filter(pk=course_id).get()
+                if Attend.objects.filter(course__pk=course_id, carrier=carrier).exists():
+                    raise AlreadyEnrolled('Already registered in this course.')
+                raise CourseFull('The course is full.')
+            attend = Attend(course_id=course_id, carrier=carrier, status=CourseApprovalState.NOT_APPROVED)
+            # counted by the update above, so the post_save receiver need not recount the course
+            attend.seat_counted = True
+            attend.save(force_insert=True)
+            return attend
+    except IntegrityError:
+        # the unique (course, carrier) attend exists, the seat taken above is rolled back
+        raise AlreadyEnrolled('Already registered in this course.')
+
+
+def drop(carrier, course_id):
+    """Give the carrier's seat back, as long as the registration is not approved yet."""
+    with transaction.atomic():
+        attend = Attend.objects.select_for_update().filter(course__pk=course_id, carrier=carrier).first()
+        if attend is None:
+            raise NotEnrolled('Not registered in this course.')
+        if attend.status != CourseApprovalState.NOT_APPROVED:
+            raise EnrollmentError('The registration is already approved.')
+        attend.delete()
@@ -0,0 +1,183 @@
+"""
+Bulk import of a course's grade sheet.
+
+A sheet has one row per grade item with the columns `carrier`, `title`,
+`value` and optionally `base_value` and `out_of_twenty`. A row replaces the
+carrier's grade of the same title and adds it when there is none. The sheet is
+checked against the course's attends and existing grades in two queries and,
+only if no row has an error, written in one transaction: new grades with
+`bulk_create`, changed ones with batched `UPDATE ... CASE` statements, and the
+stored final grades of the course refreshed once at the end.
+"""
+import csv
+import io
+import math
+
+from django.db import transaction
+from django.db.models import Case, FloatField, Value, When
+from .models import *
+from .signals import grades_imported
+
+COLUMNS = ('carrier', 'title', 'value', 'base_value', 'out_of_twenty')
+REQUIRED_COLUMNS = ('carrier', 'title', 'value')
+# primary keys per UPDATE, each costs seven SQL parameters
+UPDATE_BATCH_SIZE = 100
+
+
+class GradeSheetError(Exception):
+    """The sheet as a whole cannot be read."""
+
+
+def read_sheet(data, filename):
+    """The rows of a `.csv` or `.xlsx` sheet as dicts keyed by the header row."""
+    if filename.lower().endswith('.xlsx'):
+        rows = _xlsx_rows(data)
+    elif filename.lower().endswith('.csv'):
+        try:
+            rows = _csv_rows(data.decode('utf-8-sig'))
+        except UnicodeDecodeError:
+            raise GradeSheetError('CSV sheets must be UTF-8 encoded.')
+    else:
+        raise GradeSheetError('Unsupported sheet format, expected .csv or .xlsx.')
+
+    rows = iter(rows)
+    header = [str(x).strip().lower() if x is not None else '' for x in next(rows, [])]
+    missing = [x for x in REQUIRED_COLUMNS if x not in header]
+    if missing:
+        raise GradeSheetError('Missing column(s): %s.' % ', '.join(missing))
+    for row in rows:
+        if any(x not in (None, '') for x in row):
+            yield {name: value for name, value in zip(header, row) if name in COLUMNS}
+
+
+def _csv_rows(text):
+    reader = csv.reader(io.StringIO(text))
+    try:
+        yield from reader
+    except csv.Error as e:
+        raise GradeSheetError('The file is not a valid CSV sheet (line %d: %s).' % (reader.line_num, e))
+
+
+def _xlsx_rows(data):
+    try:
+        import openpyxl
+    except ImportError:
+        raise GradeSheetError('Reading .xlsx sheets requires openpyxl.')
+    try:
+        workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    except Exception:
+        raise GradeSheetError('The file is not a valid .xlsx workbook.')
+    return workbook.active.iter_rows(values_only=True)
+
+
+def _number(row, name, errors, default=None):
+    value = row.get(name)
+    if value in (None, ''):
+        if default is None:
+            errors.append('%s is required.' % name)
+        return default
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        errors.append('%s is not a number.' % name)
+        return None
+    if not math.isfinite(value):
+        errors.append('%s is not a number.' % name)
+        return None
+    return value
+
+
+def _carrier_id(value):
+    """The carrier id in a cell, which spreadsheets may hold as `9001.0`; None unless it is an integer."""
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        pass
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not value.is_integer():
+        # also rejects nan and infinity, which int() cannot convert
+        return None
+    return int(value)
+
+
+def validate_rows(course, rows):
+    """
+    Check every row and return `(grades, errors)`: the valid rows as
+    `(attend_id, title, value, base_value, out_of_twenty)` and a list of
+    `{'row': number, 'errors': [...]}`, numbered as in the sheet.
+    """
+    attends = dict(Attend.objects.filter(course=course).values_list('carrier', 'pk'))
+    grades, errors, seen = [], [], set()
+    for number, row in enumerate(rows, start=2):
+        row_errors = []
+        attend_id = None
+        carrier_id = _carrier_id(row.get('carrier'))
+        if carrier_id is None:
+            row_errors.append('carrier is not a carrier id.')
+        else:
+            attend_id = attends.get(carrier_id)
+            if attend_id is None:
+                row_errors.append('carrier %d does not attend this course.' % carrier_id)
+        title = str(row.get('title') or '').strip()
+        if not title:
+            row_errors.append('title is required.')
+        elif len(title) > Grade._meta.get_field('title').max_length:
+            row_errors.append('title is too long.')
+        value = _number(row, 'value', row_errors)
+        base_value = _number(row, 'base_value', row_errors, Grade._meta.get_field('base_value').default)
+        out_of_twenty = _number(row, 'out_of_twenty', row_errors, Grade._meta.get_field('out_of_twenty').default)
+        if base_value is not None and base_value <= 0:
+            row_errors.append('base_value must be positive.')
+        elif value is not None and base_value is not None and not 0 <= value <= base_value:
+            row_errors.append('value must be between 0 and base_value.')
+        if out_of_twenty is not None and not 0 <= out_of_twenty <= 20:
+            row_errors.append('out_of_twenty must be between 0 and 20.')
+        if attend_id is not None and title:
+            if (attend_id, title) in seen:
+                row_errors.append('duplicate of an earlier row.')
+            seen.add((attend_id, title))
+        if row_errors:
+            errors.append({'row': number, 'errors': row_errors})
+        else:
+            grades.append((attend_id, title, value, base_value, out_of_twenty))
+    return grades, errors
+
+
+def import_grades(course, rows, dry_run=False):
+    """
+    Validate and write the rows of a grade sheet of `course`. Nothing is
+    written when any row has an error or when `dry_run` is set.
+    """
+    grades, errors = validate_rows(course, rows)
+    report = {'rows': len(grades) + len(errors), 'created': 0, 'updated': 0, 'errors': errors}
+    if errors:
+        return report
+
+    existing = {(attend_id, title): pk for pk, attend_id, title in
+                Grade.objects.filter(attend__course=course).values_list('pk', 'attend', 'title')}
+    new = [Grade(attend_id=attend_id, title=title, value=value, base_value=base_value, out_of_twenty=out_of_twenty)
+           for attend_id, title, value, base_value, out_of_twenty in grades if (attend_id, title) not in existing]
+    changed = [(existing[(attend_id, title)], value, base_value, out_of_twenty)
+               for attend_id, title, value, base_value, out_of_twenty in grades if (attend_id, title) in existing]
+    report['created'], report['updated'] = len(new), len(changed)
+    if dry_run:
+        return report
+
+    with transaction.atomic():
+        Grade.objects.bulk_create(new)
+        for start in range(0, len(changed), UPDATE_BATCH_SIZE):
+            _update_grades(changed[start:start + UPDATE_BATCH_SIZE])
+        Attend.objects.filter(course=course).refresh_final_grades()
+    grades_imported.send(sender=Course, course=course)
+    return report
+
+
+def _update_grades(batch):
+    def column(index):
+        return Case(*[When(pk=x[0], then=Value(x[index])) for x in batch], output_field=FloatField())
+
+    Grade.objects.filter(pk__in=[x[0] for x in batch]).update(
+        value=column(1), base_value=column(2), out_of_twenty=column(3))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from users.models import Attend
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored final grade and grade state of every attend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', type=int, action='append', dest='terms',
+                            help='Only backfill attends of the given term id (repeatable).')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        attends = Attend.objects.all()
+        if options['terms']:
+            attends = attends.filter(course__term__pk__in=options['terms'])
+        pks = list(attends.order_by('pk').values_list('pk', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            with transaction.atomic():
+                Attend.objects.filter(pk__in=batch).refresh_final_grades()
+        self.stdout.write('Backfilled %d attends.' % len(pks))
@@ -0,0 +1,65 @@
+import random
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from rest_framework import serializers
+from users.models import *
+from users import models as user_models
+
+
+def linear_get_key(enum_class, key_value):
+    """`get_key` as it used to be: a scan of the enum's attributes on every call."""
+    name = next(name for name, value in vars(enum_class).items() if value == key_value)
+    return enum_class.conv(name)
+
+
+class LabelsSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Attend
+        fields = ['carrier_course_status', 'grade_status']
+
+
+class Command(BaseCommand):
+    help = 'Compare enum label lookups on a list serialization: linear scan, label tables and bulk labels.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(0)
+        rows = [Attend(status=rnd.choice(list(CourseApprovalState.values)), final_grade=20.0,
+                       grade_state_num=rnd.choice(list(GradeState.values))) for _ in range(options['rows'])]
+
+        def serialize():
+            return LabelsSerializer(rows, many=True).data
+
+        def linear():
+            with mock.patch.object(user_models, 'get_key', linear_get_key):
+                return serialize()
+
+        def bulk():
+            return list(zip(get_labels(CourseApprovalState, [x.status for x in rows]),
+                            get_labels(GradeState, [x.grade_state_num for x in rows])))
+
+        def lookups(get):
+            return [(get(CourseApprovalState, x.status), get(GradeState, x.grade_state_num)) for x in rows]
+
+        timings = [
+            ('serializer, linear scan', linear),
+            ('serializer, label table', serialize),
+            ('2 lookups/row, linear scan', lambda: lookups(linear_get_key)),
+            ('2 lookups/row, label table', lambda: lookups(get_key)),
+            ('2 columns, bulk get_labels', bulk),
+        ]
+        self.stdout.write('%d rows, best of %d' % (len(rows), options['repeat']))
+        for title, func in timings:
+            best = None
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                func()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write('%-30s %8.1f ms' % (title, best * 1000))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from users.grade_import import GradeSheetError, import_grades, read_sheet
+from users.models import Course
+
+
+class Command(BaseCommand):
+    help = 'Import the grade sheet (.csv or .xlsx) of a course; any row error rejects the whole sheet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', type=int, help='Course id.')
+        parser.add_argument('sheet', help='Path of the .csv or .xlsx sheet.')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the sheet.')
+
+    def handle(self, *args, **options):
+        try:
+            course = Course.objects.get(pk=options['course'])
+        except Course.DoesNotExist:
+            raise CommandError('Course %d does not exist.' % options['course'])
+        with open(options['sheet'], 'rb') as f:
+            data = f.read()
+        try:
+            report = import_grades(course, read_sheet(data, options['sheet']), dry_run=options['dry_run'])
+        except GradeSheetError as e:
+            raise CommandError(str(e))
+        for error in report['errors']:
+            self.stderr.write('Row %d: %s' % (error['row'], ' '.join(error['errors'])))
+        if report['errors']:
+            raise CommandError('%d of %d rows have errors, nothing was imported.'
+                               % (len(report['errors']), report['rows']))
+        self.stdout.write('%s %d grades, %s %d.' % (
+            'Would create' if options['dry_run'] else 'Created', report['created'],
+            'would update' if options['dry_run'] else 'updated', report['updated']))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from users.models import Term
+from users.rollups import rebuild_term, stale_terms
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the per-term carrier, field, department and college rollups read by the summary '
+            'endpoints, of every term or, with --incremental, of the terms that changed since.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', type=int, action='append', dest='terms',
+                            help='Only rebuild the given term id (repeatable).')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only rebuild the terms never rolled up or changed since their last rebuild.')
+
+    def handle(self, *args, **options):
+        if options['incremental']:
+            term_ids = stale_terms()
+        else:
+            term_ids = list(Term.objects.values_list('pk', flat=True))
+        if options['terms']:
+            term_ids = [x for x in term_ids if x in options['terms']]
+
+        started = time.time()
+        carriers = 0
+        for term_id in term_ids:
+            carriers += rebuild_term(term_id)
+        self.stdout.write('Rebuilt the rollups of %d terms (%d carrier rows) in %.1fs.' % (
+            len(term_ids), carriers, time.time() - started))
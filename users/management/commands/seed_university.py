@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from users.synthetic import PASSWORD, build_university
+
+
+class Command(BaseCommand):
+    help = ('Generate a deterministic synthetic university for load testing, '
+            'e.g. `seed_university --carriers 50000 --terms 4 --grades-per-attend 2` '
+            'for roughly 2M grades.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--colleges', type=int, default=4)
+        parser.add_argument('--departments-per-college', type=int, default=5)
+        parser.add_argument('--fields-per-department', type=int, default=3)
+        parser.add_argument('--field-courses-per-field', type=int, default=30)
+        parser.add_argument('--terms', type=int, default=4)
+        parser.add_argument('--carriers', type=int, default=5000)
+        parser.add_argument('--courses-per-term', type=int, default=5)
+        parser.add_argument('--grades-per-attend', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of carriers written per transaction.')
+
+    def handle(self, *args, **options):
+        started = time.time()
+
+        def progress(done, total):
+            self.stdout.write('%d/%d carriers (%.1fs)' % (done, total, time.time() - started))
+
+        carriers = build_university(
+            colleges=options['colleges'], departments_per_college=options['departments_per_college'],
+            fields_per_department=options['fields_per_department'],
+            field_courses_per_field=options['field_courses_per_field'], terms=options['terms'],
+            carriers=options['carriers'], courses_per_term=options['courses_per_term'],
+            grades_per_attend=options['grades_per_attend'], seed=options['seed'],
+            batch_size=options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            'Created %d carriers in %.1fs. Their users are named synthetic<id> with password %r.'
+            % (len(carriers), time.time() - started, PASSWORD)))
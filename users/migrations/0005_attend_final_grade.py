@@ -0,0 +1,25 @@
+# Generated by Django 2.1.10 on 2026-10-18 15:16
+
+from django.db import migrations, models
+import django_enumfield.db.fields
+import users.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_professor_nickname'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attend',
+            name='final_grade',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='attend',
+            name='grade_state_num',
+            field=django_enumfield.db.fields.EnumField(default=0, editable=False, enum=users.models.GradeState),
+        ),
+    ]
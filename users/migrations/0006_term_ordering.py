@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+def fill_ordering(apps, schema_editor):
+    Term = apps.get_model('users', 'Term')
+    for term in Term.objects.all():
+        term.academic_year = term.start_date.year
+        term.semester = 2 if term.start_date.month > term.end_date.month else 1
+        term.save(update_fields=['academic_year', 'semester'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_attend_final_grade'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='term',
+            name='academic_year',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='term',
+            name='semester',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_ordering, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='term',
+            options={'ordering': ['academic_year', 'semester']},
+        ),
+        migrations.AlterUniqueTogether(
+            name='term',
+            unique_together={('start_date', 'end_date'), ('academic_year', 'semester')},
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_enrolled_count(apps, schema_editor):
+    Attend = apps.get_model('users', 'Attend')
+    Course = apps.get_model('users', 'Course')
+    enrolled = Attend.objects.filter(course=OuterRef('pk'), deleted_by_carrier=False).values(
+        'course').annotate(total=Count('pk')).values('total')
+    Course.objects.update(enrolled_count=Coalesce(Subquery(enrolled, output_field=models.IntegerField()), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_term_ordering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='enrolled_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_enrolled_count, migrations.RunPython.noop),
+    ]
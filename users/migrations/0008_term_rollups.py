@@ -0,0 +1,105 @@
+# Generated by Django 2.1.10 on 2026-10-18 16:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_course_enrolled_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermCarrierRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('credits_taken', models.PositiveIntegerField(default=0)),
+                ('credits_passed', models.PositiveIntegerField(default=0)),
+                ('credits_weighted', models.PositiveIntegerField(default=0)),
+                ('grade_sum', models.FloatField(default=0.0)),
+                ('carrier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.Carrier')),
+                ('college', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.College')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.Department')),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.Field')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TermCollegeRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('credits_taken', models.PositiveIntegerField(default=0)),
+                ('credits_passed', models.PositiveIntegerField(default=0)),
+                ('credits_weighted', models.PositiveIntegerField(default=0)),
+                ('grade_sum', models.FloatField(default=0.0)),
+                ('college', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.College')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TermDepartmentRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('credits_taken', models.PositiveIntegerField(default=0)),
+                ('credits_passed', models.PositiveIntegerField(default=0)),
+                ('credits_weighted', models.PositiveIntegerField(default=0)),
+                ('grade_sum', models.FloatField(default=0.0)),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.Department')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TermFieldRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('credits_taken', models.PositiveIntegerField(default=0)),
+                ('credits_passed', models.PositiveIntegerField(default=0)),
+                ('credits_weighted', models.PositiveIntegerField(default=0)),
+                ('grade_sum', models.FloatField(default=0.0)),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.Field')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TermRollupState',
+            fields=[
+                ('term', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup_state', serialize=False, to='users.Term')),
+                ('dirty', models.BooleanField(default=True)),
+                ('built_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='termfieldrollup',
+            name='term',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.Term'),
+        ),
+        migrations.AddField(
+            model_name='termdepartmentrollup',
+            name='term',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.Term'),
+        ),
+        migrations.AddField(
+            model_name='termcollegerollup',
+            name='term',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.Term'),
+        ),
+        migrations.AddField(
+            model_name='termcarrierrollup',
+            name='term',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='users.Term'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='termfieldrollup',
+            unique_together={('term', 'field')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='termdepartmentrollup',
+            unique_together={('term', 'department')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='termcollegerollup',
+            unique_together={('term', 'college')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='termcarrierrollup',
+            unique_together={('term', 'carrier')},
+        ),
+    ]
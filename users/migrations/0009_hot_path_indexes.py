@@ -0,0 +1,33 @@
+# Generated by Django 2.1.10 on 2026-10-18 16:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_term_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attend',
+            index=models.Index(fields=['carrier', 'deleted_by_carrier', 'course'], name='attend_carrier_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attend',
+            index=models.Index(fields=['course', 'deleted_by_carrier', 'final_grade'], name='attend_course_grade_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['term', 'department'], name='course_term_department_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='grade',
+            index=models.Index(fields=['attend', 'title'], name='grade_attend_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='preliminaryregistration',
+            index=models.Index(fields=['carrier', 'term'], name='prereg_carrier_term_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+def create_states(apps, schema_editor):
+    Term = apps.get_model('users', 'Term')
+    TermRollupState = apps.get_model('users', 'TermRollupState')
+    TermRollupState.objects.bulk_create([
+        TermRollupState(term_id=term_id, dirty=True)
+        for term_id in Term.objects.filter(rollup_state__isnull=True).values_list('pk', flat=True)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0009_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_states, migrations.RunPython.noop),
+    ]
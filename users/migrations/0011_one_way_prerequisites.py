@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def remove_mirrored_prerequisites(apps, schema_editor):
+    """
+    While `FieldCourse.prerequisites` was symmetrical, adding a prerequisite
+    also stored the mirrored row. Django inserts the mirrored rows after the
+    ones added, so of every pair stored in both directions the row with the
+    higher id is dropped.
+    """
+    FieldCourse = apps.get_model('users', 'FieldCourse')
+    Prerequisite = FieldCourse.prerequisites.through
+    rows = {(row[1], row[2]): row[0] for row in Prerequisite.objects.values_list(
+        'pk', 'from_fieldcourse', 'to_fieldcourse')}
+    mirrored = [pk for (source, target), pk in rows.items()
+                if source != target and rows.get((target, source), pk) < pk]
+    for start in range(0, len(mirrored), 500):
+        Prerequisite.objects.filter(pk__in=mirrored[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0010_term_rollup_states'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_mirrored_prerequisites, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from users.utils import Round
+
+# the values of CourseGradesStatus.APPROVED and GradeState at the time of this migration
+APPROVED = 2
+NOT_DEFINED, PASSED, FAILED = 0, 1, 2
+
+
+def fill_final_grades(apps, schema_editor):
+    """`AttendQuerySet.refresh_final_grades` of every attend, on the historical models."""
+    Attend = apps.get_model('users', 'Attend')
+    Grade = apps.get_model('users', 'Grade')
+    grades_sum = Grade.objects.filter(attend=OuterRef('pk')).values('attend').annotate(
+        total=Sum(F('value') / F('base_value') * F('out_of_twenty'), output_field=FloatField())).values('total')
+    graded = Q(deleted_by_carrier=False, course__grades_status_num=APPROVED)
+    Attend.objects.filter(graded).update(final_grade=Round(
+        Coalesce(Subquery(grades_sum, output_field=FloatField()), Value(0.0)), Value(2)))
+    Attend.objects.exclude(graded).update(final_grade=None)
+    Attend.objects.update(grade_state_num=Case(
+        When(final_grade__isnull=True, then=Value(NOT_DEFINED)),
+        When(final_grade__gte=10, then=Value(PASSED)),
+        default=Value(FAILED)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0011_one_way_prerequisites'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_final_grades, migrations.RunPython.noop),
+    ]
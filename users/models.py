@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import (Avg, Case, Count, ExpressionWrapper, F, FloatField, Max, Min,
+                              OuterRef, Q, Subquery, Sum, Value, When)
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.utils.functional import cached_property
 from django_enumfield import enum
 from django_jalali.db import models as jmodels
 from .utils import *
@@ -92,7 +96,7 @@ class FieldCourse(models.Model):
     corequisites = models.ManyToManyField(
         'FieldCourse', blank=True, related_name='corequisite_for')
     prerequisites = models.ManyToManyField(
-        'FieldCourse', blank=True, related_name='prerequisite_for')
+        'FieldCourse', blank=True, symmetrical=False, related_name='prerequisite_for')
 
     serial_number = models.IntegerField(primary_key=True)
     title = models.CharField(max_length=255, blank=False)
@@ -184,6 +188,9 @@ class Term(models.Model):
     objects = jmodels.jManager()
     start_date = jmodels.jDateField(null=False, blank=False)
     end_date = jmodels.jDateField(null=False, blank=False)
+    # derived from the dates on save, they order terms and keep titles unique
+    academic_year = models.PositiveSmallIntegerField(editable=False)
+    semester = models.PositiveSmallIntegerField(editable=False)
 
     @property
     def title(self):
@@ -193,26 +200,30 @@ class Term(models.Model):
             return str(self.start_date.year) + " اول"
 
     class Meta:
-        unique_together = (("start_date", "end_date"))
+        unique_together = (("start_date", "end_date"), ("academic_year", "semester"))
+        ordering = ['academic_year', 'semester']
 
     def __str__(self):
         return self.title
 
-    def __init__(self, *args, **kwargs):
-        super(Term, self).__init__(* args, **kwargs)
-        if self.start_date is not None:
-            self.old_title = self.title
-        else:
-            self.old_title = " "
+    def derive_academic_year_and_semester(self):
+        self.academic_year = self.start_date.year
+        self.semester = 2 if self.start_date.month > self.end_date.month else 1
 
     def clean(self):
+        if self.start_date is None or self.end_date is None:
+            # reported by the field validation
+            return
+        # forms run clean() before save(), so derive them here too
+        self.derive_academic_year_and_semester()
         if (self.end_date < self.start_date) or (self.end_date.year - self.start_date.year > 1):
             raise ValidationError("Invalid Term interval!")
-        elif self.title != self.old_title and self.title in list(map(lambda x: x.title, Term.objects.all())):
+        elif Term.objects.filter(academic_year=self.academic_year, semester=self.semester).exclude(pk=self.pk).exists():
             raise ValidationError(
                 "A term with the title <%s> is already defined!" % self.title)
 
     def save(self, *args, **kwargs):
+        self.derive_academic_year_and_semester()
         self.full_clean()
         super(Term, self).save(*args, **kwargs)
 
@@ -235,7 +246,29 @@ class AdmissionType(enum.Enum):
         return ' '
 
 
+class CarrierQuerySet(models.QuerySet):
+
+    def with_academic_stats(self):
+        """
+        Annotate `academic_credits_taken`, `academic_credits_passed` and
+        `academic_average`, the SQL counterparts of `total_credits_taken`,
+        `total_credits_passed` and `average`.
+        """
+        credit = credit_expression('attend__course__')
+        graded = Q(attend__final_grade__isnull=False)
+        return self.annotate(
+            academic_credits_taken=Coalesce(
+                Sum(credit, filter=Q(attend__deleted_by_carrier=False)), Value(0)),
+            academic_credits_passed=Coalesce(
+                Sum(credit, filter=Q(attend__grade_state_num=GradeState.PASSED)), Value(0)),
+            academic_average=ExpressionWrapper(
+                Sum(ExpressionWrapper(credit * F('attend__final_grade'), output_field=FloatField()),
+                    filter=graded) / NullIf(Sum(credit, filter=graded), Value(0)),
+                output_field=FloatField()))
+
+
 class Carrier(models.Model):
+    objects = CarrierQuerySet.as_manager()
     login_profile = models.OneToOneField(
         UserLoginProfile, on_delete=models.CASCADE, related_name='carrier')
     student = models.ForeignKey(
@@ -251,42 +284,40 @@ class Carrier(models.Model):
 
     @property
     def total_credits_taken(self):
-        attends = Attend.objects.filter(
-            carrier=self).filter(deleted_by_carrier=False)
-        return sum(list(map(lambda x: x.course.field_course.credit, attends)))
+        attends = self.attend_set.filter(deleted_by_carrier=False)
+        return attends.aggregate(total=Coalesce(Sum(credit_expression('course__')), Value(0)))['total']
 
     @property
     def total_credits_passed(self):
-        attends = list(filter(lambda x: x.carrier == self and x.grade_status == get_key(
-            GradeState, GradeState.PASSED), Attend.objects.all()))
-        return sum(list(map(lambda x: x.course.field_course.credit, attends)))
+        attends = self.attend_set.filter(grade_state_num=GradeState.PASSED)
+        return attends.aggregate(total=Coalesce(Sum(credit_expression('course__')), Value(0)))['total']
 
     @property
     def average(self):
-        attends = list(filter(lambda x: x.carrier ==
-                              self and x.grade != None, Attend.objects.all()))
-        attends = list(map(lambda x: (x.course.field_course.credit,
-                                      x.grade * x.course.field_course.credit), attends))
-        total_credits = sum(list(map(lambda x: x[0], attends)))
-        if total_credits == 0:
+        totals = self.attend_set.filter(final_grade__isnull=False).aggregate(
+            credits=Sum(credit_expression('course__')),
+            weighted=Sum(ExpressionWrapper(credit_expression('course__') * F('final_grade'),
+                                           output_field=FloatField())))
+        if not totals['credits']:
             return None
-        return sum(list(map(lambda x: x[1], attends))) / total_credits
+        return totals['weighted'] / totals['credits']
+
+    @property
+    def term_queryset(self):
+        return Term.objects.filter(
+            Q(pk__in=self.registered_courses.values('term')) |
+            Q(pk__in=self.pre_reg_relations.values('term')))
 
     @property
     def terms(self):
-        carrier_terms = list(
-            map(lambda x: x.term, self.registered_courses.all()))
-        carrier_terms += list(map(lambda x: x.term,
-                                  self.pre_reg_relations.all()))
-        carrier_terms = list(set(carrier_terms))
-        carrier_terms.sort(key=lambda x: x.title)
-        return carrier_terms
+        return list(self.term_queryset)
 
     @property
     def entry_year(self):
-        if len(self.terms) == 0:
+        carrier_terms = self.terms
+        if len(carrier_terms) == 0:
             return None
-        return self.terms[0].start_date.year
+        return carrier_terms[0].start_date.year
 
     id = models.IntegerField(primary_key=True)
     status = enum.EnumField(CarrierStatusType, blank=False)
@@ -417,6 +448,22 @@ class CourseGradesStatus(enum.Enum):
         return ' '
 
 
+class CourseQuerySet(models.QuerySet):
+
+    def refresh_enrolled_counts(self):
+        """Recount the stored `enrolled_count` of these courses from their attends."""
+        enrolled = Attend.objects.filter(course=OuterRef('pk'), deleted_by_carrier=False).values(
+            'course').annotate(total=Count('pk')).values('total')
+        self.update(enrolled_count=Coalesce(Subquery(enrolled, output_field=models.IntegerField()), Value(0)))
+
+    def with_grade_stats(self):
+        """Annotate the SQL counterparts of `grades_average`, `min_grade` and `max_grade`."""
+        return self.annotate(
+            grades_average_value=Avg('attend_instances__final_grade'),
+            min_grade_value=Min('attend_instances__final_grade'),
+            max_grade_value=Max('attend_instances__final_grade'))
+
+
 class Course(models.Model):
     field_course = models.ForeignKey(
         FieldCourse, on_delete=models.CASCADE, related_name='courses')
@@ -434,6 +481,8 @@ class Course(models.Model):
         Term, on_delete=models.CASCADE, related_name='courses')
     grades_status_num = enum.EnumField(
         CourseGradesStatus, blank=False, null=False)
+    # denormalized from the attends, kept up to date by refresh_enrolled_counts()
+    enrolled_count = models.PositiveIntegerField(default=0, editable=False)
 
     @property
     def subfields_allowed_to_register(self):
@@ -451,7 +500,7 @@ class Course(models.Model):
 
     @property
     def professors_list(self):
-        relations = Teach.objects.filter(course__pk=self.pk)
+        relations = self.teach_set.all()
         prof_list = []
         for item in relations:
             prof_list += [{
@@ -466,40 +515,36 @@ class Course(models.Model):
             return True
         return False
 
+    @cached_property
+    def _grade_aggregates(self):
+        return self.attend_instances.aggregate(
+            average=Avg('final_grade'), min=Min('final_grade'), max=Max('final_grade'))
+
     @property
     def grades_average(self):
         if not self.are_grades_approved:
             return None
-        grades = list(map(lambda x: x.grade, self.attend_instances.all()))
-        grades = list(filter(lambda x: x != None, grades))
-        if len(grades) == 0:
+        average = self._grade_aggregates['average']
+        if average is None:
             return None
-        return round(sum(grades)/len(grades),2)
+        return round(average, 2)
 
     @property
     def min_grade(self):
         if not self.are_grades_approved:
             return None
-        grades = list(map(lambda x: x.grade, self.attend_instances.all()))
-        grades = list(filter(lambda x: x != None, grades))
-        if len(grades) == 0:
-            return None
-        return min(grades)
+        return self._grade_aggregates['min']
 
     @property
     def max_grade(self):
         if not self.are_grades_approved:
             return None
-        grades = list(map(lambda x: x.grade, self.attend_instances.all()))
-        grades = list(filter(lambda x: x != None, grades))
-        if len(grades) == 0:
-            return None
-        return max(grades)
+        return self._grade_aggregates['max']
 
     @property
     def grades_status(self):
         return get_key(CourseGradesStatus, self.grades_status_num)
-    objects = jmodels.jManager()
+    objects = jmodels.jManager.from_queryset(CourseQuerySet)()
     midterm_exam_date = models.ForeignKey(
         ExamDate, on_delete=models.CASCADE, related_name='midterm_exams', null=True, blank=True)
     final_exam_date = models.ForeignKey(
@@ -530,15 +575,32 @@ class Course(models.Model):
 
     @property
     def number_of_students_registered(self):
-        temp = self.attend_instances.filter(deleted_by_carrier=False)
-        return len(temp)
+        return self.enrolled_count
 
     class Meta:
         unique_together = (("field_course", "term", "section_number"))
+        indexes = [
+            # courses_schedule and the per-term catalogue, timetable and analytics queries
+            models.Index(fields=['term', 'department'], name='course_term_department_idx'),
+        ]
 
     def __str__(self):
         return str(self.field_course)+" | گروه "+str(self.section_number)
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            old_status = None
+            if self.pk is not None:
+                old_status = Course.objects.filter(pk=self.pk).values_list(
+                    'grades_status_num', flat=True).first()
+            # read by the post_save receivers
+            self.grades_status_changed = old_status is not None and old_status != self.grades_status_num
+            if self.grades_status_changed:
+                # stored first, so the attends are refreshed before the post_save receivers run
+                Course.objects.filter(pk=self.pk).update(grades_status_num=self.grades_status_num)
+                self.attend_instances.all().refresh_final_grades()
+            super(Course, self).save(*args, **kwargs)
+
 
 class DayTimeCourseRelation(models.Model):
     day_time = models.ForeignKey(DayTime, on_delete=models.CASCADE)
@@ -570,6 +632,11 @@ class PreliminaryRegistration(models.Model):
     carrier = models.ForeignKey(
         Carrier, on_delete=models.CASCADE, related_name="pre_reg_relations")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['carrier', 'term'], name='prereg_carrier_term_idx'),
+        ]
+
     def __str__(self):
         return "Preregistration of [ "+str(self.carrier)+" ] in [ "+str(self.field_course)+" ]"
 
@@ -601,12 +668,39 @@ class GradeState(enum.Enum):
         return ' '
 
 
+class AttendQuerySet(models.QuerySet):
+
+    def refresh_final_grades(self):
+        """Recompute the stored `final_grade` and `grade_state_num` of these attends."""
+        grades_sum = Grade.objects.filter(attend=OuterRef('pk')).values('attend').annotate(
+            total=Sum(F('value') / F('base_value') * F('out_of_twenty'), output_field=FloatField())).values('total')
+        graded = Q(deleted_by_carrier=False, course__grades_status_num=CourseGradesStatus.APPROVED)
+        self.filter(graded).update(final_grade=Round(
+            Coalesce(Subquery(grades_sum, output_field=FloatField()), Value(0.0)), Value(2)))
+        self.exclude(graded).update(final_grade=None)
+        self.update(grade_state_num=Case(
+            When(final_grade__isnull=True, then=Value(GradeState.NOT_DEFINED)),
+            When(final_grade__gte=10, then=Value(GradeState.PASSED)),
+            default=Value(GradeState.FAILED)))
+
+    def with_course_type(self):
+        """Annotate the number behind `course_type_for_carrier` as `course_type_num_for_carrier`."""
+        relations = FieldCourseSubfieldRelation.objects.filter(
+            subfield=OuterRef('carrier__subfield'), field_course=OuterRef('course__field_course'))
+        return self.annotate(course_type_num_for_carrier=Subquery(relations.values('course_type_num')[:1]))
+
+
 class Attend(models.Model):
+    objects = AttendQuerySet.as_manager()
     course = models.ForeignKey(
         Course, on_delete=models.CASCADE, related_name="attend_instances")
     carrier = models.ForeignKey(Carrier, on_delete=models.CASCADE)
     status = enum.EnumField(CourseApprovalState, null=False, blank=False)
     deleted_by_carrier = models.BooleanField(default=False)
+    # denormalized from the grades, kept up to date by refresh_final_grades()
+    final_grade = models.FloatField(null=True, blank=True, editable=False)
+    grade_state_num = enum.EnumField(
+        GradeState, null=False, blank=False, default=GradeState.NOT_DEFINED, editable=False)
 
     @property
     def carrier_course_status(self):
@@ -620,26 +714,17 @@ class Attend(models.Model):
 
     @property
     def grade_status(self):
-        if self.deleted_by_carrier:
-            return None
-        if not self.course.are_grades_approved:
+        if self.final_grade is None:
             return None
-        if self.grade == None:
-            return get_key(GradeState, GradeState.NOT_DEFINED)
-        elif self.grade >= 10:
-            return get_key(GradeState, GradeState.PASSED)
-        return get_key(GradeState, GradeState.FAILED)
+        return get_key(GradeState, self.grade_state_num)
 
     @property
     def grade(self):
-        if self.deleted_by_carrier:
-            return None
-        if not self.course.are_grades_approved:
-            return None
-        sum = 0.0
-        for item in self.grades.all():
-            sum += (item.value / item.base_value) * item.out_of_twenty
-        return round(sum,2)
+        return self.final_grade
+
+    def refresh_final_grade(self):
+        Attend.objects.filter(pk=self.pk).refresh_final_grades()
+        self.refresh_from_db(fields=['final_grade', 'grade_state_num'])
 
     @property
     def course_type_for_carrier(self):
@@ -651,10 +736,20 @@ class Attend(models.Model):
 
     class Meta:
         unique_together = (("course", "carrier"))
+        indexes = [
+            # a carrier's attends, with the columns to join their courses and skip removed ones
+            models.Index(fields=['carrier', 'deleted_by_carrier', 'course'], name='attend_carrier_deleted_idx'),
+            # enrolled counts and grade statistics of a course, read from the index alone
+            models.Index(fields=['course', 'deleted_by_carrier', 'final_grade'], name='attend_course_grade_idx'),
+        ]
 
     def __str__(self):
         return "[ "+str(self.carrier) + " ] attends [ " + str(self.course) + " ]"
 
+    def save(self, *args, **kwargs):
+        super(Attend, self).save(*args, **kwargs)
+        self.refresh_final_grade()
+
 
 class Grade(models.Model):
     objects = jmodels.jManager()
@@ -667,6 +762,12 @@ class Grade(models.Model):
     attend = models.ForeignKey(
         Attend, on_delete=models.CASCADE, related_name="grades")
 
+    class Meta:
+        indexes = [
+            # the grades of an attend, and the (attend, title) lookups of grade_import
+            models.Index(fields=['attend', 'title'], name='grade_attend_title_idx'),
+        ]
+
     @property
     def percentage(self):
         return self.out_of_twenty*100/20.0
@@ -681,3 +782,63 @@ class Grade(models.Model):
 
     def __str__(self):
         return "Grade for: "+str(self.attend)+" | Title :"+str(self.title)
+
+
+class TermRollupState(models.Model):
+    """Whether the rollups of a term are up to date; the signals mark them dirty."""
+    term = models.OneToOneField(Term, on_delete=models.CASCADE, primary_key=True, related_name='rollup_state')
+    dirty = models.BooleanField(default=True)
+    built_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return "Rollups of [ "+str(self.term)+" ]"+(" (dirty)" if self.dirty else "")
+
+
+class TermRollup(models.Model):
+    """Credits and grade sums of a term, precomputed from the attends by `users.rollups`."""
+    term = models.ForeignKey(Term, on_delete=models.CASCADE, related_name='+')
+    credits_taken = models.PositiveIntegerField(default=0)
+    credits_passed = models.PositiveIntegerField(default=0)
+    # credits of the graded attends, i.e. those considered in the average
+    credits_weighted = models.PositiveIntegerField(default=0)
+    # sum of credit * final grade of the graded attends
+    grade_sum = models.FloatField(default=0.0)
+
+    class Meta:
+        abstract = True
+
+
+class TermCarrierRollup(TermRollup):
+    carrier = models.ForeignKey(Carrier, on_delete=models.CASCADE, related_name='+')
+    # the carrier's field, department and college when the rollup was built
+    field = models.ForeignKey(Field, on_delete=models.CASCADE, related_name='+')
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='+')
+    college = models.ForeignKey(College, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = (("term", "carrier"))
+
+
+class TermFieldRollup(TermRollup):
+    field = models.ForeignKey(Field, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = (("term", "field"))
+
+
+class TermDepartmentRollup(TermRollup):
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = (("term", "department"))
+
+
+class TermCollegeRollup(TermRollup):
+    college = models.ForeignKey(College, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = (("term", "college"))
+
+
+register_labels(DegreeType, FieldCourseType, CarrierStatusType, AdmissionType, GenderTypeAllowed,
+                Day, CourseGradesStatus, CourseApprovalState, GradeState)
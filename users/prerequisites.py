@@ -0,0 +1,113 @@
+"""
+The prerequisite and corequisite graph of the field courses.
+
+`course_graph()` loads both relations in a single query and keeps the graph
+once per process; transitive closures are memoized on it. Like
+`users.catalogue`, each process drops its copy through `m2m_changed` and
+delete signals, and the time-to-live bounds how long another process may
+keep a stale one.
+"""
+import heapq
+import time
+
+from django.db.models import IntegerField, Value
+from .models import *
+
+GRAPH_TTL = 60
+
+PREREQUISITE = 0
+COREQUISITE = 1
+
+_graph = None
+_graph_loaded_at = 0.0
+
+
+class CourseGraph(object):
+
+    def __init__(self, edges):
+        """`edges` are `(kind, course, required course)` triples."""
+        self.prerequisites = {}
+        self.corequisites = {}
+        for kind, course_id, required_id in edges:
+            if kind == PREREQUISITE:
+                self.prerequisites.setdefault(course_id, set()).add(required_id)
+            else:
+                self.corequisites.setdefault(course_id, set()).add(required_id)
+                self.corequisites.setdefault(required_id, set()).add(course_id)
+        self._closures = {}
+        self.order, self.cyclic = self._sort()
+        self._rank = {x: i for i, x in enumerate(self.order)}
+
+    @classmethod
+    def load(cls):
+        prerequisites = FieldCourse.prerequisites.through.objects.annotate(
+            kind=Value(PREREQUISITE, output_field=IntegerField())).values_list(
+            'kind', 'from_fieldcourse', 'to_fieldcourse')
+        corequisites = FieldCourse.corequisites.through.objects.annotate(
+            kind=Value(COREQUISITE, output_field=IntegerField())).values_list(
+            'kind', 'from_fieldcourse', 'to_fieldcourse')
+        return cls(prerequisites.union(corequisites, all=True))
+
+    def _sort(self):
+        """
+        Kahn's algorithm, smallest serial number first among the ready
+        courses. Courses on a cycle are left out of the order.
+        """
+        nodes = set(self.prerequisites)
+        for required in self.prerequisites.values():
+            nodes |= required
+        missing = {x: len(self.prerequisites.get(x, ())) for x in nodes}
+        required_by = {}
+        for course_id, required in self.prerequisites.items():
+            for required_id in required:
+                required_by.setdefault(required_id, []).append(course_id)
+        ready = [x for x, count in missing.items() if count == 0]
+        heapq.heapify(ready)
+        order = []
+        while ready:
+            course_id = heapq.heappop(ready)
+            order.append(course_id)
+            for dependant in required_by.get(course_id, ()):
+                missing[dependant] -= 1
+                if missing[dependant] == 0:
+                    heapq.heappush(ready, dependant)
+        return order, frozenset(nodes - set(order))
+
+    def closure(self, course_id):
+        """Every direct and indirect prerequisite of a course."""
+        closure = self._closures.get(course_id)
+        if closure is None:
+            seen = set()
+            stack = list(self.prerequisites.get(course_id, ()))
+            while stack:
+                required_id = stack.pop()
+                if required_id not in seen:
+                    seen.add(required_id)
+                    stack.extend(self.prerequisites.get(required_id, ()))
+            seen.discard(course_id)
+            closure = self._closures[course_id] = frozenset(seen)
+        return closure
+
+    def topological_order(self, course_ids):
+        """The given courses with every prerequisite before the courses requiring it."""
+        last = len(self._rank)
+        return sorted(course_ids, key=lambda x: (self._rank.get(x, last if x in self.cyclic else -1), x))
+
+    def missing_prerequisites(self, course_id, passed):
+        """The direct prerequisites of a course not in the `passed` set."""
+        return sorted(self.prerequisites.get(course_id, set()) - passed)
+
+
+def course_graph():
+    """The cached `CourseGraph`."""
+    global _graph, _graph_loaded_at
+    graph = _graph
+    if graph is None or time.monotonic() - _graph_loaded_at > GRAPH_TTL:
+        graph = CourseGraph.load()
+        _graph, _graph_loaded_at = graph, time.monotonic()
+    return graph
+
+
+def invalidate_course_graph():
+    global _graph
+    _graph = None
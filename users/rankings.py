@@ -0,0 +1,150 @@
+"""
+Term GPA ranks and percentiles of carriers within their field, department
+and college.
+
+The GPA of every carrier of a term comes from one grouped query. A
+`TermRanking` keeps them in sorted arrays per field, department and college,
+so a carrier's rank is a binary search. Rankings are kept in the cache; when
+grades change, only the affected carriers are queried again and moved
+within the arrays instead of rebuilding the whole term, once the change
+commits. An update holds a lock in the cache while it reads, changes and
+writes back a ranking; an update finding the lock taken drops the ranking
+instead, so the next read rebuilds it rather than keep one of the two
+changes only. The rankings, and the lock, are only shared between processes
+with a shared cache backend (see `settings.SHARED_CACHE`).
+"""
+import bisect
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Sum
+from .models import *
+from .utils import credit_expression
+
+RANKING_KEY = 'users:term_ranking:%s'
+LOCK_KEY = 'users:term_ranking_lock:%s'
+# a new token from every update finding the lock taken
+CONTENTION_KEY = 'users:term_ranking_contention:%s'
+LOCK_TIMEOUT = 30
+
+SCOPES = ('field', 'department', 'college')
+
+
+def carrier_gpas(term_id, carriers=None):
+    """
+    `(carrier, gpa, field, department, college)` of the carriers with a
+    graded attend in the term, optionally only of the given carrier ids.
+    """
+    credit = credit_expression('course__')
+    attends = Attend.objects.filter(course__term__pk=term_id, final_grade__isnull=False)
+    if carriers is not None:
+        attends = attends.filter(carrier__in=carriers)
+    rows = attends.values(
+        'carrier', 'carrier__subfield__field', 'carrier__subfield__field__head_department',
+        'carrier__subfield__field__head_department__college').annotate(
+        credits=Sum(credit),
+        weighted=Sum(ExpressionWrapper(credit * F('final_grade'), output_field=FloatField()))).order_by()
+    return [(row['carrier'], row['weighted'] / row['credits'], row['carrier__subfield__field'],
+             row['carrier__subfield__field__head_department'],
+             row['carrier__subfield__field__head_department__college'])
+            for row in rows if row['credits']]
+
+
+class TermRanking(object):
+
+    def __init__(self, term_id, rows):
+        self.term_id = term_id
+        self.carriers = {}
+        self.groups = {}
+        for row in rows:
+            self._add(row)
+
+    def _add(self, row):
+        carrier_id, gpa, scopes = row[0], row[1], row[2:]
+        self.carriers[carrier_id] = (gpa,) + scopes
+        for scope, group_id in zip(SCOPES, scopes):
+            bisect.insort(self.groups.setdefault((scope, group_id), []), gpa)
+
+    def _remove(self, carrier_id):
+        entry = self.carriers.pop(carrier_id, None)
+        if entry is None:
+            return
+        gpa, scopes = entry[0], entry[1:]
+        for scope, group_id in zip(SCOPES, scopes):
+            gpas = self.groups[(scope, group_id)]
+            del gpas[bisect.bisect_left(gpas, gpa)]
+            if not gpas:
+                del self.groups[(scope, group_id)]
+
+    def update(self, carrier_ids, rows):
+        """Replace the entries of the given carriers by their freshly queried `rows`."""
+        for carrier_id in carrier_ids:
+            self._remove(carrier_id)
+        for row in rows:
+            self._remove(row[0])
+            self._add(row)
+
+    def rank(self, carrier_id):
+        """
+        The carrier's GPA, and per scope its rank (ties share the better
+        rank), the group size and the percentage of the group at or below
+        its GPA. None when the carrier has no graded course in the term.
+        """
+        entry = self.carriers.get(carrier_id)
+        if entry is None:
+            return None
+        gpa, scopes = entry[0], entry[1:]
+        ranking = {'gpa': round(gpa, 2)}
+        for scope, group_id in zip(SCOPES, scopes):
+            gpas = self.groups[(scope, group_id)]
+            ranking[scope] = {
+                'id': group_id,
+                'rank': len(gpas) - bisect.bisect_right(gpas, gpa) + 1,
+                'size': len(gpas),
+                'percentile': round(bisect.bisect_right(gpas, gpa) * 100.0 / len(gpas), 2),
+            }
+        return ranking
+
+
+def term_ranking(term_id):
+    """The cached `TermRanking` of a term."""
+    key = RANKING_KEY % term_id
+    ranking = cache.get(key)
+    if ranking is None:
+        ranking = TermRanking(term_id, carrier_gpas(term_id))
+        cache.set(key, ranking, settings.TERM_RANKING_TIMEOUT)
+    return ranking
+
+
+def _update_term_ranking(term_id, carriers):
+    key, contention_key = RANKING_KEY % term_id, CONTENTION_KEY % term_id
+    # read before taking the lock, so that every update contending for it is
+    # seen; an evicted token reads as None and counts as a change too
+    contention = cache.get(contention_key)
+    if not cache.add(LOCK_KEY % term_id, True, LOCK_TIMEOUT):
+        cache.set(contention_key, uuid.uuid4().hex, None)
+        cache.delete(key)
+        return
+    try:
+        ranking = cache.get(key)
+        if ranking is None:
+            return
+        carrier_ids = list(carriers)
+        ranking.update(carrier_ids, carrier_gpas(term_id, carrier_ids))
+        cache.set(key, ranking, settings.TERM_RANKING_TIMEOUT)
+        if cache.get(contention_key) != contention:
+            # an update was dropped meanwhile and this ranking misses it
+            cache.delete(key)
+    finally:
+        cache.delete(LOCK_KEY % term_id)
+
+
+def update_term_ranking(term_id, carriers):
+    """
+    Recompute the given carriers (ids or a queryset of ids) in the cached
+    ranking of a term, if there is one, when the current transaction
+    commits. Until then other requests read the committed grades anyway.
+    """
+    transaction.on_commit(lambda: _update_term_ranking(term_id, carriers))
@@ -0,0 +1,144 @@
+"""
+Precomputed per-term totals of every carrier, field, department and college.
+
+`rebuild_term` derives the `TermCarrierRollup` rows of a term from one
+grouped query over its attends, sums them up into the field, department and
+college rows, and marks the term clean in `TermRollupState`. The signals mark
+a term dirty again whenever one of its attends or grades, the credits of
+its courses or the subfield of one of its carriers changes, and the
+readers below only use the rollups of clean terms, so the summaries never
+show stale figures; they fall back to the attends until the next
+`manage.py rebuild_rollups` (e.g. nightly, with `--incremental`).
+"""
+from django.db import transaction
+from django.db.models import Exists, ExpressionWrapper, F, FloatField, IntegerField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .models import *
+from .utils import credit_expression
+
+BATCH_SIZE = 500
+
+CARRIER = 0
+FIELD = 1
+DEPARTMENT = 2
+COLLEGE = 3
+
+TOTALS = ('credits_taken', 'credits_passed', 'credits_weighted', 'grade_sum')
+
+
+def carrier_totals(term_id):
+    """The `TermCarrierRollup` figures of every carrier attending the term, as dicts."""
+    credit = credit_expression('course__')
+    graded = Q(final_grade__isnull=False)
+
+    def credits_sum(condition):
+        return Coalesce(Sum(credit, filter=condition), Value(0))
+
+    return Attend.objects.filter(course__term__pk=term_id).values(
+        'carrier', 'carrier__subfield__field', 'carrier__subfield__field__head_department',
+        'carrier__subfield__field__head_department__college').annotate(
+        credits_taken=credits_sum(Q(deleted_by_carrier=False)),
+        credits_passed=credits_sum(Q(grade_state_num=GradeState.PASSED)),
+        credits_weighted=credits_sum(graded),
+        grade_sum=Coalesce(Sum(ExpressionWrapper(credit * F('final_grade'), output_field=FloatField()),
+                               filter=graded), Value(0.0))).order_by()
+
+
+def rebuild_term(term_id):
+    """Recompute the rollups of a term; returns the number of carriers."""
+    # every term gets its state row when created; this only covers bulk-created ones
+    TermRollupState.objects.get_or_create(term_id=term_id)
+    with transaction.atomic():
+        # Marked clean before reading. The row stays locked until the rebuild
+        # commits, so a change marking the term dirty meanwhile waits for it
+        # and marks it dirty again afterwards.
+        TermRollupState.objects.filter(term__pk=term_id).update(dirty=False, built_at=timezone.now())
+        carriers = []
+        groups = {FIELD: {}, DEPARTMENT: {}, COLLEGE: {}}
+        for row in carrier_totals(term_id):
+            totals = {name: row[name] for name in TOTALS}
+            carriers.append(TermCarrierRollup(
+                term_id=term_id, carrier_id=row['carrier'], field_id=row['carrier__subfield__field'],
+                department_id=row['carrier__subfield__field__head_department'],
+                college_id=row['carrier__subfield__field__head_department__college'], **totals))
+            for kind, key in ((FIELD, 'carrier__subfield__field'),
+                              (DEPARTMENT, 'carrier__subfield__field__head_department'),
+                              (COLLEGE, 'carrier__subfield__field__head_department__college')):
+                summed = groups[kind].setdefault(row[key], dict.fromkeys(TOTALS, 0))
+                for name in TOTALS:
+                    summed[name] += totals[name]
+
+        for model in (TermCarrierRollup, TermFieldRollup, TermDepartmentRollup, TermCollegeRollup):
+            model.objects.filter(term__pk=term_id).delete()
+        TermCarrierRollup.objects.bulk_create(carriers, batch_size=BATCH_SIZE)
+        TermFieldRollup.objects.bulk_create(
+            [TermFieldRollup(term_id=term_id, field_id=x, **totals) for x, totals in groups[FIELD].items()],
+            batch_size=BATCH_SIZE)
+        TermDepartmentRollup.objects.bulk_create(
+            [TermDepartmentRollup(term_id=term_id, department_id=x, **totals)
+             for x, totals in groups[DEPARTMENT].items()], batch_size=BATCH_SIZE)
+        TermCollegeRollup.objects.bulk_create(
+            [TermCollegeRollup(term_id=term_id, college_id=x, **totals) for x, totals in groups[COLLEGE].items()],
+            batch_size=BATCH_SIZE)
+    return len(carriers)
+
+
+def stale_terms():
+    """Ids of the terms never rolled up or marked dirty since."""
+    return list(Term.objects.exclude(rollup_state__dirty=False).values_list('pk', flat=True))
+
+
+def mark_terms_dirty(terms):
+    """
+    Flag the rollups of the given terms (ids or a queryset) as out of date.
+    Rows already dirty are updated too: locking them is what orders this
+    change after a rebuild running concurrently.
+    """
+    TermRollupState.objects.filter(term__in=terms).update(dirty=True)
+
+
+def is_rolled_up(term):
+    """Whether the rollups of a term loaded with `select_related('rollup_state')` are up to date."""
+    try:
+        return not term.rollup_state.dirty
+    except TermRollupState.DoesNotExist:
+        return False
+
+
+def is_term_rolled_up(term_id):
+    """An expression telling whether the rollups of a term are up to date, to annotate a query with."""
+    return Exists(TermRollupState.objects.filter(term__pk=term_id, dirty=False))
+
+
+def term_summary_from_rollups(carrier, term_id, scope):
+    """
+    `aggregates.term_summary` read from the rollups of a clean term in one
+    query, `scope` holding the ids of the carrier's field, department and
+    college.
+    """
+    def rows(model, kind, **key):
+        return model.objects.filter(term__pk=term_id, **key).annotate(
+            kind=Value(kind, output_field=IntegerField())).values_list(
+            'kind', 'credits_taken', 'credits_passed', 'credits_weighted', 'grade_sum')
+
+    totals = {row[0]: row[1:] for row in rows(TermCarrierRollup, CARRIER, carrier=carrier).union(
+        rows(TermFieldRollup, FIELD, field=scope['subfield__field']),
+        rows(TermDepartmentRollup, DEPARTMENT, department=scope['subfield__field__head_department']),
+        rows(TermCollegeRollup, COLLEGE, college=scope['subfield__field__head_department__college']), all=True)}
+
+    def average(kind):
+        credits, grade_sum = totals.get(kind, (0, 0, 0, 0.0))[2:]
+        if not credits:
+            return None
+        return round(grade_sum / credits, 2)
+
+    taken, passed = totals.get(CARRIER, (0, 0))[:2]
+    return {
+        'total_credits_taken': taken,
+        'total_credits_passed': passed,
+        'carrier_average': average(CARRIER),
+        'field_average': average(FIELD),
+        'department_average': average(DEPARTMENT),
+        'college_average': average(COLLEGE),
+    }
@@ -0,0 +1,170 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import Signal, receiver
+from .catalogue import invalidate_term_catalogue
+from .course_stats import invalidate_course_stats
+from .prerequisites import invalidate_course_graph
+from .rankings import update_term_ranking
+from .rollups import mark_terms_dirty
+from .timetable import invalidate_timetables
+from .models import *
+
+# sent after grade_import wrote a sheet, whose bulk writes skip the model signals
+grades_imported = Signal(providing_args=['course'])
+
+
+@receiver(post_save, sender=Attend)
+@receiver(post_delete, sender=Attend)
+def refresh_course_enrolled_count(sender, instance, **kwargs):
+    # enrollment.enroll counts the seat it takes itself
+    if not getattr(instance, 'seat_counted', False):
+        Course.objects.filter(pk=instance.course_id).refresh_enrolled_counts()
+
+
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+def refresh_attend_final_grade(sender, instance, **kwargs):
+    Attend.objects.filter(pk=instance.attend_id).refresh_final_grades()
+
+
+@receiver(post_save, sender=Term)
+@receiver(post_delete, sender=Term)
+def invalidate_terms(sender, **kwargs):
+    invalidate_term_catalogue()
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+@receiver(post_save, sender=DayTimeCourseRelation)
+@receiver(post_delete, sender=DayTimeCourseRelation)
+@receiver(post_save, sender=DayTime)
+@receiver(post_delete, sender=DayTime)
+@receiver(post_save, sender=DayRange)
+@receiver(post_delete, sender=DayRange)
+@receiver(post_save, sender=ExamDate)
+@receiver(post_delete, sender=ExamDate)
+def invalidate_schedules(sender, **kwargs):
+    invalidate_timetables()
+
+
+@receiver(m2m_changed, sender=FieldCourse.prerequisites.through)
+@receiver(m2m_changed, sender=FieldCourse.corequisites.through)
+@receiver(post_delete, sender=FieldCourse)
+def invalidate_prerequisites(sender, **kwargs):
+    invalidate_course_graph()
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_stats_of_course(sender, instance, **kwargs):
+    invalidate_course_stats(instance.pk)
+
+
+@receiver(post_save, sender=Attend)
+@receiver(post_delete, sender=Attend)
+def invalidate_stats_of_attend(sender, instance, **kwargs):
+    invalidate_course_stats(instance.course_id)
+
+
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+def invalidate_stats_of_grade(sender, instance, **kwargs):
+    course_id = Attend.objects.filter(pk=instance.attend_id).values_list('course', flat=True).first()
+    if course_id is not None:
+        invalidate_course_stats(course_id)
+
+
+@receiver(grades_imported)
+def invalidate_stats_of_import(sender, course, **kwargs):
+    invalidate_course_stats(course.pk)
+
+
+def update_ranking_of_carriers_of(course):
+    update_term_ranking(course.term_id, Attend.objects.filter(course=course).values_list('carrier', flat=True))
+
+
+@receiver(post_save, sender=Course)
+def update_ranking_of_course(sender, instance, **kwargs):
+    # the stored grades of the attends only change with the grades status
+    if getattr(instance, 'grades_status_changed', False):
+        update_ranking_of_carriers_of(instance)
+
+
+@receiver(post_save, sender=Attend)
+@receiver(post_delete, sender=Attend)
+def update_ranking_of_attend(sender, instance, **kwargs):
+    term_id = Course.objects.filter(pk=instance.course_id).values_list('term', flat=True).first()
+    if term_id is not None:
+        update_term_ranking(term_id, [instance.carrier_id])
+
+
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+def update_ranking_of_grade(sender, instance, **kwargs):
+    attend = Attend.objects.filter(pk=instance.attend_id).values_list('carrier', 'course__term').first()
+    if attend is not None:
+        update_term_ranking(attend[1], [attend[0]])
+
+
+@receiver(grades_imported)
+def update_ranking_of_import(sender, course, **kwargs):
+    update_ranking_of_carriers_of(course)
+
+
+@receiver(post_save, sender=Course)
+def mark_rollups_of_course(sender, instance, **kwargs):
+    mark_terms_dirty([instance.term_id])
+
+
+@receiver(post_save, sender=Attend)
+@receiver(post_delete, sender=Attend)
+def mark_rollups_of_attend(sender, instance, **kwargs):
+    mark_terms_dirty(Course.objects.filter(pk=instance.course_id).values('term'))
+
+
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+def mark_rollups_of_grade(sender, instance, **kwargs):
+    mark_terms_dirty(Attend.objects.filter(pk=instance.attend_id).values('course__term'))
+
+
+@receiver(grades_imported)
+def mark_rollups_of_import(sender, course, **kwargs):
+    mark_terms_dirty([course.term_id])
+
+
+@receiver(post_save, sender=Carrier)
+def mark_rollups_of_carrier(sender, instance, **kwargs):
+    # the rollups keep the carrier's field, department and college as of the rebuild
+    mark_terms_dirty(Attend.objects.filter(carrier=instance).values('course__term'))
+
+
+@receiver(post_save, sender=Subfield)
+def mark_rollups_of_subfield(sender, instance, **kwargs):
+    mark_terms_dirty(Attend.objects.filter(carrier__subfield=instance).values('course__term'))
+
+
+@receiver(post_save, sender=Field)
+def mark_rollups_of_field(sender, instance, **kwargs):
+    mark_terms_dirty(Attend.objects.filter(carrier__subfield__field=instance).values('course__term'))
+
+
+@receiver(post_save, sender=Department)
+def mark_rollups_of_department(sender, instance, **kwargs):
+    mark_terms_dirty(Attend.objects.filter(
+        carrier__subfield__field__head_department=instance).values('course__term'))
+
+
+@receiver(post_save, sender=Credit)
+def mark_rollups_of_credit(sender, instance, **kwargs):
+    mark_terms_dirty(Course.objects.filter(field_course__credit_detail=instance).values('term'))
+
+
+@receiver(post_save, sender=FieldCourse)
+def mark_rollups_of_field_course(sender, instance, **kwargs):
+    mark_terms_dirty(Course.objects.filter(field_course=instance).values('term'))
+
+
+@receiver(post_save, sender=Term)
+def create_rollup_state(sender, instance, created, **kwargs):
+    if created:
+        TermRollupState.objects.get_or_create(term=instance)
@@ -0,0 +1,226 @@
+"""
+Deterministic synthetic universities for tests and load testing.
+
+Everything is written with `bulk_create`, so the usual `save()` hooks and
+signals are skipped; the stored attend grades and course enrollment counts
+are refreshed in bulk instead.
+"""
+import datetime
+import random
+
+import jdatetime
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from .models import *
+
+PASSWORD = 'synthetic-password'
+
+CREDITS = ((0, 1), (0, 2), (0, 3), (1, 0), (1, 1), (1, 2), (1, 3))
+DAY_RANGES = ((7, 30, 9, 0), (9, 0, 10, 30), (10, 30, 12, 0), (13, 30, 15, 0), (15, 0, 16, 30))
+GRADE_TITLES = ('Midterm', 'Final', 'Project', 'Homework', 'Quiz', 'Lab')
+
+
+class IdAllocator(object):
+    """Hand out primary keys ahead of `bulk_create`, which does not return them on SQLite."""
+
+    def __init__(self, model):
+        self.next_id = (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def __call__(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+
+def build_university(colleges=2, departments_per_college=3, fields_per_department=2,
+                     field_courses_per_field=8, terms=3, carriers=1000, courses_per_term=5,
+                     grades_per_attend=3, seed=0, batch_size=1000, progress=None):
+    """
+    Generate a university and return the created carriers' ids. The most
+    recent term has its grades not yet sent and is open for preliminary
+    registration, every older term is approved.
+
+    Carriers are written `batch_size` at a time, each batch in its own
+    transaction; `progress(done, total)` is called after every batch.
+    """
+    rnd = random.Random(seed)
+
+    credits = [Credit.objects.get_or_create(practical_units=p, theoritical_units=t)[0] for p, t in CREDITS]
+    day_ranges = [DayRange.objects.get_or_create(start=datetime.time(start_h, start_m),
+                                                 end=datetime.time(end_h, end_m))[0]
+                  for start_h, start_m, end_h, end_m in DAY_RANGES]
+    day_times = [DayTime.objects.get_or_create(day_range=day_range, day=day)[0]
+                 for day_range in day_ranges for day in range(Day.FRIDAY)]
+
+    term_objects = []
+    year = 1390 + (Term.objects.count() + 1) // 2
+    for i in range(terms):
+        if i % 2 == 0:
+            start, end = jdatetime.date(year, 7, 1), jdatetime.date(year, 10, 30)
+        else:
+            start, end = jdatetime.date(year, 11, 1), jdatetime.date(year + 1, 3, 30)
+            year += 1
+        term_objects.append(Term.objects.get_or_create(start_date=start, end_date=end)[0])
+
+    exam_dates = {}
+    for term in term_objects:
+        midterm_day = term.start_date + jdatetime.timedelta(days=50)
+        final_day = term.end_date + jdatetime.timedelta(days=3)
+        exam_dates[term.pk] = (
+            [ExamDate.objects.get_or_create(day=midterm_day + jdatetime.timedelta(days=d), day_range=x)[0]
+             for d in range(5) for x in day_ranges],
+            [ExamDate.objects.get_or_create(day=final_day + jdatetime.timedelta(days=d), day_range=x)[0]
+             for d in range(10) for x in day_ranges])
+
+    college_ids = IdAllocator(College)
+    department_ids = IdAllocator(Department)
+    field_ids = IdAllocator(Field)
+    subfield_ids = IdAllocator(Subfield)
+    serial_numbers = IdAllocator(FieldCourse)
+    course_ids = IdAllocator(Course)
+    room_ids = IdAllocator(Room)
+    professor_ids = IdAllocator(Professor)
+
+    college_list, department_list, field_list, subfield_list = [], [], [], []
+    field_course_list, relation_list, room_list, professor_list = [], [], [], []
+    prerequisite_list, corequisite_list = [], []
+    field_of = {}
+    for c in range(colleges):
+        college = College(id=college_ids(), title='College %d' % c)
+        college_list.append(college)
+        room_list += [Room(id=room_ids(), title=str(100 + r), place=college.title) for r in range(5)]
+        for d in range(departments_per_college):
+            department = Department(id=department_ids(), title='Department %d' % d, college=college)
+            department_list.append(department)
+            professor_list += [Professor(id=professor_ids(), first_name='Professor', last_name='%d-%d' % (d, p))
+                               for p in range(4)]
+            for f in range(fields_per_department):
+                field = Field(id=field_ids(), head_department=department, title='Field %d' % f,
+                              degree=rnd.choice(list(DegreeType.values)))
+                field_list.append(field)
+                subfields = [Subfield(id=subfield_ids(), field=field, title='Subfield %d' % s) for s in range(2)]
+                subfield_list += subfields
+                field_courses = []
+                for k in range(field_courses_per_field):
+                    field_course = FieldCourse(serial_number=serial_numbers(), title='Course %d' % k,
+                                               credit_detail=rnd.choice(credits))
+                    # prerequisites only point at earlier courses of the field, so the graph stays acyclic
+                    for required in rnd.sample(field_courses, min(len(field_courses), rnd.choice((0, 1, 1, 2)))):
+                        prerequisite_list.append(FieldCourse.prerequisites.through(
+                            from_fieldcourse_id=field_course.serial_number,
+                            to_fieldcourse_id=required.serial_number))
+                    if field_courses and rnd.random() < 0.1:
+                        corequisite_list.append(FieldCourse.corequisites.through(
+                            from_fieldcourse_id=field_course.serial_number,
+                            to_fieldcourse_id=field_courses[-1].serial_number))
+                    field_courses.append(field_course)
+                    field_course_list.append(field_course)
+                    field_of[field_course.serial_number] = field
+                    relation_list += [FieldCourseSubfieldRelation(
+                        field_course=field_course, subfield=subfield, suggested_term=k // 2 + 1,
+                        course_type_num=rnd.choice(list(FieldCourseType.values))) for subfield in subfields]
+
+    with transaction.atomic():
+        _build_catalogue(college_list, room_list, department_list, professor_list, field_list,
+                         subfield_list, field_course_list, relation_list, prerequisite_list, corequisite_list)
+
+    courses_by_field = {}
+    course_list, teach_list, schedule_list = [], [], []
+    for index, term in enumerate(term_objects):
+        status = CourseGradesStatus.APPROVED if index < len(term_objects) - 1 else CourseGradesStatus.NOT_SENT
+        midterms, finals = exam_dates[term.pk]
+        for field_course in field_course_list:
+            field = field_of[field_course.serial_number]
+            for section in range(1, rnd.choice((1, 1, 2)) + 1):
+                course = Course(id=course_ids(), field_course=field_course, department=field.head_department,
+                                term=term, grades_status_num=status, section_number=section,
+                                capacity=rnd.choice((30, 40, 60)), students_gender=GenderTypeAllowed.BOTH,
+                                room=rnd.choice(room_list), midterm_exam_date=rnd.choice(midterms),
+                                final_exam_date=rnd.choice(finals))
+                course_list.append(course)
+                courses_by_field.setdefault((term.pk, field.pk), []).append(course)
+                teach_list.append(Teach(course=course, professor=rnd.choice(professor_list), percentage=100))
+                schedule_list += [DayTimeCourseRelation(course=course, day_time=day_time)
+                                  for day_time in rnd.sample(day_times, 2)]
+    with transaction.atomic():
+        Course.objects.bulk_create(course_list)
+        Teach.objects.bulk_create(teach_list)
+        DayTimeCourseRelation.objects.bulk_create(schedule_list)
+
+    password = make_password(PASSWORD)
+    user_ids = IdAllocator(User)
+    profile_ids = IdAllocator(UserLoginProfile)
+    student_ids = IdAllocator(Student)
+    carrier_ids = IdAllocator(Carrier)
+    attend_ids = IdAllocator(Attend)
+    field_courses_of = {}
+    for field_course in field_course_list:
+        field_courses_of.setdefault(field_of[field_course.serial_number].pk, []).append(field_course)
+
+    created = []
+    for start in range(0, carriers, batch_size):
+        users, profiles, students, carrier_list, attends, grades, pre_registrations = [], [], [], [], [], [], []
+        for i in range(start, min(start + batch_size, carriers)):
+            user_id = user_ids()
+            user = User(id=user_id, username='synthetic%d' % user_id, password=password)
+            profile = UserLoginProfile(id=profile_ids(), user_id=user_id)
+            student = Student(id=student_ids(), first_name='Student', last_name=str(i))
+            subfield = rnd.choice(subfield_list)
+            carrier = Carrier(id=carrier_ids(), login_profile_id=profile.pk, student_id=student.pk,
+                              subfield_id=subfield.pk, status=CarrierStatusType.STUDYING,
+                              admission_type_num=rnd.choice(list(AdmissionType.values)))
+            users.append(user)
+            profiles.append(profile)
+            students.append(student)
+            carrier_list.append(carrier)
+            for term in term_objects:
+                sections = courses_by_field[(term.pk, subfield.field_id)]
+                taken = set()
+                for course in rnd.sample(sections, min(courses_per_term, len(sections))):
+                    if course.field_course_id in taken:
+                        continue
+                    taken.add(course.field_course_id)
+                    attend = Attend(id=attend_ids(), course_id=course.pk, carrier_id=carrier.pk,
+                                    status=CourseApprovalState.APPROVED, deleted_by_carrier=rnd.random() < 0.05)
+                    attends.append(attend)
+                    weights = [rnd.choice((2.0, 3.0, 5.0)) for _ in range(grades_per_attend)]
+                    for title, weight in zip(GRADE_TITLES, weights):
+                        grades.append(Grade(attend_id=attend.pk, title=title, base_value=20.0,
+                                            value=round(min(20.0, max(0.0, rnd.gauss(14, 4))), 2),
+                                            out_of_twenty=20.0 * weight / sum(weights)))
+            field_courses = field_courses_of[subfield.field_id]
+            pre_registrations += [PreliminaryRegistration(term_id=term_objects[-1].pk, field_course_id=x.pk,
+                                                          carrier_id=carrier.pk)
+                                  for x in rnd.sample(field_courses, min(courses_per_term, len(field_courses)))]
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            UserLoginProfile.objects.bulk_create(profiles)
+            Student.objects.bulk_create(students)
+            Carrier.objects.bulk_create(carrier_list)
+            Attend.objects.bulk_create(attends)
+            Grade.objects.bulk_create(grades)
+            PreliminaryRegistration.objects.bulk_create(pre_registrations)
+            if attends:
+                Attend.objects.filter(pk__gte=attends[0].pk, pk__lte=attends[-1].pk).refresh_final_grades()
+        created += [x.pk for x in carrier_list]
+        if progress:
+            progress(len(created), carriers)
+
+    if course_list:
+        Course.objects.filter(pk__gte=course_list[0].pk, pk__lte=course_list[-1].pk).refresh_enrolled_counts()
+
+    # explicit primary keys leave Postgres sequences behind
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [
+                College, Room, Department, Professor, Field, Subfield, Course, User,
+                UserLoginProfile, Student, Attend]):
+            cursor.execute(sql)
+    return created
+
+
+def _build_catalogue(*object_lists):
+    for objects in object_lists:
+        if objects:
+            type(objects[0]).objects.bulk_create(objects)
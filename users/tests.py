@@ -1,3 +1,173 @@
-from django.test import TestCase
+import datetime
+from importlib import import_module
 
-# Create your tests here.
+import jdatetime
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models.signals import post_save
+from django.forms import ModelForm
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from .models import *
+
+
+class AttendFinalGradeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        term = Term.objects.create(start_date=jdatetime.date(1397, 7, 1), end_date=jdatetime.date(1397, 10, 30))
+        department = Department.objects.create(title='Computer', college=College.objects.create(title='Engineering'))
+        subfield = Subfield.objects.create(title='Software', field=Field.objects.create(
+            head_department=department, title='Computer Engineering', degree=DegreeType.KARSHENASI))
+        field_course = FieldCourse.objects.create(
+            serial_number=1, title='Algorithms',
+            credit_detail=Credit.objects.create(practical_units=0, theoritical_units=3))
+        cls.course = Course.objects.create(
+            field_course=field_course, department=department, term=term,
+            grades_status_num=CourseGradesStatus.SENT, section_number=1, capacity=10,
+            students_gender=GenderTypeAllowed.BOTH, room=Room.objects.create(title='101', place='A'))
+        cls.carrier = Carrier.objects.create(
+            id=1, login_profile=UserLoginProfile.objects.create(user=User.objects.create_user('student')),
+            student=Student.objects.create(first_name='Sara', last_name='Karimi'), subfield=subfield,
+            status=CarrierStatusType.STUDYING, admission_type_num=AdmissionType.ROOZANEH)
+
+    def setUp(self):
+        self.attend = Attend.objects.create(course=self.course, carrier=self.carrier,
+                                            status=CourseApprovalState.APPROVED)
+
+    def approve(self):
+        self.course.grades_status_num = CourseGradesStatus.APPROVED
+        self.course.save()
+        self.attend.refresh_from_db()
+
+    def test_grade_is_hidden_until_course_is_approved(self):
+        Grade.objects.create(attend=self.attend, value=15, base_value=20, out_of_twenty=20)
+        self.attend.refresh_from_db()
+        self.assertIsNone(self.attend.grade)
+        self.assertIsNone(self.attend.grade_status)
+        self.approve()
+        self.assertEqual(self.attend.grade, 15.0)
+        self.assertEqual(self.attend.grade_status, get_key(GradeState, GradeState.PASSED))
+
+    def test_grade_follows_grade_rows(self):
+        self.approve()
+        self.assertEqual(self.attend.grade, 0.0)
+        midterm = Grade.objects.create(attend=self.attend, value=8, base_value=10, out_of_twenty=5)
+        Grade.objects.create(attend=self.attend, value=9, base_value=20, out_of_twenty=15)
+        self.attend.refresh_from_db()
+        self.assertEqual(self.attend.grade, 10.75)
+        midterm.delete()
+        self.attend.refresh_from_db()
+        self.assertEqual(self.attend.grade, 6.75)
+        self.assertEqual(self.attend.grade_status, get_key(GradeState, GradeState.FAILED))
+
+    def test_removed_attend_has_no_grade(self):
+        self.approve()
+        self.attend.deleted_by_carrier = True
+        self.attend.save()
+        self.assertIsNone(self.attend.grade)
+
+    def test_post_save_receivers_see_the_refreshed_grades(self):
+        Grade.objects.create(attend=self.attend, value=15, base_value=20, out_of_twenty=20)
+        seen = []
+
+        def receiver(instance, **kwargs):
+            seen.append(Attend.objects.get(pk=self.attend.pk).final_grade)
+
+        post_save.connect(receiver, sender=Course)
+        try:
+            self.approve()
+        finally:
+            post_save.disconnect(receiver, sender=Course)
+        self.assertEqual(seen, [15.0])
+
+    def test_migration_backfills_final_grades(self):
+        Grade.objects.create(attend=self.attend, value=15, base_value=20, out_of_twenty=20)
+        Course.objects.filter(pk=self.course.pk).update(grades_status_num=CourseGradesStatus.APPROVED)
+        Attend.objects.update(final_grade=None, grade_state_num=GradeState.NOT_DEFINED)
+        import_module('users.migrations.0012_backfill_final_grades').fill_final_grades(apps, None)
+        self.attend.refresh_from_db()
+        self.assertEqual(self.attend.final_grade, 15.0)
+        self.assertEqual(self.attend.grade_state_num, GradeState.PASSED)
+
+
+class LabelTests(SimpleTestCase):
+
+    def test_tables_of_registered_enums(self):
+        table = label_table(GradeState)
+        self.assertEqual(dict(table), {GradeState.NOT_DEFINED: 'تعیین نشده', GradeState.PASSED: 'قبول',
+                                       GradeState.FAILED: 'مردود'})
+        self.assertIs(label_table(GradeState), table)
+        with self.assertRaises(TypeError):
+            table[GradeState.PASSED] = 'passed'
+        self.assertEqual(get_key(GradeState, GradeState.PASSED), 'قبول')
+
+    def test_unregistered_enum_and_unknown_value(self):
+        class Shift(enum.Enum):
+            DAY = 0
+            NIGHT = 1
+
+            def conv(name):
+                return name.lower()
+
+        self.assertEqual(get_key(Shift, Shift.NIGHT), 'night')
+        self.assertEqual(get_labels(Shift, [Shift.DAY, None, Shift.NIGHT]), ['day', None, 'night'])
+        with self.assertRaises(KeyError):
+            get_key(GradeState, 7)
+        with self.assertRaises(KeyError):
+            get_labels(Shift, [2])
+
+
+class TermTests(TestCase):
+
+    def test_terms_are_ordered_by_academic_year_and_semester(self):
+        second = Term.objects.create(start_date=jdatetime.date(1397, 11, 1), end_date=jdatetime.date(1398, 3, 30))
+        first = Term.objects.create(start_date=jdatetime.date(1397, 7, 1), end_date=jdatetime.date(1397, 10, 30))
+        later = Term.objects.create(start_date=jdatetime.date(1398, 7, 1), end_date=jdatetime.date(1398, 10, 30))
+        self.assertEqual(list(Term.objects.all()), [first, second, later])
+        self.assertEqual((second.academic_year, second.semester), (1397, 2))
+
+    def test_duplicate_title_is_rejected(self):
+        term = Term.objects.create(start_date=jdatetime.date(1397, 7, 1), end_date=jdatetime.date(1397, 10, 30))
+        term.end_date = jdatetime.date(1397, 10, 29)
+        term.save()
+        with self.assertRaises(ValidationError):
+            Term.objects.create(start_date=jdatetime.date(1397, 7, 2), end_date=jdatetime.date(1397, 10, 30))
+
+
+class TermFormTests(TestCase):
+
+    class TermForm(ModelForm):
+        class Meta:
+            model = Term
+            fields = ['start_date', 'end_date']
+
+    def test_duplicate_title_is_a_form_error(self):
+        Term.objects.create(start_date=jdatetime.date(1397, 7, 1), end_date=jdatetime.date(1397, 10, 30))
+        form = self.TermForm(data={'start_date': '1397-07-02', 'end_date': '1397-10-30'})
+        self.assertFalse(form.is_valid())
+        self.assertIn('already defined', str(form.errors))
+
+    def test_new_term_is_saved(self):
+        form = self.TermForm(data={'start_date': '1397-11-01', 'end_date': '1398-03-30'})
+        self.assertTrue(form.is_valid(), form.errors)
+        term = form.save()
+        self.assertEqual((term.academic_year, term.semester), (1397, 2))
+
+
+class SqliteConnectionTests(TransactionTestCase):
+
+    def test_connections_are_tuned_and_transactions_begin_immediate(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.DATABASES['default']['OPTIONS']['timeout'] * 1000)
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                Term.objects.exists()
+        self.assertEqual(queries[0]['sql'], 'BEGIN %s' % connection.settings_dict['TRANSACTION_MODE'])
@@ -0,0 +1,135 @@
+"""
+Weekly class and exam clashes between the courses of a term.
+
+`term_timetable()` loads a term's schedule in two queries and indexes it
+once per process: the class slots of every weekday and the exams of every
+date are swept in start order, which yields all overlapping course pairs.
+Checking a plan is then a handful of set lookups. Like `users.catalogue`,
+each process drops its copy through model signals, and the time-to-live
+bounds how long another process may keep a stale one.
+"""
+import itertools
+import time
+
+from .models import *
+from .utils import get_key
+
+TIMETABLE_TTL = 60
+
+_timetables = {}
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def _clock(minutes):
+    return '%02d:%02d' % divmod(minutes, 60)
+
+
+def _overlapping_pairs(intervals):
+    """Every pair of overlapping `(start, end, course_id)` intervals."""
+    pairs = set()
+    active = []
+    for start, end, course_id in sorted(intervals):
+        active = [x for x in active if x[0] > start]
+        pairs.update((min(course_id, x[1]), max(course_id, x[1])) for x in active if x[1] != course_id)
+        active.append((end, course_id))
+    return pairs
+
+
+class TermTimetable(object):
+
+    def __init__(self, term_id):
+        self.term_id = term_id
+        self.titles = {}
+        self.sections = {}
+        self.slots = {}
+        self.exams = {}
+        courses = Course.objects.filter(term__pk=term_id).values_list(
+            'pk', 'field_course', 'field_course__title', 'section_number',
+            'midterm_exam_date__day', 'midterm_exam_date__day_range__start', 'midterm_exam_date__day_range__end',
+            'final_exam_date__day', 'final_exam_date__day_range__start', 'final_exam_date__day_range__end')
+        for row in courses:
+            course_id, field_course_id = row[0], row[1]
+            self.titles[course_id] = '%s | گروه %d' % (row[2], row[3])
+            self.sections.setdefault(field_course_id, []).append(course_id)
+            self.slots[course_id] = []
+            self.exams[course_id] = [(kind, day, _minutes(start), _minutes(end))
+                                     for kind, day, start, end in (('midterm',) + row[4:7], ('final',) + row[7:10])
+                                     if day is not None]
+        schedule = DayTimeCourseRelation.objects.filter(course__term__pk=term_id).values_list(
+            'course', 'day_time__day', 'day_time__day_range__start', 'day_time__day_range__end')
+        for course_id, day, start, end in schedule:
+            self.slots[course_id].append((day, _minutes(start), _minutes(end)))
+
+        by_day, by_date = {}, {}
+        for course_id, slots in self.slots.items():
+            for day, start, end in slots:
+                by_day.setdefault(day, []).append((start, end, course_id))
+        for course_id, exams in self.exams.items():
+            for kind, day, start, end in exams:
+                by_date.setdefault(day, []).append((start, end, course_id))
+        self.weekly_clashes = set()
+        for intervals in by_day.values():
+            self.weekly_clashes |= _overlapping_pairs(intervals)
+        self.exam_clashes = set()
+        for intervals in by_date.values():
+            self.exam_clashes |= _overlapping_pairs(intervals)
+
+    def pair_clashes(self, first, second):
+        """The weekly and exam overlaps of two courses of the term."""
+        pair = (min(first, second), max(first, second))
+        clashes = []
+        if pair in self.weekly_clashes:
+            for (day, start, end), (other_day, other_start, other_end) in itertools.product(
+                    self.slots[first], self.slots[second]):
+                if day == other_day and start < other_end and other_start < end:
+                    clashes.append({'type': 'weekly', 'day': get_key(Day, day),
+                                    'start': _clock(max(start, other_start)), 'end': _clock(min(end, other_end))})
+        if pair in self.exam_clashes:
+            for (kind, day, start, end), (other_kind, other_day, other_start, other_end) in itertools.product(
+                    self.exams[first], self.exams[second]):
+                if day == other_day and start < other_end and other_start < end:
+                    clashes.append({'type': 'exam', 'exams': [kind, other_kind], 'day': str(day),
+                                    'start': _clock(max(start, other_start)), 'end': _clock(min(end, other_end))})
+        return clashes
+
+    def clashes(self, course_ids):
+        """Every clash between two of the given courses."""
+        course_ids = sorted(set(x for x in course_ids if x in self.slots))
+        results = []
+        for first, second in itertools.combinations(course_ids, 2):
+            details = self.pair_clashes(first, second)
+            if details:
+                results.append({'courses': [first, second],
+                                'titles': [self.titles[first], self.titles[second]], 'clashes': details})
+        return results
+
+    def field_course_clashes(self, field_course_ids):
+        """
+        The clashes between field courses, planned without choosing a
+        section: a pair clashes when every pairing of their sections does.
+        """
+        field_course_ids = sorted(set(x for x in field_course_ids if x in self.sections))
+        results = []
+        for first, second in itertools.combinations(field_course_ids, 2):
+            pairings = [(a, b, self.pair_clashes(a, b)) for a in self.sections[first] for b in self.sections[second]]
+            if all(details for a, b, details in pairings):
+                a, b, details = pairings[0]
+                results.append({'courses': [a, b], 'titles': [self.titles[a], self.titles[b]],
+                                'clashes': details})
+        return results
+
+
+def term_timetable(term_id):
+    """The cached `TermTimetable` of a term."""
+    cached = _timetables.get(term_id)
+    if cached is None or time.monotonic() - cached[1] > TIMETABLE_TTL:
+        cached = (TermTimetable(term_id), time.monotonic())
+        _timetables[term_id] = cached
+    return cached[0]
+
+
+def invalidate_timetables():
+    _timetables.clear()
@@ -1,8 +1,33 @@
+from types import MappingProxyType
+
 from django.core.exceptions import ValidationError
+from django.db.models import F, FloatField, Func
+
+_LABEL_TABLES = {}
+
+
+def register_labels(*enum_classes):
+    """Build the immutable value -> label table of each enum once, at import time."""
+    for enum_class in enum_classes:
+        _LABEL_TABLES[enum_class] = MappingProxyType(
+            {value: enum_class.conv(item.name) for value, item in enum_class.values.items()})
+
+
+def label_table(enum_class):
+    if enum_class not in _LABEL_TABLES:
+        register_labels(enum_class)
+    return _LABEL_TABLES[enum_class]
+
 
 def get_key(enum_class, key_value):
-    name = next(name for name, value in vars(enum_class).items() if value == key_value)
-    return enum_class.conv(name)
+    return label_table(enum_class)[key_value]
+
+
+def get_labels(enum_class, key_values):
+    """Labels of many values of the same enum, e.g. a column of a list serializer; None stays None."""
+    table = label_table(enum_class)
+    return [None if x is None else table[x] for x in key_values]
+
 
 def validate_image_size(value):
     filesize= value.size
@@ -10,3 +35,30 @@ def validate_image_size(value):
         raise ValidationError("The maximum image size that can be uploaded is 1MB")
     else:
         return value
+
+
+class Round(Func):
+    function = 'ROUND'
+    arity = 2
+    output_field = FloatField()
+
+
+class NullIf(Func):
+    function = 'NULLIF'
+    arity = 2
+
+
+def credit_expression(prefix=''):
+    """Credit of a course, i.e. `FieldCourse.credit`, as an SQL expression."""
+    return (F(prefix + 'field_course__credit_detail__practical_units') +
+            F(prefix + 'field_course__credit_detail__theoritical_units'))
+
+
+def annotation_or_property(instance, annotation, prop):
+    """
+    Read a value annotated on the queryset when present, falling back to the
+    (usually more expensive) model property otherwise.
+    """
+    if hasattr(instance, annotation):
+        return getattr(instance, annotation)
+    return getattr(instance, prop)